@@ -0,0 +1,71 @@
+"""Compare the memory held by chat histories stored as dicts and as ChatMessage records.
+
+Builds `--sessions` histories of `--messages` messages each both ways and
+reports the bytes allocated per message, measured with tracemalloc. Message
+contents are created before measuring, so the figures are the per-message
+overhead the representation adds on top of the text. Dict messages carry the
+`token_count` key the context window adds to every message it has counted.
+
+From `backend`:
+    python -m benchmarks.history_memory --sessions 20000 --messages 20
+"""
+
+import argparse
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.providers.messages import ChatMessage  # noqa: E402
+
+
+def _role(turn):
+    return "user" if turn % 2 == 0 else "assistant"
+
+
+def _dict_histories(contents):
+    return [
+        [{"role": _role(turn), "content": content, "token_count": 50} for turn, content in enumerate(history)]
+        for history in contents
+    ]
+
+
+def _compact_histories(contents):
+    return [
+        [ChatMessage(_role(turn), content, 50) for turn, content in enumerate(history)]
+        for history in contents
+    ]
+
+
+def _measure(build, contents):
+    gc.collect()
+    tracemalloc.start()
+    histories = build(contents)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del histories
+    return allocated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--message-chars", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    contents = [
+        [f"{session}:{turn}:".ljust(args.message_chars, "x") for turn in range(args.messages)]
+        for session in range(args.sessions)
+    ]
+    total = args.sessions * args.messages
+    results = {"dict": _measure(_dict_histories, contents), "ChatMessage": _measure(_compact_histories, contents)}
+    for name, allocated in results.items():
+        print(f"{name:>11}: {allocated / total:6.1f} bytes/message overhead, {allocated / 2 ** 20:8.1f} MiB for {total} messages")
+    print(f"saved: {(results['dict'] - results['ChatMessage']) / 2 ** 20:.1f} MiB ({1 - results['ChatMessage'] / results['dict']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Load test the chat API against a local stub LLM backend.
+
+Starts the app with uvicorn on a loopback port, routes provider "stub" to
+benchmarks.stub_provider.StubProvider and authenticates with locally minted
+HS256 tokens, so no LLM API or Supabase project is contacted. Each scenario
+is driven at every concurrency level and reports throughput, error rate and
+p50/p95/p99 latency (plus time to first line for streams).
+
+From `backend`:
+    python -m benchmarks.load_test --concurrency 1,8,32 --requests 200
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+BENCH_JWT_SECRET = "benchmark-secret-for-local-load-tests-only"
+
+SCENARIOS = ("chat", "stream", "history")
+
+
+def _configure_environment(args):
+    # Settings are read at import time, so these must be set before the app loads.
+    os.environ["SUPABASE_JWT_SECRET"] = args.jwt_secret
+    os.environ["PERSIST_MESSAGES"] = "false"
+    os.environ.setdefault("FASTAPI_DEBUG", "false")
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def _stub_options(args):
+    return {
+        "ttft": args.ttft,
+        "tokens_per_second": args.tokens_per_second,
+        "reply_tokens": args.reply_tokens,
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "seed": args.seed,
+    }
+
+
+def _install_stub_provider(options):
+    from benchmarks.stub_provider import StubProvider
+    from src.providers.llm_providers import register_provider
+
+    register_provider("stub", lambda api_key, model: StubProvider(api_key, model, **options))
+
+
+def _mint_token(secret, user_id, ttl=3600):
+    import jwt
+
+    now = int(time.time())
+    claims = {"sub": user_id, "aud": "authenticated", "role": "authenticated", "iat": now, "exp": now + ttl}
+    return jwt.encode(claims, secret, algorithm="HS256")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(port):
+    import uvicorn
+    from src.app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            raise RuntimeError("Benchmark server failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not samples:
+        return None
+    rank = max(math.ceil(pct / 100.0 * len(samples)), 1)
+    return samples[min(rank, len(samples)) - 1]
+
+
+class VirtualUser:
+    def __init__(self, index, secret):
+        self.user_id = f"00000000-0000-4000-8000-{index:012d}"
+        self.session_id = f"bench-{index}"
+        self.headers = {"Authorization": f"Bearer {_mint_token(secret, self.user_id)}"}
+
+
+async def _configure(client, user, model):
+    response = await client.post(
+        "/api/configure",
+        json={"provider": "stub", "api_key": "stub-key", "model": model, "session_id": user.session_id},
+        headers=user.headers,
+    )
+    response.raise_for_status()
+
+
+async def _chat(client, user, index):
+    response = await client.post(
+        "/api/chat",
+        json={"message": f"Benchmark message {index}", "session_id": user.session_id},
+        headers=user.headers,
+    )
+    response.raise_for_status()
+    return None
+
+
+async def _stream(client, user, index):
+    started = time.perf_counter()
+    first_line = None
+    async with client.stream(
+        "POST",
+        "/api/chat/stream",
+        json={"message": f"Benchmark message {index}", "session_id": user.session_id},
+        headers=user.headers,
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            if first_line is None:
+                first_line = time.perf_counter() - started
+            payload = json.loads(line)
+            if "error" in payload:
+                raise RuntimeError(payload["error"])
+    return first_line
+
+
+async def _history(client, user, index):
+    response = await client.get(
+        "/api/history",
+        params={"session_id": user.session_id, "limit": 50},
+        headers=user.headers,
+    )
+    response.raise_for_status()
+    return None
+
+
+SCENARIO_CALLS = {"chat": _chat, "stream": _stream, "history": _history}
+
+
+async def run_level(client, scenario, users, concurrency, total):
+    call = SCENARIO_CALLS[scenario]
+    counter = itertools.count()
+    latencies = []
+    first_lines = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while (index := next(counter)) < total:
+            user = users[index % len(users)]
+            started = time.perf_counter()
+            try:
+                first_line = await call(client, user, index)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            if first_line is not None:
+                first_lines.append(first_line)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    first_lines.sort()
+    result = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+    }
+    for pct in (50, 95, 99):
+        result[f"p{pct}_ms"] = _ms(percentile(latencies, pct))
+    if first_lines:
+        result["ttft_p50_ms"] = _ms(percentile(first_lines, 50))
+        result["ttft_p95_ms"] = _ms(percentile(first_lines, 95))
+    return result
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+async def run_benchmark(args, base_url):
+    import httpx
+
+    users = [VirtualUser(index, args.jwt_secret) for index in range(args.users)]
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 8, max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        await asyncio.gather(*(_configure(client, user, args.model) for user in users))
+        results = []
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                result = await run_level(client, scenario, users, concurrency, args.requests)
+                _print_result(result)
+                results.append(result)
+    return results
+
+
+_COLUMNS = ("scenario", "concurrency", "requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "ttft_p50_ms")
+
+
+def _print_header():
+    print(" ".join(f"{column:>14}" for column in _COLUMNS))
+
+
+def _print_result(result):
+    cells = []
+    for column in _COLUMNS:
+        value = result.get(column)
+        if isinstance(value, float):
+            value = f"{value:.2f}"
+        cells.append(f"{'-' if value is None else value:>14}")
+    print(" ".join(cells), flush=True)
+
+
+def _csv(cast):
+    return lambda value: [cast(part) for part in value.split(",") if part]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", type=_csv(str), default=list(SCENARIOS), help="Comma-separated: chat,stream,history")
+    parser.add_argument("--concurrency", type=_csv(int), default=[1, 8, 32], help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario and concurrency level")
+    parser.add_argument("--users", type=int, default=16, help="Virtual users, each with its own token and session")
+    parser.add_argument("--model", default="stub-model")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Stub seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--reply-tokens", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub calls that fail")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of stub calls that return 429")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--url", default=None, help="Drive an already running server instead of starting one")
+    parser.add_argument("--serve", action="store_true", help="Only start the stub-backed server and block")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--jwt-secret", default=BENCH_JWT_SECRET)
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results to this file")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = None
+    base_url = args.url
+    if base_url is None:
+        _configure_environment(args)
+        _install_stub_provider(_stub_options(args))
+        port = args.port or _free_port()
+        server, thread = _start_server(port)
+        base_url = f"http://127.0.0.1:{port}"
+        if args.serve:
+            print(f"Stub-backed server on {base_url} (JWT secret {args.jwt_secret!r})", flush=True)
+            try:
+                thread.join()
+            except KeyboardInterrupt:
+                server.should_exit = True
+            return
+
+    try:
+        _print_header()
+        results = asyncio.run(run_benchmark(args, base_url))
+    finally:
+        if server is not None:
+            server.should_exit = True
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
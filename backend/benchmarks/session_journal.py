@@ -0,0 +1,85 @@
+"""Measure how long a worker takes to restore journaled sessions.
+
+Fills an InMemorySessionStore with `--sessions` sessions of `--messages`
+messages each, written through the session journal, then restores them into
+a fresh store twice: once from the raw journal (as after a crash) and once
+from the compacted snapshot written on shutdown. Also reports the time the
+request path spends recording changes, which excludes the disk writes.
+
+From `backend`:
+    python -m benchmarks.session_journal --sessions 300000 --messages 4
+"""
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.app.services.session_journal import SessionJournal  # noqa: E402
+from src.app.services.session_store import InMemorySessionStore  # noqa: E402
+
+
+class _Provider:
+    def close(self):
+        pass
+
+
+def _store(directory, args):
+    journal = SessionJournal(directory, fsync=not args.no_fsync, snapshot_records=10 ** 12)
+    return InMemorySessionStore(journal=journal, provider_factory=lambda config: _Provider())
+
+
+async def _fill(directory, args):
+    store = _store(directory, args)
+    await store.start()
+    message = "x" * args.message_chars
+    config = {"provider": "stub", "api_key": "sk-benchmark", "model": "benchmark-model"}
+    started = time.perf_counter()
+    for index in range(args.sessions):
+        user_id, session_id = f"user-{index % 1000}", f"session-{index}"
+        await store.create_or_update(user_id, session_id, _Provider(), config, persist=False)
+        await store.append_messages(
+            user_id, session_id,
+            [{"role": "user" if turn % 2 == 0 else "assistant", "content": message} for turn in range(args.messages)],
+        )
+    recorded = time.perf_counter() - started
+    await store.journal.flush()
+    return store, recorded
+
+
+async def _restore(directory, args):
+    store = _store(directory, args)
+    started = time.perf_counter()
+    await asyncio.to_thread(store._replay)
+    elapsed = time.perf_counter() - started
+    return len(store.sessions), store.journal.replayed, elapsed
+
+
+async def _main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        store, recorded = await _fill(directory, args)
+        print(f"recorded {args.sessions} sessions: {recorded / (2 * args.sessions) * 1e6:.1f} us per change on the request path")
+
+        sessions, records, elapsed = await _restore(directory, args)
+        print(f"restore from journal: {sessions} sessions from {records} records in {elapsed:.2f} s")
+
+        await store.close()
+        sessions, records, elapsed = await _restore(directory, args)
+        print(f"restore from snapshot: {sessions} sessions from {records} records in {elapsed:.2f} s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=300000)
+    parser.add_argument("--messages", type=int, default=4)
+    parser.add_argument("--message-chars", type=int, default=200)
+    parser.add_argument("--no-fsync", action="store_true")
+    asyncio.run(_main(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Measure worker boot cost: the time to import the FastAPI app.
+
+Each sample runs in a fresh interpreter so nothing is already in
+sys.modules. Also reports which provider SDKs and clients were loaded at
+import time, and the one-off cost of building each provider's first instance
+(where its SDK is now imported).
+
+From `backend`:
+    python -m benchmarks.startup_time --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ("openai", "anthropic", "groq", "google.generativeai", "supabase")
+
+_IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import src.app.main
+elapsed = time.perf_counter() - started
+from src.app.services import database
+print(json.dumps({
+    "seconds": elapsed,
+    "loaded": [name for name in %r if name in sys.modules],
+    "db_client_built": database._db_service is not None,
+}))
+"""
+
+_PROVIDER_PROBE = """
+import json, time
+import src.app.main
+from src.providers.llm_providers import create_provider
+started = time.perf_counter()
+create_provider(%r, "sk-benchmark", "benchmark-model").close()
+print(json.dumps({"seconds": time.perf_counter() - started}))
+"""
+
+
+def _probe(code):
+    completed = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PERSIST_MESSAGES": "false"},
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--providers", default="openai,gemini,anthropic,groq", help="Comma-separated; empty to skip")
+    args = parser.parse_args(argv)
+
+    samples = [_probe(_IMPORT_PROBE % (HEAVY_MODULES,)) for _ in range(args.runs)]
+    seconds = sorted(sample["seconds"] for sample in samples)
+    print(f"app import: median {statistics.median(seconds) * 1000:.1f} ms, min {seconds[0] * 1000:.1f} ms over {args.runs} runs")
+    print(f"modules loaded at import: {', '.join(samples[0]['loaded']) or 'none'}")
+    print(f"database client built at import: {samples[0]['db_client_built']}")
+
+    for provider in filter(None, args.providers.split(",")):
+        try:
+            first = _probe(_PROVIDER_PROBE % (provider,))
+        except RuntimeError as exc:
+            print(f"first {provider} provider: failed ({exc})")
+            continue
+        print(f"first {provider} provider: {first['seconds'] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
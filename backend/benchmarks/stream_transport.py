@@ -0,0 +1,97 @@
+"""Compare per-delta NDJSON writes with the coalescing stream transport.
+
+Streams replies made of one-character deltas through a StreamingResponse
+both ways and reports ASGI body writes (roughly one network packet each)
+and CPU time per reply. Deltas arrive `--tokens-per-second` apart, or back
+to back (still yielding to the event loop) when it is 0.
+
+From `backend`:
+    python -m benchmarks.stream_transport --reply-chars 4000 --replies 20
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.responses import StreamingResponse  # noqa: E402
+
+from src.app.core.streaming import coalesce_deltas, encode_event  # noqa: E402
+
+
+async def _deltas(chars, interval):
+    for _ in range(chars):
+        await asyncio.sleep(interval)
+        yield {"chunk": "x"}
+    yield {"done": True}
+
+
+def _per_delta_response(events, args):
+    async def body():
+        async for payload in events:
+            yield json.dumps(payload) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+def _coalesced_response(events, args):
+    merged = coalesce_deltas(events, max_bytes=args.coalesce_bytes, flush_interval=args.flush_interval, max_buffer=1 << 20)
+
+    async def body():
+        async for event in merged:
+            yield encode_event(event)
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+async def _serve(build, args):
+    writes = 0
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal writes
+        if message["type"] == "http.response.body" and message.get("body"):
+            writes += 1
+
+    interval = 1.0 / args.tokens_per_second if args.tokens_per_second > 0 else 0.0
+    response = build(_deltas(args.reply_chars, interval), args)
+    await response({"type": "http", "asgi": {"spec_version": "2.3"}}, receive, send)
+    return writes
+
+
+def _measure(label, build, args):
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    writes = 0
+    for _ in range(args.replies):
+        writes += asyncio.run(_serve(build, args))
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    replies = args.replies
+    print(
+        f"{label:>10}: {writes / replies:8.1f} writes/reply  "
+        f"{cpu / replies * 1000:8.2f} ms CPU/reply  {wall / replies * 1000:8.2f} ms wall/reply"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reply-chars", type=int, default=4000)
+    parser.add_argument("--replies", type=int, default=20)
+    parser.add_argument("--tokens-per-second", type=float, default=0)
+    parser.add_argument("--coalesce-bytes", type=int, default=512)
+    parser.add_argument("--flush-interval", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    _measure("per-delta", _per_delta_response, args)
+    _measure("coalesced", _coalesced_response, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import asyncio
+import random
+import time
+
+from src.providers.llm_providers import LLMProvider, ProviderError, RateLimitError
+
+
+class StubProvider(LLMProvider):
+    """Local stand-in for an LLM API with configurable timing and failures.
+
+    Replies are `reply_tokens` words emitted at `tokens_per_second` after a
+    `ttft` second delay. `error_rate` and `rate_limit_rate` inject provider
+    errors and 429s (with `retry_after`) before the first token.
+    """
+
+    pool_name = "stub"
+
+    def __init__(
+        self,
+        api_key,
+        model,
+        ttft=0.2,
+        tokens_per_second=50.0,
+        reply_tokens=64,
+        error_rate=0.0,
+        rate_limit_rate=0.0,
+        retry_after=0.5,
+        seed=None,
+    ):
+        super().__init__(api_key, model)
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+
+    def _maybe_fail(self):
+        roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            raise RateLimitError("Stub API error: rate limited", status_code=429, retry_after=self.retry_after)
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise ProviderError("Stub API error: injected failure", status_code=500)
+
+    def _token(self, index):
+        return f"token{index} "
+
+    def _token_interval(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def chat(self, message, history):
+        return "".join(self.stream(message, history))
+
+    def stream(self, message, history):
+        time.sleep(self.ttft)
+        self._maybe_fail()
+        for index in range(self.reply_tokens):
+            if index:
+                time.sleep(self._token_interval())
+            yield self._token(index)
+
+    async def achat(self, message, history):
+        await asyncio.sleep(self.ttft + self._token_interval() * max(self.reply_tokens - 1, 0))
+        self._maybe_fail()
+        return "".join(self._token(index) for index in range(self.reply_tokens))
+
+    async def astream(self, message, history):
+        await asyncio.sleep(self.ttft)
+        self._maybe_fail()
+        for index in range(self.reply_tokens):
+            if index:
+                await asyncio.sleep(self._token_interval())
+            yield self._token(index)
@@ -26,6 +26,56 @@ class Settings:
         self.supabase_url: str = os.getenv("SUPABASE_URL", "")
         self.supabase_anon_key: str = os.getenv("SUPABASE_ANON_KEY", "")
         self.supabase_service_role_key: str = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
+        self.supabase_jwt_secret: str = os.getenv("SUPABASE_JWT_SECRET", "")
+        self.supabase_jwks_url: str = os.getenv("SUPABASE_JWKS_URL", "")
+        self.auth_cache_size: int = int(os.getenv("AUTH_CACHE_SIZE", "4096"))
+        self.auth_cache_ttl: float = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "300"))
+        self.session_max_sessions: int = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+        self.session_max_history_bytes: int = int(os.getenv("SESSION_MAX_HISTORY_BYTES", "1048576"))
+        self.session_idle_ttl: float = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "86400"))
+        self.session_backend: str = os.getenv("SESSION_BACKEND", "memory").lower()
+        self.session_redis_url: str = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+        self.session_redis_prefix: str = os.getenv("SESSION_REDIS_PREFIX", "llmchat:session")
+        self.session_journal_dir: str = os.getenv("SESSION_JOURNAL_DIR", "")
+        self.session_journal_flush_interval: float = float(os.getenv("SESSION_JOURNAL_FLUSH_INTERVAL_SECONDS", "0.05"))
+        self.session_journal_fsync: bool = os.getenv("SESSION_JOURNAL_FSYNC", "true").lower() == "true"
+        self.session_journal_snapshot_records: int = int(os.getenv("SESSION_JOURNAL_SNAPSHOT_RECORDS", "100000"))
+        self.session_journal_snapshot_interval: float = float(os.getenv("SESSION_JOURNAL_SNAPSHOT_INTERVAL_SECONDS", "600"))
+        self.search_index_max_users: int = int(os.getenv("SEARCH_INDEX_MAX_USERS", "1000"))
+        self.search_sync_interval: float = float(os.getenv("SEARCH_SYNC_INTERVAL_SECONDS", "30"))
+        self.search_sync_batch: int = int(os.getenv("SEARCH_SYNC_BATCH", "5000"))
+        self.context_max_tokens: int = int(os.getenv("CONTEXT_MAX_TOKENS", "16000"))
+        self.context_reserve_tokens: int = int(os.getenv("CONTEXT_RESERVE_TOKENS", "1024"))
+        self.context_summary_enabled: bool = os.getenv("CONTEXT_SUMMARY_ENABLED", "false").lower() == "true"
+        self.retrieval_enabled: bool = os.getenv("RETRIEVAL_ENABLED", "false").lower() == "true"
+        self.retrieval_embedder: str = os.getenv("RETRIEVAL_EMBEDDER", "hashing")
+        self.retrieval_dimensions: int = int(os.getenv("RETRIEVAL_DIMENSIONS", "256"))
+        self.retrieval_recent_messages: int = int(os.getenv("RETRIEVAL_RECENT_MESSAGES", "8"))
+        self.retrieval_top_k: int = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+        self.retrieval_max_sessions: int = int(os.getenv("RETRIEVAL_MAX_SESSIONS", "1000"))
+        self.response_cache_max_entries: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+        self.response_cache_ttl: float = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "600"))
+        self.response_cache_max_bytes: int = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        self.persist_messages: bool = os.getenv("PERSIST_MESSAGES", "false").lower() == "true"
+        self.message_batch_size: int = int(os.getenv("MESSAGE_BATCH_SIZE", "200"))
+        self.message_flush_interval: float = float(os.getenv("MESSAGE_FLUSH_INTERVAL_SECONDS", "0.25"))
+        self.message_max_pending: int = int(os.getenv("MESSAGE_MAX_PENDING", "10000"))
+        self.user_data_cache_max_entries: int = int(os.getenv("USER_DATA_CACHE_MAX_ENTRIES", "10000"))
+        self.user_data_cache_ttl: float = float(os.getenv("USER_DATA_CACHE_TTL_SECONDS", "60"))
+        self.idempotency_ttl: float = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "300"))
+        self.idempotency_max_entries: int = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+        self.scheduler_max_concurrency: int = int(os.getenv("SCHEDULER_MAX_CONCURRENCY_PER_KEY", "16"))
+        self.scheduler_max_per_user: int = int(os.getenv("SCHEDULER_MAX_CONCURRENCY_PER_USER", "4"))
+        self.scheduler_max_retries: int = int(os.getenv("SCHEDULER_MAX_RETRIES", "3"))
+        self.batch_max_prompts: int = int(os.getenv("BATCH_MAX_PROMPTS", "100"))
+        self.batch_max_concurrency: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+        self.provider_client_idle_ttl_seconds: float = float(os.getenv("PROVIDER_CLIENT_IDLE_TTL_SECONDS", "300"))
+        self.hedge_delay: float = float(os.getenv("HEDGE_DELAY_SECONDS", "2.0"))
+        self.stream_coalesce_bytes: int = int(os.getenv("STREAM_COALESCE_BYTES", "512"))
+        self.stream_flush_interval: float = float(os.getenv("STREAM_FLUSH_INTERVAL_SECONDS", "0.05"))
+        self.stream_max_buffer_bytes: int = int(os.getenv("STREAM_MAX_BUFFER_BYTES", "1048576"))
+        self.metrics_token: str = os.getenv("METRICS_TOKEN", "")
+        self.metrics_max_model_labels: int = int(os.getenv("METRICS_MAX_MODEL_LABELS", "32"))
         self.allowed_origins: List[str] = _parse_origins(os.getenv("FRONTEND_ORIGINS"))
 
 
@@ -0,0 +1,29 @@
+import json
+from typing import Any
+
+try:  # Optional: several times faster encoding and decoding when orjson is installed
+    import orjson
+except ImportError:  # pragma: no cover - fall back to the standard library
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    to_dict = getattr(value, "to_dict", None)
+    return to_dict() if to_dict is not None else str(value)
+
+
+def dumps(payload: Any) -> bytes:
+    """Compact JSON encoding.
+
+    Objects with a to_dict() method (compact chat messages) are encoded as that
+    dict; other values JSON cannot represent (datetimes, UUIDs) become strings.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False, default=_default).encode("utf-8")
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,113 @@
+import hashlib
+import time
+from typing import Any, Dict, Optional
+
+import jwt
+
+from .cache import TTLCache
+from .config import settings
+
+_ASYMMETRIC_ALGORITHMS = ["RS256", "ES256"]
+
+
+class LocalVerificationUnavailable(Exception):
+    """Raised when a token cannot be checked locally and the remote call must decide."""
+
+
+class JWTVerifier:
+    """Verify Supabase access tokens locally and remember the ones that passed.
+
+    HS256 tokens are checked against the project's JWT secret; asymmetric tokens
+    against the project's JWKS, which PyJWKClient fetches once and caches.
+    """
+
+    def __init__(
+        self,
+        secret: str = "",
+        jwks_url: str = "",
+        audience: str = "authenticated",
+        cache_size: int = 1024,
+        cache_ttl: float = 300.0,
+    ) -> None:
+        self.secret = secret
+        self.audience = audience
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._jwks_client: Optional[jwt.PyJWKClient] = (
+            jwt.PyJWKClient(jwks_url, cache_jwk_set=True, lifespan=3600) if jwks_url else None
+        )
+
+    @staticmethod
+    def _cache_key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def cached_user(self, token: str) -> Any:
+        return self.cache.get(self._cache_key(token))
+
+    def remember(self, token: str, user: Any, expires_at: Optional[float] = None) -> None:
+        """Cache a validated user until the token's `exp` (or the cache TTL, whichever is sooner)."""
+        if expires_at is None:
+            try:
+                expires_at = jwt.decode(token, options={"verify_signature": False}).get("exp")
+            except jwt.PyJWTError:
+                expires_at = None
+        ttl = self.cache.ttl if expires_at is None else min(self.cache.ttl, expires_at - time.time())
+        self.cache.set(self._cache_key(token), user, ttl=ttl)
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Return the user claims for a valid token.
+
+        Raises jwt.PyJWTError when the token is definitively invalid and
+        LocalVerificationUnavailable when no local key material applies.
+        """
+        header = jwt.get_unverified_header(token)
+        algorithm = header.get("alg")
+
+        if algorithm == "HS256":
+            if not self.secret:
+                raise LocalVerificationUnavailable("SUPABASE_JWT_SECRET not configured")
+            key: Any = self.secret
+            algorithms = ["HS256"]
+        elif algorithm in _ASYMMETRIC_ALGORITHMS:
+            if self._jwks_client is None:
+                raise LocalVerificationUnavailable("JWKS URL not configured")
+            try:
+                key = self._jwks_client.get_signing_key_from_jwt(token).key
+            except jwt.PyJWKClientError as exc:
+                raise LocalVerificationUnavailable(str(exc)) from exc
+            algorithms = [algorithm]
+        else:
+            raise LocalVerificationUnavailable(f"Unsupported token algorithm: {algorithm}")
+
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=algorithms,
+            audience=self.audience,
+            options={"require": ["exp", "sub"]},
+        )
+        user = {
+            "id": claims["sub"],
+            "email": claims.get("email"),
+            "role": claims.get("role"),
+            "aud": claims.get("aud"),
+            "app_metadata": claims.get("app_metadata", {}),
+            "user_metadata": claims.get("user_metadata", {}),
+        }
+        self.remember(token, user, expires_at=claims["exp"])
+        return user
+
+
+def _default_jwks_url() -> str:
+    if settings.supabase_jwks_url:
+        return settings.supabase_jwks_url
+    if settings.supabase_url:
+        return settings.supabase_url.rstrip("/") + "/auth/v1/.well-known/jwks.json"
+    return ""
+
+
+jwt_verifier = JWTVerifier(
+    secret=settings.supabase_jwt_secret,
+    jwks_url=_default_jwks_url(),
+    cache_size=settings.auth_cache_size,
+    cache_ttl=settings.auth_cache_ttl,
+)
@@ -0,0 +1,337 @@
+"""
+Minimal Prometheus-style metrics: counters, gauges and fixed-bucket histograms
+rendered in the text exposition format, plus an ASGI middleware timing requests
+"""
+
+import asyncio
+import functools
+import inspect
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .config import settings
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Gauge(_Metric):
+    """Gauge whose samples are set directly or produced by a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], Iterable[Tuple[Dict[str, str], float]]]] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> List[str]:
+        if self.callback is not None:
+            items = [(self._key(labels), value) for labels, value in self.callback()]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items
+        ]
+
+
+class Counter(Gauge):
+    """Monotonic counter; callback counters read totals kept by the component itself."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, value: float, **labels: str) -> None:  # pragma: no cover - counters only go up
+        raise TypeError("Counters cannot be set; use inc()")
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; an observation is one bisect and two additions under a lock."""
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def time(self, **labels: str) -> "_Timer":
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        lines = self.header()
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception:  # pragma: no cover - a broken callback must not break the scrape
+                continue
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = (), callback=None) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames, callback))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = (), callback=None) -> Gauge:
+    return registry.register(Gauge(name, documentation, labelnames, callback))
+
+
+def histogram(
+    name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# ==================== APPLICATION METRICS ====================
+http_requests_total = counter("http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+http_request_duration = histogram(
+    "http_request_duration_seconds", "Time until the response completed", ("method", "route")
+)
+auth_duration = histogram(
+    "auth_duration_seconds",
+    "Time spent in get_current_user by outcome",
+    ("outcome",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+llm_time_to_first_token = histogram(
+    "llm_time_to_first_token_seconds", "Provider time to first streamed token", ("provider", "model")
+)
+llm_generation_duration = histogram(
+    "llm_generation_seconds", "Provider time to complete a reply", ("provider", "model")
+)
+llm_tokens_per_second = histogram(
+    "llm_tokens_per_second",
+    "Reply tokens divided by generation time",
+    ("provider", "model"),
+    buckets=(1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 300, 500, 1000),
+)
+llm_input_tokens = counter(
+    "llm_input_tokens_total", "Prompt tokens sent upstream by prompt-cache status", ("provider", "model", "cache")
+)
+llm_prompt_prefix = counter(
+    "llm_prompt_prefix_total", "Turns whose prompt extended the previous turn's prompt", ("result",)
+)
+db_call_duration = histogram("db_call_duration_seconds", "Supabase call latency", ("method",))
+
+
+# Model names come from client configuration, so only the first
+# METRICS_MAX_MODEL_LABELS distinct ones get their own series
+_model_labels: set = set()
+_model_labels_lock = threading.Lock()
+
+
+def _model_label(model: str) -> str:
+    if model in _model_labels:
+        return model
+    with _model_labels_lock:
+        if len(_model_labels) < settings.metrics_max_model_labels:
+            _model_labels.add(model)
+            return model
+    return "other"
+
+
+def _split_label(label: Optional[str]) -> Tuple[str, str]:
+    provider, _, model = (label or "unknown").partition(":")
+    return provider, _model_label(model)
+
+
+def record_generation(label: Optional[str], seconds: float, tokens: int, ttft: Optional[float] = None) -> None:
+    """Record one completed provider reply served by `label` ("provider:model")."""
+    provider, model = _split_label(label)
+    llm_generation_duration.observe(seconds, provider=provider, model=model)
+    if ttft is not None:
+        llm_time_to_first_token.observe(ttft, provider=provider, model=model)
+    if seconds > 0 and tokens:
+        llm_tokens_per_second.observe(tokens / seconds, provider=provider, model=model)
+
+
+def uncached_input_tokens(usage: Dict[str, int]) -> int:
+    """Prompt tokens neither read from nor written to a prompt cache"""
+    return usage.get("input_tokens", 0) - usage.get("cached_input_tokens", 0) - usage.get("cache_write_tokens", 0)
+
+
+def record_usage(label: Optional[str], usage: Dict[str, int]) -> None:
+    """Record a turn's prompt tokens split into cache reads, cache writes and uncached input."""
+    provider, model = _split_label(label)
+    for cache, tokens in (
+        ("read", usage.get("cached_input_tokens", 0)),
+        ("write", usage.get("cache_write_tokens", 0)),
+        ("uncached", uncached_input_tokens(usage)),
+    ):
+        if tokens > 0:
+            llm_input_tokens.inc(tokens, provider=provider, model=model, cache=cache)
+
+
+def instrument_methods(histogram: Histogram, label: str = "method"):
+    """Class decorator timing every public sync or async method into `histogram`."""
+
+    def wrap(func):
+        name = func.__name__
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed_async(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started, **{label: name})
+
+            return timed_async
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, **{label: name})
+
+        return timed
+
+    def decorate(cls):
+        for name, func in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.isfunction(func) or inspect.isasyncgenfunction(func):
+                continue
+            setattr(cls, name, wrap(func))
+        return cls
+
+    return decorate
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests and timing them until the response body completes."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_request_duration.observe(time.perf_counter() - started, method=method, route=path)
+            http_requests_total.inc(method=method, route=path, status=str(status["code"]))
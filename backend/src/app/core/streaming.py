@@ -0,0 +1,145 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterable
+
+from fastapi.responses import StreamingResponse
+
+from .config import settings
+from .fast_json import dumps
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def encode_event(payload: Any, format: str = "ndjson") -> bytes:
+    if format == "sse":
+        return b"data: " + dumps(payload) + b"\n\n"
+    return dumps(payload) + b"\n"
+
+
+def _is_delta(event: Dict) -> bool:
+    return len(event) == 1 and "chunk" in event
+
+
+class _PendingChunk:
+    """Deltas waiting to be released as one chunk"""
+
+    __slots__ = ("parts", "size", "started")
+
+    def __init__(self, delta: str, size: int) -> None:
+        self.parts = [delta]
+        self.size = size
+        self.started = time.monotonic()
+
+
+async def coalesce_deltas(
+    events: AsyncIterator[Dict],
+    max_bytes: int,
+    flush_interval: float,
+    max_buffer: int,
+) -> AsyncIterator[Dict]:
+    """Merge consecutive {"chunk": ...} events.
+
+    A merged chunk is released once it reaches `max_bytes`, once its first
+    delta is `flush_interval` seconds old, or as soon as a different event
+    follows it. The very first delta is released immediately so time to
+    first token is unchanged. Upstream is read by a separate task, so while
+    a slow client drains one write, new deltas pile into the next (larger)
+    chunk; reading pauses once `max_buffer` bytes are waiting.
+    """
+    pending: deque = deque()
+    buffered = 0
+    finished = False
+    error = None
+    readable = asyncio.Event()
+    writable = asyncio.Event()
+
+    async def read_upstream() -> None:
+        nonlocal buffered, finished, error
+        try:
+            async for event in events:
+                while buffered >= max_buffer:
+                    writable.clear()
+                    await writable.wait()
+                # Only wake the writer when it has something new to release
+                wake = not pending
+                if _is_delta(event):
+                    delta = event["chunk"]
+                    size = len(delta.encode("utf-8"))
+                    if pending and isinstance(pending[-1], _PendingChunk):
+                        pending[-1].parts.append(delta)
+                        pending[-1].size += size
+                        wake = wake or pending[-1].size >= max_bytes
+                    else:
+                        pending.append(_PendingChunk(delta, size))
+                    buffered += size
+                else:
+                    pending.append(event)
+                    wake = True
+                if wake:
+                    readable.set()
+        except Exception as exc:
+            error = exc
+        finally:
+            finished = True
+            readable.set()
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.create_task(read_upstream())
+    first = True
+    try:
+        while True:
+            if not pending:
+                if finished:
+                    break
+                readable.clear()
+                await readable.wait()
+                continue
+
+            head = pending[0]
+            if isinstance(head, _PendingChunk) and len(pending) == 1 and not finished and not first:
+                # Only an open chunk is waiting: hold it until it is big or old enough
+                remaining = head.started + flush_interval - time.monotonic()
+                if head.size < max_bytes and remaining > 0:
+                    readable.clear()
+                    timer = loop.call_later(remaining, readable.set)
+                    await readable.wait()
+                    timer.cancel()
+                    continue
+
+            pending.popleft()
+            if isinstance(head, _PendingChunk):
+                buffered -= head.size
+                writable.set()
+                first = False
+                yield {"chunk": "".join(head.parts)}
+            else:
+                yield head
+
+        if error is not None:
+            raise error
+    finally:
+        reader.cancel()
+
+
+async def _encode_stream(events: AsyncIterator[Dict], format: str) -> AsyncIterator[bytes]:
+    async for event in events:
+        yield encode_event(event, format)
+
+
+def stream_response(events: AsyncIterator[Dict], format: str = "ndjson", coalesce: bool = False) -> StreamingResponse:
+    """Stream events as NDJSON lines or Server-Sent Events, optionally merging text deltas."""
+    if coalesce:
+        events = coalesce_deltas(
+            events,
+            max_bytes=settings.stream_coalesce_bytes,
+            flush_interval=settings.stream_flush_interval,
+            max_buffer=settings.stream_max_buffer_bytes,
+        )
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} if format == "sse" else None
+    return StreamingResponse(_encode_stream(events, format), media_type=MEDIA_TYPES[format], headers=headers)
+
+
+def ndjson_lines(payloads: Iterable[Any]) -> Iterable[bytes]:
+    for payload in payloads:
+        yield dumps(payload) + b"\n"
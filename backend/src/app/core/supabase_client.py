@@ -1,9 +1,18 @@
+import asyncio
+import time
+
+import jwt
 from fastapi import Header, HTTPException
-from supabase import Client, create_client
+from supabase import Client, acreate_client, create_client
+from supabase._async.client import AsyncClient
 
 from .config import settings
+from .jwt_verifier import LocalVerificationUnavailable, jwt_verifier
+from .metrics import auth_duration
 
 _supabase_client: Client | None = None
+_async_supabase_client: AsyncClient | None = None
+_async_client_lock = asyncio.Lock()
 
 
 def get_supabase_client() -> Client:
@@ -16,20 +25,79 @@ def get_supabase_client() -> Client:
     return _supabase_client
 
 
+async def get_async_supabase_client() -> AsyncClient:
+    """Return a singleton async Supabase client.
+
+    All async database calls share its PostgREST HTTP/2 connection pool.
+    """
+    global _async_supabase_client
+    if _async_supabase_client is None:
+        async with _async_client_lock:
+            if _async_supabase_client is None:
+                if not settings.supabase_url or not settings.supabase_anon_key:
+                    raise RuntimeError("Supabase configuration missing. Set SUPABASE_URL and SUPABASE_ANON_KEY.")
+                _async_supabase_client = await acreate_client(settings.supabase_url, settings.supabase_anon_key)
+    return _async_supabase_client
+
+
 def get_current_user(authorization: str | None = Header(default=None)) -> dict:
-    """FastAPI dependency to validate the Supabase JWT and return the user object."""
+    """FastAPI dependency to validate the Supabase JWT and return the user object.
+
+    Tokens are verified locally (JWT secret or cached JWKS) and remembered until
+    they expire; the Supabase auth API is only consulted when local verification
+    is not possible.
+    """
+    started = time.perf_counter()
+    outcome = "rejected"
+    try:
+        user, outcome = _authenticate(authorization)
+        return user
+    finally:
+        auth_duration.observe(time.perf_counter() - started, outcome=outcome)
+
+
+def _authenticate(authorization: str | None) -> tuple:
+    """Return (user, outcome) where outcome names the path that validated the token."""
     if not authorization or not authorization.lower().startswith("bearer "):
         raise HTTPException(status_code=401, detail="Missing bearer token")
 
     token = authorization.split(" ", 1)[1]
+
+    cached = jwt_verifier.cached_user(token)
+    if cached is not None:
+        return cached, "cache"
+
+    try:
+        return jwt_verifier.verify(token), "local"
+    except LocalVerificationUnavailable:
+        pass
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Auth token expired")
+    except jwt.PyJWTError as exc:
+        raise HTTPException(status_code=401, detail=f"Invalid auth token: {exc}")
+
     client = get_supabase_client()
 
     try:
         user_response = client.auth.get_user(token)
         if not user_response or not user_response.user:
             raise HTTPException(status_code=401, detail="Invalid auth token")
-        return user_response.user
+        jwt_verifier.remember(token, user_response.user)
+        return user_response.user, "remote"
     except HTTPException:
         raise
     except Exception as exc:  # pragma: no cover - defensive catch
         raise HTTPException(status_code=401, detail=f"Invalid auth token: {exc}")
+
+
+def require_user_id(user: object) -> str:
+    """Resolve the user id from a Supabase User object or locally verified token claims."""
+    if hasattr(user, "id"):
+        user_id = getattr(user, "id")
+    elif isinstance(user, dict):
+        user_id = user.get("id") or user.get("user", {}).get("id")
+    else:
+        user_id = None
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Unable to resolve user id from token")
+    return user_id
@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
@@ -12,9 +14,29 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from src.app.core.config import settings
-from src.app.routes import auth, chat, health
+from src.app.core.metrics import MetricsMiddleware
+from src.app.routes import auth, chat, health, history, search
+from src.app.services.message_writer import message_writer
+from src.app.services.search_index import search_index
+from src.app.services.session_store import session_store
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Restore journaled sessions before serving requests
+    await session_store.start()
+    if settings.persist_messages:
+        from src.app.services.async_database import get_async_db_service
 
-app = FastAPI(title="LLM Chatbot API", version="1.1.0")
+        message_writer.start(await get_async_db_service())
+    yield
+    # Flush buffered chat messages before the worker exits
+    await message_writer.stop()
+    await search_index.close()
+    await session_store.close()
+
+
+app = FastAPI(title="LLM Chatbot API", version="1.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,9 +46,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(health.router)
 app.include_router(auth.router)
 app.include_router(chat.router)
+app.include_router(history.router)
+app.include_router(search.router)
 
 
 @app.get("/", tags=["Info"])
@@ -39,10 +65,15 @@ def home():
             "POST /api/configure": "Configure LLM provider",
             "POST /api/chat": "Send chat message",
             "POST /api/chat/stream": "Stream chat message",
+            "POST /api/chat/batch": "Run many prompts concurrently (NDJSON results)",
             "GET /api/history": "Get chat history",
             "POST /api/clear": "Clear chat history",
             "GET /api/sessions": "List active sessions",
+            "GET /api/search": "Search chat history",
+            "GET /api/db/sessions": "Page through saved chat sessions",
+            "GET /api/db/sessions/{session_id}/messages": "Page through or stream saved messages",
             "GET /health": "Health check",
+            "GET /metrics": "Prometheus metrics",
         },
         "docs": "/docs",
         "openapi_schema": "/openapi.json",
@@ -1,28 +1,68 @@
-import json
+import asyncio
+import time
 from typing import Dict, List
+from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from src.app.core.supabase_client import get_current_user
+from src.app.core.config import settings
+from src.app.core.fast_json import dumps
+from src.app.core.metrics import record_generation, record_usage
+from src.app.core.streaming import ndjson_lines, stream_response
+from src.app.core.supabase_client import get_current_user, require_user_id
+from src.app.services.context_window import context_window, count_text_tokens
+from src.app.services.idempotency import chat_single_flight, request_fingerprint
+from src.app.services.message_writer import message_writer
+from src.app.services.prompt_prefix import match_prefix, next_prefix, usage_report
+from src.app.services.response_cache import response_cache
+from src.app.services.scheduler import scheduler
 from src.app.services.session_store import session_store
-from src.providers.llm_providers import AnthropicProvider, GeminiProvider, GroqProvider, OpenAIProvider
+from src.providers.factory import provider_from_config
+from src.providers.llm_providers import RateLimitError, UnsupportedProviderError, create_provider, track_usage
+from src.providers.messages import message_dict
 
 router = APIRouter(prefix="/api", tags=["Chat"])
 
 
+class BackendConfig(BaseModel):
+    provider: str
+    model: str
+    # Defaults to the primary api_key when omitted
+    api_key: str | None = None
+
+
 class ConfigureRequest(BaseModel):
     provider: str
     api_key: str
     model: str
     session_id: str = "default"
+    prewarm: bool = False
+    # Ordered fallbacks after the primary provider; enables hedging and failover
+    fallbacks: List[BackendConfig] | None = None
+    hedge_delay: float | None = None
+    # Send recent turns plus the most relevant older ones instead of the whole history; defaults to RETRIEVAL_ENABLED
+    retrieval: bool | None = None
 
 
 class ChatRequest(BaseModel):
     message: str
     session_id: str = "default"
     history: List[Dict] | None = None
+    cache: bool = False
+
+
+class BatchChatRequest(BaseModel):
+    prompts: List[str]
+    session_id: str = "default"
+    history: List[Dict] | None = None
+    # Optional one-off provider; when omitted the session's configured provider is used
+    provider: str | None = None
+    api_key: str | None = None
+    model: str | None = None
+    concurrency: int = 4
+    cache: bool = False
 
 
 class ClearRequest(BaseModel):
@@ -34,16 +74,22 @@ class ConfigureResponse(BaseModel):
     provider: str
     model: str
     session_id: str
+    backends: List[str] | None = None
 
 
 class ChatResponse(BaseModel):
     response: str
     session_id: str
+    cached: bool = False
+    served_by: str | None = None
+    # Prompt tokens split by provider prompt-cache status; absent for cached replies
+    usage: Dict[str, int] | None = None
 
 
 class HistoryResponse(BaseModel):
     session_id: str
     history: List[Dict[str, str]]
+    next_cursor: int | None = None
 
 
 class SessionInfo(BaseModel):
@@ -56,33 +102,68 @@ class SessionsResponse(BaseModel):
     sessions: List[SessionInfo]
 
 
-def _require_user_id(user: object) -> str:
-    if hasattr(user, "id"):
-        user_id = getattr(user, "id")
-    elif isinstance(user, dict):
-        user_id = user.get("id") or user.get("user", {}).get("id")
-    else:
-        user_id = None
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Unable to resolve user id from token")
-    return user_id
+async def _owns_db_session(user_id: str, session_id: str) -> bool:
+    """Whether session_id names one of the user's chat_sessions rows (checked once at configure time)"""
+    if not settings.persist_messages:
+        return False
+    try:
+        UUID(session_id)
+    except ValueError:
+        return False
+    from src.app.services.async_database import get_async_db_service
+
+    db = await get_async_db_service()
+    return await db.get_chat_session(user_id, session_id) is not None
+
+
+async def _persist_turn(session: Dict, session_id: str, message: str, response: str) -> None:
+    if not session.get("persist") or not message_writer.running:
+        return
+    model = getattr(session["provider"], "model", None)
+    await message_writer.enqueue(session_id, "user", message, model=model)
+    await message_writer.enqueue(session_id, "assistant", response, model=model)
+
+
+async def _windowed_history(user_id: str, session_id: str, session: Dict, message: str, history: List[Dict]):
+    """History to send for this turn, saving any context summary the window produced"""
+    if session.get("retrieval") and not history:
+        from src.app.services.retrieval_memory import get_retrieval_memory
+
+        selected = await get_retrieval_memory().select(
+            user_id, session_id, session["chat_history"], session.get("history_offset", 0), message
+        )
+        # Still windowed to the token budget; no summary, as retrieval replaces it
+        return await context_window.build(session["provider"], message, selected)
+    summary = session.get("context_summary")
+    chat_history = await context_window.build(
+        session["provider"], message, history or session["chat_history"], session, user_id=user_id
+    )
+    if session.get("context_summary") is not summary:
+        await session_store.update(user_id, session_id, context_summary=session["context_summary"])
+    return chat_history
+
+
+async def _timed_chat(provider, message: str, history: List[Dict]):
+    """provider.achat_routed() with generation time and throughput recorded per serving backend"""
+    started = time.perf_counter()
+    reply, served_by = await provider.achat_routed(message, history)
+    record_generation(served_by, time.perf_counter() - started, count_text_tokens(reply))
+    return reply, served_by
+
+
+# Strong references to in-flight warmup tasks so they are not garbage collected
+_warmup_tasks: set = set()
 
 
 def _build_provider(provider: str, api_key: str, model: str):
-    provider_key = provider.lower()
-    if provider_key == "openai":
-        return OpenAIProvider(api_key, model)
-    if provider_key == "gemini":
-        return GeminiProvider(api_key, model)
-    if provider_key == "anthropic":
-        return AnthropicProvider(api_key, model)
-    if provider_key == "groq":
-        return GroqProvider(api_key, model)
-    raise HTTPException(status_code=400, detail=f"Unsupported provider: {provider}")
+    try:
+        return create_provider(provider, api_key, model)
+    except UnsupportedProviderError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
 
 @router.post("/configure", response_model=ConfigureResponse)
-def configure_llm(request_data: ConfigureRequest, user=Depends(get_current_user)):
+async def configure_llm(request_data: ConfigureRequest, user=Depends(get_current_user)):
     provider = request_data.provider
     api_key = request_data.api_key
     model = request_data.model
@@ -91,20 +172,46 @@ def configure_llm(request_data: ConfigureRequest, user=Depends(get_current_user)
     if not provider or not api_key or not model:
         raise HTTPException(status_code=400, detail="Missing required fields: provider, api_key, model")
 
-    llm_provider = _build_provider(provider, api_key, model)
-    user_id = _require_user_id(user)
-    session_store.create_or_update(user_id, session_id, llm_provider)
+    user_id = require_user_id(user)
+    # Sessions keep this serializable config so any worker can rebuild the provider
+    config = {"provider": provider, "api_key": api_key, "model": model}
+    if request_data.fallbacks:
+        hedge_delay = request_data.hedge_delay
+        if hedge_delay is None:
+            hedge_delay = settings.hedge_delay if settings.hedge_delay > 0 else None
+        config["fallbacks"] = [fallback.model_dump() for fallback in request_data.fallbacks]
+        config["hedge_delay"] = hedge_delay
+    persist = await _owns_db_session(user_id, session_id)
+    try:
+        llm_provider = provider_from_config(config)
+    except UnsupportedProviderError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    retrieval = settings.retrieval_enabled if request_data.retrieval is None else request_data.retrieval
+    await session_store.create_or_update(
+        user_id, session_id, llm_provider, config, persist=persist, retrieval=retrieval
+    )
+
+    if request_data.prewarm:
+        task = asyncio.create_task(llm_provider.awarmup())
+        _warmup_tasks.add(task)
+        task.add_done_callback(_warmup_tasks.discard)
 
     return ConfigureResponse(
         message="Configuration successful",
         provider=provider,
         model=model,
         session_id=session_id,
+        backends=[backend.label for backend in llm_provider.backends] if request_data.fallbacks else None,
     )
 
 
 @router.post("/chat", response_model=ChatResponse)
-def chat(request_data: ChatRequest, user=Depends(get_current_user)):
+async def chat(
+    request_data: ChatRequest,
+    response: Response,
+    user=Depends(get_current_user),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+):
     message = request_data.message
     session_id = request_data.session_id
     history = request_data.history or []
@@ -112,23 +219,69 @@ def chat(request_data: ChatRequest, user=Depends(get_current_user)):
     if not message:
         raise HTTPException(status_code=400, detail="Message is required")
 
-    user_id = _require_user_id(user)
-    session = session_store.get(user_id, session_id)
+    user_id = require_user_id(user)
+    session = await session_store.get(user_id, session_id)
     if not session:
         raise HTTPException(status_code=400, detail="Session not configured. Please configure first.")
 
-    provider = session["provider"]
-    chat_history = history if history else session["chat_history"]
-    response = provider.chat(message, chat_history)
-
-    session["chat_history"].append({"role": "user", "content": message})
-    session["chat_history"].append({"role": "assistant", "content": response})
-
-    return ChatResponse(response=response, session_id=session_id)
+    async def run_turn() -> ChatResponse:
+        provider = session["provider"]
+        chat_history = await _windowed_history(user_id, session_id, session, message, history)
+
+        cache_key = response_cache.key(user_id, provider, message, chat_history) if request_data.cache else None
+        cached = response_cache.get(cache_key) if cache_key else None
+        usage = None
+        if cached is not None:
+            reply = "".join(cached)
+            served_by = "cache"
+        else:
+            prefix_messages, digest = match_prefix(session, chat_history)
+            try:
+                with track_usage() as usage:
+                    reply, served_by = await scheduler.submit(
+                        user_id, provider, lambda: _timed_chat(provider, message, chat_history)
+                    )
+            except RateLimitError as exc:
+                headers = {"Retry-After": str(int(exc.retry_after + 0.999))} if exc.retry_after else None
+                raise HTTPException(status_code=429, detail=str(exc), headers=headers)
+            record_usage(served_by, usage)
+            usage = usage_report(usage, prefix_messages)
+            await session_store.update(
+                user_id, session_id, prompt_prefix=next_prefix(digest, chat_history, message, reply)
+            )
+            if cache_key:
+                response_cache.set(cache_key, [reply])
+
+        await session_store.append_messages(
+            user_id,
+            session_id,
+            [{"role": "user", "content": message}, {"role": "assistant", "content": reply}],
+        )
+        await _persist_turn(session, session_id, message, reply)
+
+        return ChatResponse(
+            response=reply, session_id=session_id, cached=cached is not None, served_by=served_by, usage=usage
+        )
+
+    # Retries and double submits share one generation: explicit Idempotency-Keys
+    # are also replayed after completion, identical unkeyed requests only while
+    # the first is still running.
+    fingerprint = request_fingerprint(message, history)
+    flight_key = (user_id, session_id, idempotency_key or fingerprint)
+    result, shared = await chat_single_flight.run(
+        flight_key, fingerprint, run_turn, remember=idempotency_key is not None
+    )
+    if shared:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
 
 
 @router.post("/chat/stream")
-async def chat_stream(request_data: ChatRequest, user=Depends(get_current_user)):
+async def chat_stream(
+    request_data: ChatRequest,
+    format: str = Query(default="ndjson", pattern="^(ndjson|sse)$"),
+    user=Depends(get_current_user),
+):
     async def generate():
         try:
             message = request_data.message
@@ -139,64 +292,174 @@ async def chat_stream(request_data: ChatRequest, user=Depends(get_current_user))
                 yield {"error": "Message is required"}
                 return
 
-            user_id = _require_user_id(user)
-            session = session_store.get(user_id, session_id)
+            user_id = require_user_id(user)
+            session = await session_store.get(user_id, session_id)
             if not session:
                 yield {"error": "Session not configured. Please configure first."}
                 return
 
             provider = session["provider"]
-            chat_history = history if history else session["chat_history"]
-            response = provider.chat(message, chat_history)
-
-            full_response = ""
-            words = response.split(" ")
-            for word_idx, word in enumerate(words):
-                for char in word:
-                    full_response += char
-                    yield {"chunk": char}
-                if word_idx < len(words) - 1:
-                    full_response += " "
-                    yield {"chunk": " "}
-
-            session["chat_history"].append({"role": "user", "content": message})
-            session["chat_history"].append({"role": "assistant", "content": full_response})
-            yield {"done": True}
+            chat_history = await _windowed_history(user_id, session_id, session, message, history)
+
+            cache_key = response_cache.key(user_id, provider, message, chat_history) if request_data.cache else None
+            cached = response_cache.get(cache_key) if cache_key else None
+
+            usage = None
+            if cached is not None:
+                parts = list(cached)
+                served_by = "cache"
+                for delta in parts:
+                    yield {"chunk": delta}
+            else:
+                # Forward provider deltas as they arrive
+                parts = []
+                served_by = None
+                prefix_messages, digest = match_prefix(session, chat_history)
+                async with scheduler.slot(user_id, provider):
+                    started = time.perf_counter()
+                    first_token = None
+                    with track_usage() as usage:
+                        async for served_by, delta in provider.astream_routed(message, chat_history):
+                            if first_token is None:
+                                first_token = time.perf_counter() - started
+                            parts.append(delta)
+                            yield {"chunk": delta}
+                    record_generation(
+                        served_by, time.perf_counter() - started, count_text_tokens("".join(parts)), ttft=first_token
+                    )
+                record_usage(served_by, usage)
+                usage = usage_report(usage, prefix_messages)
+                await session_store.update(
+                    user_id, session_id, prompt_prefix=next_prefix(digest, chat_history, message, "".join(parts))
+                )
+                if cache_key:
+                    response_cache.set(cache_key, parts)
+            full_response = "".join(parts)
+
+            await session_store.append_messages(
+                user_id,
+                session_id,
+                [{"role": "user", "content": message}, {"role": "assistant", "content": full_response}],
+            )
+            await _persist_turn(session, session_id, message, full_response)
+            yield {"done": True, "cached": cached is not None, "served_by": served_by, "usage": usage}
 
         except Exception as exc:  # pragma: no cover - keep streaming resilient
             yield {"error": str(exc)}
 
-    async def event_stream():
-        async for payload in generate():
-            yield json.dumps(payload) + "\n"
+    # Deltas are merged into fewer, larger lines/events before they are written
+    return stream_response(generate(), format=format, coalesce=True)
+
+
+@router.post("/chat/batch")
+async def chat_batch(request_data: BatchChatRequest, user=Depends(get_current_user)):
+    """Run independent prompts concurrently and stream results as NDJSON in completion order.
+
+    Each result line carries the prompt's index. Batch prompts do not add to
+    the session's chat history.
+    """
+    prompts = request_data.prompts
+    if not prompts:
+        raise HTTPException(status_code=400, detail="At least one prompt is required")
+    if len(prompts) > settings.batch_max_prompts:
+        raise HTTPException(status_code=400, detail=f"At most {settings.batch_max_prompts} prompts per batch")
+
+    user_id = require_user_id(user)
+    if request_data.provider:
+        if not request_data.api_key or not request_data.model:
+            raise HTTPException(status_code=400, detail="Missing required fields: provider, api_key, model")
+        provider = _build_provider(request_data.provider, request_data.api_key, request_data.model)
+        owns_provider = True
+    else:
+        session = await session_store.get(user_id, request_data.session_id)
+        if not session:
+            raise HTTPException(status_code=400, detail="Session not configured. Please configure first.")
+        provider = session["provider"]
+        owns_provider = False
+
+    history = request_data.history or []
+    parallelism = asyncio.Semaphore(max(1, min(request_data.concurrency, settings.batch_max_concurrency)))
+
+    async def run_one(index: int, message: str) -> Dict:
+        async with parallelism:
+            try:
+                chat_history = await context_window.build(provider, message, history)
+                cache_key = response_cache.key(user_id, provider, message, chat_history) if request_data.cache else None
+                cached = response_cache.get(cache_key) if cache_key else None
+                if cached is not None:
+                    return {"index": index, "response": "".join(cached), "cached": True, "served_by": "cache"}
+                reply, served_by = await scheduler.submit(
+                    user_id, provider, lambda: _timed_chat(provider, message, chat_history)
+                )
+                if cache_key:
+                    response_cache.set(cache_key, [reply])
+                return {"index": index, "response": reply, "served_by": served_by}
+            except Exception as exc:
+                return {"index": index, "error": str(exc)}
+
+    async def results():
+        tasks = [asyncio.create_task(run_one(index, message)) for index, message in enumerate(prompts)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+            yield {"done": True, "count": len(tasks)}
+        finally:
+            # Client went away or the batch finished: stop any remaining upstream calls
+            for task in tasks:
+                task.cancel()
+            if owns_provider:
+                provider.close()
 
-    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+    return stream_response(results())
 
 
 @router.get("/history", response_model=HistoryResponse)
-def get_history(session_id: str = "default", user=Depends(get_current_user)):
-    user_id = _require_user_id(user)
-    session = session_store.get(user_id, session_id)
+async def get_history(
+    session_id: str = "default",
+    cursor: int | None = Query(default=None, ge=0, description="Position of the first message to return"),
+    limit: int | None = Query(default=None, ge=1, le=1000),
+    format: str = Query(default="json", pattern="^(json|ndjson)$"),
+    user=Depends(get_current_user),
+):
+    user_id = require_user_id(user)
+    session = await session_store.get(user_id, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    return HistoryResponse(session_id=session_id, history=session["chat_history"])
+    # Cursors are absolute message positions, so they stay valid when the
+    # store trims old turns from the head of the history.
+    chat_history = session["chat_history"]
+    offset = session.get("history_offset", 0)
+    start = max((offset if cursor is None else cursor) - offset, 0)
+    end = len(chat_history) if limit is None else min(start + limit, len(chat_history))
+
+    # Copied up front: the ndjson body is sent after this handler returns, and a
+    # concurrent append or trim would shift a lazy slice of the live history
+    messages = [message_dict(message) for message in chat_history[start:end]]
+    if format == "ndjson":
+        return StreamingResponse(ndjson_lines(messages), media_type="application/x-ndjson")
+
+    # Encoded directly: the store's messages are already role/content strings,
+    # so validating each one through HistoryResponse would only cost time
+    next_cursor = offset + end if end < len(chat_history) else None
+    body = {"session_id": session_id, "history": messages, "next_cursor": next_cursor}
+    return Response(content=dumps(body), media_type="application/json")
 
 
 @router.post("/clear")
-def clear_history(request_data: ClearRequest, user=Depends(get_current_user)):
+async def clear_history(request_data: ClearRequest, user=Depends(get_current_user)):
     session_id = request_data.session_id
-    user_id = _require_user_id(user)
-    session = session_store.get(user_id, session_id)
+    user_id = require_user_id(user)
+    session = await session_store.get(user_id, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    session_store.clear_history(user_id, session_id)
+    await session_store.clear_history(user_id, session_id)
     return {"message": "History cleared", "session_id": session_id}
 
 
 @router.get("/sessions", response_model=SessionsResponse)
-def list_sessions(user=Depends(get_current_user)):
-    user_id = _require_user_id(user)
-    session_list = [SessionInfo(**session) for session in session_store.list_sessions(user_id)]
+async def list_sessions(user=Depends(get_current_user)):
+    user_id = require_user_id(user)
+    session_list = [SessionInfo(**session) for session in await session_store.list_sessions(user_id)]
     return SessionsResponse(sessions=session_list)
@@ -1,8 +1,32 @@
-from fastapi import APIRouter
+import secrets
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from src.app.core.config import settings
+from src.app.core.metrics import registry
 
 router = APIRouter(tags=["Health"])
 
+_LOOPBACK = {"127.0.0.1", "::1", "localhost"}
+
 
 @router.get("/health")
 def health():
     return {"status": "healthy"}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics(request: Request):
+    """Prometheus text exposition of the process's metrics.
+
+    Requires `Authorization: Bearer <METRICS_TOKEN>` when METRICS_TOKEN is
+    set; otherwise only loopback clients are served.
+    """
+    if settings.metrics_token:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not secrets.compare_digest(token, settings.metrics_token):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    elif request.client is None or request.client.host not in _LOOPBACK:
+        raise HTTPException(status_code=403, detail="Set METRICS_TOKEN to scrape metrics remotely")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
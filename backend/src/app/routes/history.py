@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from src.app.core.fast_json import dumps
+from src.app.core.supabase_client import get_current_user, require_user_id
+from src.app.services.async_database import get_async_db_service
+
+router = APIRouter(prefix="/api/db", tags=["History"])
+
+
+@router.get("/sessions")
+async def list_chat_sessions(
+    limit: int = Query(default=50, ge=1, le=200),
+    cursor: str | None = None,
+    user=Depends(get_current_user),
+):
+    """Page through the user's saved chat sessions, most recent first."""
+    user_id = require_user_id(user)
+    db = await get_async_db_service()
+    return await db.get_user_chat_sessions_page(user_id, limit=limit, cursor=cursor)
+
+
+@router.get("/sessions/{session_id}/messages")
+async def list_session_messages(
+    session_id: str,
+    limit: int = Query(default=100, ge=1, le=1000),
+    cursor: str | None = None,
+    format: str = Query(default="json", pattern="^(json|ndjson)$"),
+    user=Depends(get_current_user),
+):
+    """Page through a saved session's messages, or stream all of them as NDJSON."""
+    user_id = require_user_id(user)
+    db = await get_async_db_service()
+    if not await db.get_chat_session(user_id, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    if format == "ndjson":
+        async def event_stream():
+            async for message in db.iter_session_messages(session_id, page_size=limit):
+                yield dumps(message) + b"\n"
+
+        return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+    return await db.get_session_messages_page(session_id, limit=limit, cursor=cursor)
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, Query
+
+from src.app.core.config import settings
+from src.app.core.supabase_client import get_current_user, require_user_id
+from src.app.services.pagination import encode_cursor
+from src.app.services.search_index import search_index
+from src.app.services.session_store import session_store
+
+router = APIRouter(prefix="/api", tags=["Search"])
+
+
+async def _saved_messages(user_id: str, cursor: str | None):
+    """Saved chat_messages rows after `cursor`, each with the cursor that resumes after it"""
+    from src.app.services.async_database import get_async_db_service
+
+    db = await get_async_db_service()
+    while True:
+        page = await db.get_user_messages_page(user_id, cursor=cursor)
+        for row in page["messages"]:
+            yield row["session_id"], row["role"], row["content"] or "", row["created_at"], encode_cursor(
+                row["created_at"], row["id"]
+            )
+        cursor = page["next_cursor"]
+        if not cursor:
+            return
+
+
+@router.get("/search")
+async def search_history(
+    q: str = Query(min_length=1, max_length=500),
+    session_id: str | None = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: int = Query(default=0, ge=0, description="Rank of the first result to return"),
+    user=Depends(get_current_user),
+):
+    """BM25-ranked search over the user's live sessions and saved messages."""
+    user_id = require_user_id(user)
+    await search_index.sync(
+        user_id, session_store.user_histories, _saved_messages if settings.persist_messages else None
+    )
+    return {"query": q, **search_index.search(user_id, q, limit=limit, cursor=cursor, session_id=session_id)}
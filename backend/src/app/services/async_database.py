@@ -0,0 +1,453 @@
+"""
+Async database service layer for Supabase CRUD operations
+Mirrors DatabaseService on the async Supabase client, using upserts and multi-row
+statements so each operation is a single PostgREST round trip
+"""
+
+from datetime import datetime
+from typing import Optional, List, Dict, Any, AsyncIterator
+from fastapi import HTTPException
+from supabase._async.client import AsyncClient
+
+from ..core.supabase_client import get_async_supabase_client
+from ..core.metrics import db_call_duration, instrument_methods
+from .pagination import keyset_filter, page_result
+from .user_data_cache import user_data_cache
+
+
+@instrument_methods(db_call_duration)
+class AsyncDatabaseService:
+    """Async service for all database operations"""
+
+    def __init__(self, supabase: AsyncClient):
+        self.supabase = supabase
+
+    # ==================== USER SETTINGS ====================
+    async def get_user_settings(self, user_id: str) -> Dict[str, Any]:
+        """Get user settings (read through the per-process cache)"""
+        cached = user_data_cache.settings.get(user_id)
+        if cached is not None:
+            return cached
+        try:
+            response = await self.supabase.table("user_settings").select("*").eq("user_id", user_id).single().execute()
+            if response.data is not None:
+                user_data_cache.settings.set(user_id, response.data)
+            return response.data
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch user settings: {str(e)}")
+
+    async def update_user_settings(
+        self, user_id: str, default_temperature: float = None, default_max_tokens: int = None,
+        sidebar_collapsed: bool = None
+    ) -> Dict[str, Any]:
+        """Update user settings"""
+        try:
+            update_data = {"updated_at": datetime.utcnow().isoformat()}
+            if default_temperature is not None:
+                update_data["default_temperature"] = default_temperature
+            if default_max_tokens is not None:
+                update_data["default_max_tokens"] = default_max_tokens
+            if sidebar_collapsed is not None:
+                update_data["sidebar_collapsed"] = sidebar_collapsed
+
+            response = await (
+                self.supabase.table("user_settings")
+                .update(update_data)
+                .eq("user_id", user_id)
+                .execute()
+            )
+            user_data_cache.invalidate_settings(user_id)
+            return response.data[0] if response.data else {}
+        except Exception as e:
+            user_data_cache.invalidate_settings(user_id)
+            raise HTTPException(status_code=500, detail=f"Failed to update user settings: {str(e)}")
+
+    # ==================== API KEYS ====================
+    async def get_user_api_keys(self, user_id: str) -> List[Dict[str, Any]]:
+        """Get all API keys for a user (read through the per-process cache)"""
+        cached = user_data_cache.api_keys.get(user_id)
+        if cached is not None:
+            return cached
+        try:
+            response = await (
+                self.supabase.table("user_api_keys")
+                .select("id, provider, is_active, created_at, updated_at")
+                .eq("user_id", user_id)
+                .execute()
+            )
+            if response.data is not None:
+                user_data_cache.api_keys.set(user_id, response.data)
+            return response.data
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch API keys: {str(e)}")
+
+    async def get_api_key_by_provider(self, user_id: str, provider: str) -> Optional[Dict[str, Any]]:
+        """Get a specific API key by provider (read through the per-process cache)"""
+        cached = user_data_cache.api_key_by_provider.get((user_id, provider))
+        if cached is not None:
+            return cached
+        try:
+            response = await (
+                self.supabase.table("user_api_keys")
+                .select("*")
+                .eq("user_id", user_id)
+                .eq("provider", provider)
+                .eq("is_active", True)
+                .single()
+                .execute()
+            )
+            # Only hits are cached; misses and errors are retried on the next read
+            if response.data:
+                user_data_cache.api_key_by_provider.set((user_id, provider), response.data)
+            return response.data
+        except Exception:
+            return None
+
+    async def save_api_key(self, user_id: str, provider: str, api_key: str) -> Dict[str, Any]:
+        """Save or update an API key (single upsert on the user/provider unique key)"""
+        try:
+            response = await (
+                self.supabase.table("user_api_keys")
+                .upsert(
+                    {
+                        "user_id": user_id,
+                        "provider": provider,
+                        "api_key": api_key,
+                        "is_active": True,
+                        "updated_at": datetime.utcnow().isoformat()
+                    },
+                    on_conflict="user_id,provider",
+                )
+                .execute()
+            )
+            user_data_cache.invalidate_api_keys(user_id, [provider])
+            return response.data[0] if response.data else {}
+        except Exception as e:
+            user_data_cache.invalidate_api_keys(user_id, [provider])
+            raise HTTPException(status_code=500, detail=f"Failed to save API key: {str(e)}")
+
+    async def delete_api_key(self, user_id: str, api_key_id: str) -> Dict[str, Any]:
+        """Delete an API key"""
+        try:
+            response = await (
+                self.supabase.table("user_api_keys")
+                .delete()
+                .eq("id", api_key_id)
+                .eq("user_id", user_id)
+                .execute()
+            )
+            # The delete returns the removed rows, which name the provider entry to drop
+            user_data_cache.invalidate_api_keys(user_id, [row["provider"] for row in response.data or []])
+            return {"message": "API key deleted successfully"}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to delete API key: {str(e)}")
+
+    # ==================== CHAT SESSIONS ====================
+    async def create_chat_session(self, user_id: str, title: str = "New Chat", model_used: str = None) -> Dict[str, Any]:
+        """Create a new chat session"""
+        try:
+            response = await (
+                self.supabase.table("chat_sessions")
+                .insert({
+                    "user_id": user_id,
+                    "title": title,
+                    "model_used": model_used
+                })
+                .execute()
+            )
+            return response.data[0] if response.data else {}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to create chat session: {str(e)}")
+
+    async def get_chat_session(self, user_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get a specific chat session"""
+        try:
+            response = await (
+                self.supabase.table("chat_sessions")
+                .select("*")
+                .eq("user_id", user_id)
+                .eq("id", session_id)
+                .single()
+                .execute()
+            )
+            return response.data
+        except Exception:
+            return None
+
+    async def get_user_chat_sessions(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Get all chat sessions for a user (ordered by most recent)"""
+        try:
+            response = await (
+                self.supabase.table("chat_sessions")
+                .select("id, title, model_used, created_at, last_message_at, message_count, is_archived")
+                .eq("user_id", user_id)
+                .eq("is_archived", False)
+                .order("last_message_at", desc=True)
+                .limit(limit)
+                .execute()
+            )
+            return response.data
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch chat sessions: {str(e)}")
+
+    async def get_user_chat_sessions_page(self, user_id: str, limit: int = 50, cursor: str = None) -> Dict[str, Any]:
+        """Get one page of a user's chat sessions, most recent first, keyed on (last_message_at, id)"""
+        try:
+            query = (
+                self.supabase.table("chat_sessions")
+                .select("id, title, model_used, created_at, last_message_at, message_count, is_archived")
+                .eq("user_id", user_id)
+                .eq("is_archived", False)
+            )
+            if cursor:
+                query = query.or_(keyset_filter("last_message_at", cursor, desc=True))
+            response = await (
+                query.order("last_message_at", desc=True)
+                .order("id", desc=True)
+                .limit(limit + 1)
+                .execute()
+            )
+            return page_result(response.data or [], limit, "last_message_at", "sessions")
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch chat sessions: {str(e)}")
+
+    async def update_chat_session(
+        self, user_id: str, session_id: str, title: str = None, model_used: str = None
+    ) -> Dict[str, Any]:
+        """Update a chat session"""
+        try:
+            update_data = {"updated_at": datetime.utcnow().isoformat()}
+            if title:
+                update_data["title"] = title
+            if model_used:
+                update_data["model_used"] = model_used
+
+            response = await (
+                self.supabase.table("chat_sessions")
+                .update(update_data)
+                .eq("user_id", user_id)
+                .eq("id", session_id)
+                .execute()
+            )
+            return response.data[0] if response.data else {}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to update chat session: {str(e)}")
+
+    async def archive_chat_sessions(self, user_id: str, session_ids: List[str]) -> List[Dict[str, Any]]:
+        """Archive one or more chat sessions (soft delete) in one request"""
+        if not session_ids:
+            return []
+        try:
+            response = await (
+                self.supabase.table("chat_sessions")
+                .update({
+                    "is_archived": True,
+                    "updated_at": datetime.utcnow().isoformat()
+                })
+                .eq("user_id", user_id)
+                .in_("id", session_ids)
+                .execute()
+            )
+            return response.data or []
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to archive chat sessions: {str(e)}")
+
+    async def archive_chat_session(self, user_id: str, session_id: str) -> Dict[str, Any]:
+        """Archive a chat session (soft delete)"""
+        archived = await self.archive_chat_sessions(user_id, [session_id])
+        return archived[0] if archived else {}
+
+    async def delete_chat_sessions(self, user_id: str, session_ids: List[str]) -> Dict[str, Any]:
+        """Permanently delete chat sessions and all their messages in one request"""
+        if not session_ids:
+            return {"message": "No chat sessions to delete"}
+        try:
+            await (
+                self.supabase.table("chat_sessions")
+                .delete()
+                .eq("user_id", user_id)
+                .in_("id", session_ids)
+                .execute()
+            )
+            return {"message": "Chat sessions deleted successfully"}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to delete chat sessions: {str(e)}")
+
+    async def delete_chat_session(self, user_id: str, session_id: str) -> Dict[str, Any]:
+        """Permanently delete a chat session and all its messages"""
+        await self.delete_chat_sessions(user_id, [session_id])
+        return {"message": "Chat session deleted successfully"}
+
+    # ==================== CHAT MESSAGES ====================
+    async def save_message(
+        self, session_id: str, role: str, content: str, model: str = None, tokens_used: int = None,
+        metadata: Dict = None
+    ) -> Dict[str, Any]:
+        """Save a message to a chat session"""
+        saved = await self.save_messages([{
+            "session_id": session_id,
+            "role": role,
+            "content": content,
+            "model": model,
+            "tokens_used": tokens_used,
+            "metadata": metadata
+        }])
+        return saved[0] if saved else {}
+
+    async def save_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Save many messages (possibly across sessions) in a single insert
+
+        chat_sessions.message_count and last_message_at are maintained by
+        database triggers on insert, so no session update is needed.
+        """
+        if not messages:
+            return []
+        try:
+            response = await self.supabase.table("chat_messages").insert(messages).execute()
+            return response.data or []
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to save messages: {str(e)}")
+
+    async def get_session_messages(self, session_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Get all messages for a session"""
+        try:
+            response = await (
+                self.supabase.table("chat_messages")
+                .select("*")
+                .eq("session_id", session_id)
+                .order("created_at", desc=False)
+                .limit(limit)
+                .execute()
+            )
+            return response.data
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch messages: {str(e)}")
+
+    async def get_session_messages_page(self, session_id: str, limit: int = 100, cursor: str = None) -> Dict[str, Any]:
+        """Get one page of a session's messages, oldest first, keyed on (created_at, id)"""
+        try:
+            query = self.supabase.table("chat_messages").select("*").eq("session_id", session_id)
+            if cursor:
+                query = query.or_(keyset_filter("created_at", cursor, desc=False))
+            response = await (
+                query.order("created_at", desc=False)
+                .order("id", desc=False)
+                .limit(limit + 1)
+                .execute()
+            )
+            return page_result(response.data or [], limit, "created_at", "messages")
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch messages: {str(e)}")
+
+    async def iter_session_messages(self, session_id: str, page_size: int = 500) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every message of a session page by page, holding one page in memory at a time"""
+        cursor = None
+        while True:
+            page = await self.get_session_messages_page(session_id, limit=page_size, cursor=cursor)
+            for message in page["messages"]:
+                yield message
+            cursor = page["next_cursor"]
+            if not cursor:
+                return
+
+    async def get_user_messages_page(self, user_id: str, limit: int = 500, cursor: str = None) -> Dict[str, Any]:
+        """Get one page of messages across all of a user's sessions, oldest first, keyed on (created_at, id)"""
+        try:
+            query = (
+                self.supabase.table("chat_messages")
+                .select("id, session_id, role, content, created_at, chat_sessions!inner(user_id)")
+                .eq("chat_sessions.user_id", user_id)
+            )
+            if cursor:
+                query = query.or_(keyset_filter("created_at", cursor, desc=False))
+            response = await (
+                query.order("created_at", desc=False)
+                .order("id", desc=False)
+                .limit(limit + 1)
+                .execute()
+            )
+            return page_result(response.data or [], limit, "created_at", "messages")
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch messages: {str(e)}")
+
+    async def update_message(self, message_id: str, content: str = None, metadata: Dict = None) -> Dict[str, Any]:
+        """Update a message"""
+        try:
+            update_data = {}
+            if content:
+                update_data["content"] = content
+            if metadata:
+                update_data["metadata"] = metadata
+
+            response = await (
+                self.supabase.table("chat_messages")
+                .update(update_data)
+                .eq("id", message_id)
+                .execute()
+            )
+            return response.data[0] if response.data else {}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to update message: {str(e)}")
+
+    async def delete_messages(self, user_id: str, session_id: str, message_ids: List[str]) -> Dict[str, Any]:
+        """Delete many of one session's messages in one request; the session must belong to the user"""
+        if not message_ids:
+            return {"message": "No messages to delete"}
+        try:
+            # chat_messages has no user_id column, so ownership is checked on the session
+            owner = await (
+                self.supabase.table("chat_sessions")
+                .select("id")
+                .eq("user_id", user_id)
+                .eq("id", session_id)
+                .execute()
+            )
+            if not owner.data:
+                raise HTTPException(status_code=404, detail="Chat session not found")
+            await (
+                self.supabase.table("chat_messages")
+                .delete()
+                .eq("session_id", session_id)
+                .in_("id", message_ids)
+                .execute()
+            )
+            return {"message": f"{len(message_ids)} messages deleted successfully"}
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to delete messages: {str(e)}")
+
+    async def delete_message(self, user_id: str, session_id: str, message_id: str) -> Dict[str, Any]:
+        """Delete a message"""
+        await self.delete_messages(user_id, session_id, [message_id])
+        return {"message": "Message deleted successfully"}
+
+    async def clear_session_messages(self, session_id: str) -> Dict[str, Any]:
+        """Delete all messages in a session"""
+        try:
+            await (
+                self.supabase.table("chat_messages")
+                .delete()
+                .eq("session_id", session_id)
+                .execute()
+            )
+            return {"message": "All messages cleared"}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to clear messages: {str(e)}")
+
+
+_async_db_service: AsyncDatabaseService | None = None
+
+
+async def get_async_db_service() -> AsyncDatabaseService:
+    """Return the shared async service, creating its Supabase client on first use"""
+    global _async_db_service
+    if _async_db_service is None:
+        _async_db_service = AsyncDatabaseService(await get_async_supabase_client())
+    return _async_db_service
@@ -0,0 +1,190 @@
+import hashlib
+from typing import Dict, List, Optional
+
+from src.app.core.config import settings
+from src.app.services.scheduler import scheduler
+from src.providers.messages import ChatMessage
+
+try:  # Optional: exact BPE counts when tiktoken is installed
+    import tiktoken
+except ImportError:  # pragma: no cover - fall back to a character heuristic
+    tiktoken = None
+
+# Per-message framing overhead (role markers, separators) in chat formats
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Context windows by model-name prefix; the longest matching prefix wins
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4.1": 1000000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "o1": 128000,
+    "o3": 200000,
+    "claude": 200000,
+    "gemini-1.5": 1000000,
+    "gemini-2": 1000000,
+    "gemini": 32000,
+    "groq/": 8192,
+    "llama-3.1": 128000,
+    "llama-3.3": 128000,
+    "llama": 8192,
+    "mixtral": 32768,
+    "gemma": 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation so it can continue after older turns are dropped.\n"
+    "Current summary:\n{summary}\n\n"
+    "Newly dropped turns:\n{turns}\n\n"
+    "Return an updated summary that keeps names, facts, decisions and open questions. "
+    "Reply with the summary only."
+)
+
+_encoder = None
+
+
+def count_text_tokens(text: str) -> int:
+    global _encoder
+    if tiktoken is not None:
+        if _encoder is None:
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        return len(_encoder.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def count_tokens(message: Dict) -> int:
+    """Token count of a history message, cached on session store ChatMessage records.
+
+    Plain dicts may be client request data, so they are never written to.
+    """
+    count = message.get("token_count")
+    if count is None:
+        count = count_text_tokens(str(message.get("content", ""))) + MESSAGE_OVERHEAD_TOKENS
+        if isinstance(message, ChatMessage):
+            message.token_count = count
+    return count
+
+
+def _message_digest(message: Dict) -> str:
+    return hashlib.sha1(f"{message.get('role')}\0{message.get('content')}".encode("utf-8")).hexdigest()
+
+
+def context_window_for(model: str) -> int:
+    model = model.lower()
+    best = ""
+    for prefix in MODEL_CONTEXT_WINDOWS:
+        if model.startswith(prefix) and len(prefix) > len(best):
+            best = prefix
+    return MODEL_CONTEXT_WINDOWS[best] if best else DEFAULT_CONTEXT_WINDOW
+
+
+class ContextWindow:
+    """Fit chat history into a per-model token budget.
+
+    The most recent turns that fit are kept. With `summarize` enabled, turns
+    that fall out of the window are folded into a running summary kept in the
+    session, and only turns dropped since the last update are sent to the
+    summarizer.
+    """
+
+    def __init__(self, max_tokens: int = 0, reserve_tokens: int = 1024, summarize: bool = False) -> None:
+        self.max_tokens = max_tokens
+        self.reserve_tokens = reserve_tokens
+        self.summarize = summarize
+
+    def budget_for(self, model: str) -> int:
+        window = context_window_for(model)
+        if self.max_tokens:
+            window = min(window, self.max_tokens)
+        return max(window - self.reserve_tokens, 0)
+
+    def window_start(self, history: List[Dict], budget: int) -> int:
+        """Index of the oldest message that still fits, always landing on a user turn."""
+        used = 0
+        start = len(history)
+        while start > 0:
+            cost = count_tokens(history[start - 1])
+            if used + cost > budget:
+                break
+            used += cost
+            start -= 1
+        while start < len(history) and history[start].get("role") != "user":
+            start += 1
+        return start
+
+    async def build(
+        self, provider, message: str, history: List[Dict], state: Optional[Dict] = None, user_id: str = ""
+    ) -> List[Dict]:
+        """Return the history to pass to the provider for this turn.
+
+        Summarizer calls go through the scheduler as `user_id`'s, like the turn itself.
+        """
+        budget = self.budget_for(provider.model) - count_text_tokens(message) - MESSAGE_OVERHEAD_TOKENS
+        start = self.window_start(history, budget)
+        if start == 0:
+            return history
+        if not self.summarize or state is None:
+            return history[start:]
+
+        text = await self._update_summary(provider, history, start, state, user_id)
+        if not text:
+            return history[start:]
+        summary_messages = self._summary_messages(text)
+        budget -= sum(count_tokens(msg) for msg in summary_messages)
+        return summary_messages + history[self.window_start(history, budget):]
+
+    async def _update_summary(self, provider, history: List[Dict], start: int, state: Dict, user_id: str) -> str:
+        summary = state.get("context_summary") or {}
+        text = summary.get("text", "")
+        anchor = summary.get("anchor")
+
+        # Find the last message already folded into the summary; everything
+        # between it and the window start is new and still needs folding. The
+        # recorded position is checked first since history is append-only
+        # unless the session store trimmed its head.
+        first_new = 0
+        if anchor:
+            covered = summary.get("covered", 0)
+            if 0 < covered <= start and _message_digest(history[covered - 1]) == anchor:
+                first_new = covered
+            else:
+                for index in range(start - 1, -1, -1):
+                    if _message_digest(history[index]) == anchor:
+                        first_new = index + 1
+                        break
+                else:
+                    text = ""
+        new_turns = history[first_new:start]
+        if not new_turns:
+            return text
+
+        turns = "\n".join(f"{msg.get('role')}: {msg.get('content')}" for msg in new_turns)
+        prompt = SUMMARY_PROMPT.format(summary=text or "(none)", turns=turns)
+        try:
+            text = await scheduler.submit(user_id, provider, lambda: provider.achat(prompt, []))
+        except Exception:
+            # Summarizing is best effort; plain windowing still applies
+            return summary.get("text", "")
+        state["context_summary"] = {
+            "text": text,
+            "anchor": _message_digest(history[start - 1]),
+            "covered": start,
+        }
+        return text
+
+    @staticmethod
+    def _summary_messages(text: str) -> List[Dict]:
+        return [
+            {"role": "user", "content": f"Summary of the earlier conversation:\n{text}"},
+            {"role": "assistant", "content": "Understood, I'll keep that context in mind."},
+        ]
+
+
+context_window = ContextWindow(
+    max_tokens=settings.context_max_tokens,
+    reserve_tokens=settings.context_reserve_tokens,
+    summarize=settings.context_summary_enabled,
+)
@@ -9,8 +9,12 @@ from typing import Optional, List, Dict, Any
 from fastapi import HTTPException
 
 from ..core.supabase_client import get_supabase_client
+from ..core.metrics import db_call_duration, instrument_methods
+from .pagination import keyset_filter, page_result
+from .user_data_cache import user_data_cache
 
 
+@instrument_methods(db_call_duration)
 class DatabaseService:
     """Service for all database operations"""
 
@@ -19,9 +23,14 @@ class DatabaseService:
 
     # ==================== USER SETTINGS ====================
     def get_user_settings(self, user_id: str) -> Dict[str, Any]:
-        """Get user settings"""
+        """Get user settings (read through the per-process cache)"""
+        cached = user_data_cache.settings.get(user_id)
+        if cached is not None:
+            return cached
         try:
             response = self.supabase.table("user_settings").select("*").eq("user_id", user_id).single().execute()
+            if response.data is not None:
+                user_data_cache.settings.set(user_id, response.data)
             return response.data
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to fetch user settings: {str(e)}")
@@ -46,13 +55,18 @@ class DatabaseService:
                 .eq("user_id", user_id)
                 .execute()
             )
+            user_data_cache.invalidate_settings(user_id)
             return response.data[0] if response.data else {}
         except Exception as e:
+            user_data_cache.invalidate_settings(user_id)
             raise HTTPException(status_code=500, detail=f"Failed to update user settings: {str(e)}")
 
     # ==================== API KEYS ====================
     def get_user_api_keys(self, user_id: str) -> List[Dict[str, Any]]:
-        """Get all API keys for a user"""
+        """Get all API keys for a user (read through the per-process cache)"""
+        cached = user_data_cache.api_keys.get(user_id)
+        if cached is not None:
+            return cached
         try:
             response = (
                 self.supabase.table("user_api_keys")
@@ -60,12 +74,17 @@ class DatabaseService:
                 .eq("user_id", user_id)
                 .execute()
             )
+            if response.data is not None:
+                user_data_cache.api_keys.set(user_id, response.data)
             return response.data
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to fetch API keys: {str(e)}")
 
     def get_api_key_by_provider(self, user_id: str, provider: str) -> Optional[Dict[str, Any]]:
-        """Get a specific API key by provider"""
+        """Get a specific API key by provider (read through the per-process cache)"""
+        cached = user_data_cache.api_key_by_provider.get((user_id, provider))
+        if cached is not None:
+            return cached
         try:
             response = (
                 self.supabase.table("user_api_keys")
@@ -76,39 +95,34 @@ class DatabaseService:
                 .single()
                 .execute()
             )
+            # Only hits are cached; misses and errors are retried on the next read
+            if response.data:
+                user_data_cache.api_key_by_provider.set((user_id, provider), response.data)
             return response.data
         except Exception:
             return None
 
     def save_api_key(self, user_id: str, provider: str, api_key: str) -> Dict[str, Any]:
-        """Save or update an API key"""
+        """Save or update an API key (single upsert on the user/provider unique key)"""
         try:
-            # Try to get existing key
-            existing = self.get_api_key_by_provider(user_id, provider)
-
-            if existing:
-                # Update existing
-                response = (
-                    self.supabase.table("user_api_keys")
-                    .update({"api_key": api_key, "is_active": True, "updated_at": datetime.utcnow().isoformat()})
-                    .eq("user_id", user_id)
-                    .eq("provider", provider)
-                    .execute()
-                )
-            else:
-                # Insert new
-                response = (
-                    self.supabase.table("user_api_keys")
-                    .insert({
+            response = (
+                self.supabase.table("user_api_keys")
+                .upsert(
+                    {
                         "user_id": user_id,
                         "provider": provider,
                         "api_key": api_key,
-                        "is_active": True
-                    })
-                    .execute()
+                        "is_active": True,
+                        "updated_at": datetime.utcnow().isoformat()
+                    },
+                    on_conflict="user_id,provider",
                 )
+                .execute()
+            )
+            user_data_cache.invalidate_api_keys(user_id, [provider])
             return response.data[0] if response.data else {}
         except Exception as e:
+            user_data_cache.invalidate_api_keys(user_id, [provider])
             raise HTTPException(status_code=500, detail=f"Failed to save API key: {str(e)}")
 
     def delete_api_key(self, user_id: str, api_key_id: str) -> Dict[str, Any]:
@@ -121,6 +135,8 @@ class DatabaseService:
                 .eq("user_id", user_id)
                 .execute()
             )
+            # The delete returns the removed rows, which name the provider entry to drop
+            user_data_cache.invalidate_api_keys(user_id, [row["provider"] for row in response.data or []])
             return {"message": "API key deleted successfully"}
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to delete API key: {str(e)}")
@@ -173,6 +189,29 @@ class DatabaseService:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to fetch chat sessions: {str(e)}")
 
+    def get_user_chat_sessions_page(self, user_id: str, limit: int = 50, cursor: str = None) -> Dict[str, Any]:
+        """Get one page of a user's chat sessions, most recent first, keyed on (last_message_at, id)"""
+        try:
+            query = (
+                self.supabase.table("chat_sessions")
+                .select("id, title, model_used, created_at, last_message_at, message_count, is_archived")
+                .eq("user_id", user_id)
+                .eq("is_archived", False)
+            )
+            if cursor:
+                query = query.or_(keyset_filter("last_message_at", cursor, desc=True))
+            response = (
+                query.order("last_message_at", desc=True)
+                .order("id", desc=True)
+                .limit(limit + 1)
+                .execute()
+            )
+            return page_result(response.data or [], limit, "last_message_at", "sessions")
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch chat sessions: {str(e)}")
+
     def update_chat_session(self, user_id: str, session_id: str, title: str = None, model_used: str = None) -> Dict[str, Any]:
         """Update a chat session"""
         try:
@@ -210,6 +249,25 @@ class DatabaseService:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to archive chat session: {str(e)}")
 
+    def archive_chat_sessions(self, user_id: str, session_ids: List[str]) -> List[Dict[str, Any]]:
+        """Archive many chat sessions in one request"""
+        if not session_ids:
+            return []
+        try:
+            response = (
+                self.supabase.table("chat_sessions")
+                .update({
+                    "is_archived": True,
+                    "updated_at": datetime.utcnow().isoformat()
+                })
+                .eq("user_id", user_id)
+                .in_("id", session_ids)
+                .execute()
+            )
+            return response.data or []
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to archive chat sessions: {str(e)}")
+
     def delete_chat_session(self, user_id: str, session_id: str) -> Dict[str, Any]:
         """Permanently delete a chat session and all its messages"""
         try:
@@ -244,6 +302,20 @@ class DatabaseService:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to save message: {str(e)}")
 
+    def save_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Save many messages (possibly across sessions) in a single insert
+
+        chat_sessions.message_count and last_message_at are maintained by
+        database triggers on insert, so no session update is needed.
+        """
+        if not messages:
+            return []
+        try:
+            response = self.supabase.table("chat_messages").insert(messages).execute()
+            return response.data or []
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to save messages: {str(e)}")
+
     def get_session_messages(self, session_id: str, limit: int = 100) -> List[Dict[str, Any]]:
         """Get all messages for a session"""
         try:
@@ -259,6 +331,24 @@ class DatabaseService:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to fetch messages: {str(e)}")
 
+    def get_session_messages_page(self, session_id: str, limit: int = 100, cursor: str = None) -> Dict[str, Any]:
+        """Get one page of a session's messages, oldest first, keyed on (created_at, id)"""
+        try:
+            query = self.supabase.table("chat_messages").select("*").eq("session_id", session_id)
+            if cursor:
+                query = query.or_(keyset_filter("created_at", cursor, desc=False))
+            response = (
+                query.order("created_at", desc=False)
+                .order("id", desc=False)
+                .limit(limit + 1)
+                .execute()
+            )
+            return page_result(response.data or [], limit, "created_at", "messages")
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch messages: {str(e)}")
+
     def update_message(self, message_id: str, content: str = None, metadata: Dict = None) -> Dict[str, Any]:
         """Update a message"""
         try:
@@ -291,6 +381,34 @@ class DatabaseService:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to delete message: {str(e)}")
 
+    def delete_messages(self, user_id: str, session_id: str, message_ids: List[str]) -> Dict[str, Any]:
+        """Delete many of one session's messages in one request; the session must belong to the user"""
+        if not message_ids:
+            return {"message": "No messages to delete"}
+        try:
+            # chat_messages has no user_id column, so ownership is checked on the session
+            owner = (
+                self.supabase.table("chat_sessions")
+                .select("id")
+                .eq("user_id", user_id)
+                .eq("id", session_id)
+                .execute()
+            )
+            if not owner.data:
+                raise HTTPException(status_code=404, detail="Chat session not found")
+            (
+                self.supabase.table("chat_messages")
+                .delete()
+                .eq("session_id", session_id)
+                .in_("id", message_ids)
+                .execute()
+            )
+            return {"message": f"{len(message_ids)} messages deleted successfully"}
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to delete messages: {str(e)}")
+
     def clear_session_messages(self, session_id: str) -> Dict[str, Any]:
         """Delete all messages in a session"""
         try:
@@ -305,5 +423,20 @@ class DatabaseService:
             raise HTTPException(status_code=500, detail=f"Failed to clear messages: {str(e)}")
 
 
-# Create singleton instance
-db_service = DatabaseService()
+_db_service: DatabaseService | None = None
+
+
+def get_db_service() -> DatabaseService:
+    """Return the shared service, creating its Supabase client on first use"""
+    global _db_service
+    if _db_service is None:
+        _db_service = DatabaseService()
+    return _db_service
+
+
+def __getattr__(name):
+    # Keeps `from ...database import db_service` working without building the
+    # Supabase client at import time.
+    if name == "db_service":
+        return get_db_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
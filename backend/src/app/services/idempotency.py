@@ -0,0 +1,79 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+from src.app.core.cache import TTLCache
+from src.app.core.config import settings
+
+
+def request_fingerprint(message: str, history: Optional[Sequence[Dict]]) -> str:
+    payload = [message, [[msg.get("role"), msg.get("content")] for msg in history or []]]
+    return hashlib.sha256(json.dumps(payload, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Run at most one upstream call per key and share its result.
+
+    Concurrent callers with the same key await the same task. Results of
+    calls made under an explicit Idempotency-Key are also kept for `ttl`
+    seconds so late retries get the original reply instead of a new
+    generation. The shared task is shielded: a caller that disconnects does
+    not cancel the work other callers (or its own retry) are waiting on.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0) -> None:
+        self._inflight: Dict[Hashable, Tuple[str, asyncio.Task]] = {}
+        self._completed = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.coalesced = 0
+        self.replayed = 0
+
+    async def run(
+        self,
+        key: Hashable,
+        fingerprint: str,
+        func: Callable[[], Awaitable[Any]],
+        remember: bool = False,
+    ) -> Tuple[Any, bool]:
+        """Return (result, shared) where shared is True if another call produced it."""
+        if remember:
+            completed = self._completed.get(key)
+            if completed is not None:
+                self._check_fingerprint(completed[0], fingerprint)
+                self.replayed += 1
+                return completed[1], True
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._check_fingerprint(inflight[0], fingerprint)
+            self.coalesced += 1
+            return await asyncio.shield(inflight[1]), True
+
+        task = asyncio.ensure_future(func())
+        self._inflight[key] = (fingerprint, task)
+
+        def _finish(done: asyncio.Task) -> None:
+            self._inflight.pop(key, None)
+            if remember and not done.cancelled() and done.exception() is None:
+                self._completed.set(key, (fingerprint, done.result()))
+
+        task.add_done_callback(_finish)
+        return await asyncio.shield(task), False
+
+    @staticmethod
+    def _check_fingerprint(expected: str, actual: str) -> None:
+        if expected != actual:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "inflight": len(self._inflight),
+            "completed": len(self._completed),
+            "coalesced": self.coalesced,
+            "replayed": self.replayed,
+        }
+
+
+chat_single_flight = SingleFlight(maxsize=settings.idempotency_max_entries, ttl=settings.idempotency_ttl)
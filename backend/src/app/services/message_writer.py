@@ -0,0 +1,140 @@
+"""
+Write-behind queue for chat message persistence
+Groups messages from many sessions into bulk inserts off the request path
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MessageWriteQueue:
+    """Buffer chat messages and persist them in batches.
+
+    A batch is flushed once `batch_size` rows are waiting or `flush_interval`
+    seconds after its first row arrived. At most `max_pending` rows are held;
+    beyond that `enqueue` waits, pushing back on the chat routes instead of
+    growing memory. `stop()` flushes everything still queued.
+    """
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 0.25, max_pending: int = 10000) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._db = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, db) -> None:
+        if self.running:
+            return
+        self._db = db
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def enqueue(
+        self, session_id: str, role: str, content: str, model: str = None, tokens_used: int = None,
+        metadata: Dict = None
+    ) -> None:
+        """Queue a message for persistence; waits while the queue is full"""
+        if not self.running:
+            raise RuntimeError("Message write queue is not running")
+        await self._queue.put({
+            "session_id": session_id,
+            "role": role,
+            "content": content,
+            "model": model,
+            "tokens_used": tokens_used,
+            "metadata": metadata,
+            # Stamped at enqueue time so ordering reflects the conversation, not the flush
+            "created_at": datetime.utcnow().isoformat(),
+        })
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self.pending(),
+            "batches": self.batches,
+            "written": self.written,
+            "failed": self.failed,
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            row = await self._queue.get()
+            if row is _STOP:
+                break
+            batch = [row]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+            await self._write(batch)
+
+        # Drain anything enqueued behind the stop marker
+        remaining: List[Dict[str, Any]] = []
+        while not self._queue.empty():
+            row = self._queue.get_nowait()
+            if row is not _STOP:
+                remaining.append(row)
+        for start in range(0, len(remaining), self.batch_size):
+            await self._write(remaining[start:start + self.batch_size])
+
+    async def _call(self, method: str, *args: Any) -> Any:
+        # Accept either the async service or the blocking one (run off the event loop)
+        func = getattr(self._db, method)
+        if asyncio.iscoroutinefunction(func):
+            return await func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        # chat_sessions.message_count and last_message_at are bumped by insert triggers
+        try:
+            await self._call("save_messages", batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("Failed to persist %d chat messages", len(batch))
+            return
+        self.batches += 1
+        self.written += len(batch)
+
+
+message_writer = MessageWriteQueue(
+    batch_size=settings.message_batch_size,
+    flush_interval=settings.message_flush_interval,
+    max_pending=settings.message_max_pending,
+)
@@ -0,0 +1,56 @@
+"""
+Keyset (cursor) pagination helpers for PostgREST queries
+A cursor is the (sort value, id) of the last row returned, encoded as an opaque string
+"""
+
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(sort_value: Any, row_id: Any) -> str:
+    raw = json.dumps([sort_value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return sort_value, row_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def _quote(value: Any) -> str:
+    # Double-quote values so timestamps with ':' or '+' survive PostgREST's logic-tree syntax
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def keyset_filter(column: str, cursor: str, desc: bool) -> str:
+    """PostgREST `or` filter selecting rows strictly after the cursor in (column, id) order.
+
+    NULL sort values are placed as PostgreSQL orders them by default: first
+    when descending, last when ascending.
+    """
+    sort_value, row_id = decode_cursor(cursor)
+    op = "lt" if desc else "gt"
+    if sort_value is None:
+        # Comparing with NULL matches nothing, so the NULL block is paged by id alone
+        rest = f",{column}.not.is.null" if desc else ""
+        return f"and({column}.is.null,id.{op}.{_quote(row_id)}){rest}"
+    value = _quote(sort_value)
+    keyset = f"{column}.{op}.{value},and({column}.eq.{value},id.{op}.{_quote(row_id)})"
+    return keyset if desc else f"{keyset},{column}.is.null"
+
+
+def page_result(rows: List[Dict[str, Any]], limit: int, column: str, key: str) -> Dict[str, Any]:
+    """Trim a limit+1 fetch to one page and attach the cursor for the next one"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor: Optional[str] = None
+    if has_more and rows:
+        next_cursor = encode_cursor(rows[-1][column], rows[-1]["id"])
+    return {key: rows, "next_cursor": next_cursor}
@@ -0,0 +1,40 @@
+from typing import Dict, List, Tuple
+
+from src.app.core.metrics import llm_prompt_prefix, uncached_input_tokens
+from src.providers.llm_providers import history_digest
+
+
+def match_prefix(state: Dict, history: List[Dict]) -> Tuple[int, str]:
+    """Compare this turn's history with the prompt the session sent last turn.
+
+    Returns (messages at the start of `history` that repeat the previous prompt,
+    digest of `history`). A repeated prefix is what provider prompt caches can
+    serve; a mismatch means the context window slid or the history was replaced.
+    """
+    digest = history_digest(history)
+    previous = state.get("prompt_prefix")
+    if not previous:
+        return 0, digest
+
+    length = previous["length"]
+    if length == len(history):
+        matched = digest == previous["digest"]
+    else:
+        matched = length < len(history) and history_digest(history[:length]) == previous["digest"]
+    llm_prompt_prefix.inc(result="hit" if matched else "miss")
+    return (length if matched else 0), digest
+
+
+def next_prefix(digest: str, history: List[Dict], message: str, reply: str) -> Dict:
+    """The prompt_prefix state to store once `message` has been answered with `reply`"""
+    turn = [{"role": "user", "content": message}, {"role": "assistant", "content": reply}]
+    return {"digest": history_digest(turn, digest), "length": len(history) + len(turn)}
+
+
+def usage_report(usage: Dict[str, int], prefix_messages: int) -> Dict[str, int]:
+    """Per-turn token usage as returned to clients"""
+    return {
+        **usage,
+        "uncached_input_tokens": uncached_input_tokens(usage),
+        "prefix_messages": prefix_messages,
+    }
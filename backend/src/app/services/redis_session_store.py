@@ -0,0 +1,296 @@
+import json
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.app.services.search_index import SearchIndex
+from src.app.services.session_store import SessionStore
+from src.providers.factory import provider_from_config
+from src.providers.messages import ChatMessage, compact_message
+
+# Session fields kept as integers so scripts can HINCRBY them; everything else is JSON
+_COUNTERS = ("history_bytes", "history_offset")
+
+# KEYS: session hash, history list. ARGV: max history bytes, idle ttl, entries.
+# Entries are "<content bytes>:<role>:<message json>" so trimming needs no JSON decoding.
+# Returns {dropped, history_offset, history length}, or {-1, 0, 0} for an expired session.
+_APPEND_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return {-1, 0, 0} end
+local max_bytes = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+local added = 0
+for i = 3, #ARGV do
+    redis.call('RPUSH', KEYS[2], ARGV[i])
+    added = added + tonumber(string.match(ARGV[i], '^(%d+):'))
+end
+local total = redis.call('HINCRBY', KEYS[1], 'history_bytes', added)
+local dropped = 0
+if max_bytes > 0 and total > max_bytes then
+    local excess = total - max_bytes
+    local freed = 0
+    local length = redis.call('LLEN', KEYS[2])
+    -- Drop the oldest turns, then keep the window starting on a user turn
+    while dropped < length do
+        local size, role = string.match(redis.call('LINDEX', KEYS[2], 0), '^(%d+):([^:]*):')
+        if freed >= excess and role == 'user' then break end
+        redis.call('LPOP', KEYS[2])
+        freed = freed + tonumber(size)
+        dropped = dropped + 1
+    end
+    redis.call('HINCRBY', KEYS[1], 'history_bytes', -freed)
+    redis.call('HINCRBY', KEYS[1], 'history_offset', dropped)
+end
+if ttl > 0 then
+    redis.call('EXPIRE', KEYS[1], ttl)
+    redis.call('EXPIRE', KEYS[2], ttl)
+end
+local offset = tonumber(redis.call('HGET', KEYS[1], 'history_offset') or '0')
+return {dropped, offset, redis.call('LLEN', KEYS[2])}
+"""
+
+# KEYS: session hash, history list
+_CLEAR_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+local length = redis.call('LLEN', KEYS[2])
+redis.call('DEL', KEYS[2])
+redis.call('HINCRBY', KEYS[1], 'history_offset', length)
+redis.call('HSET', KEYS[1], 'history_bytes', 0)
+redis.call('HDEL', KEYS[1], 'context_summary', 'prompt_prefix')
+return length
+"""
+
+# KEYS: session hash. ARGV: field, value pairs. Never recreates an expired session.
+_UPDATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return 1
+"""
+
+
+def _encode_message(message: Dict) -> str:
+    size = len(str(message.get("content", "")).encode("utf-8"))
+    if isinstance(message, ChatMessage):
+        message = message.to_dict()
+    return f"{size}:{message.get('role', '')}:{json.dumps(message)}"
+
+
+def _decode_message(entry: str):
+    return compact_message(json.loads(entry.split(":", 2)[2]))
+
+
+class RedisSessionStore(SessionStore):
+    """Session storage shared by every worker through Redis.
+
+    Each session is a hash holding its provider config, counters and state,
+    plus a list of messages; a per-user set indexes session ids. Provider
+    objects cannot be shared, so each worker rebuilds them from the stored
+    config on first use and keeps up to `provider_cache_size` of them,
+    rebuilding when the session is reconfigured elsewhere. `idle_ttl` is
+    applied as a Redis expiry refreshed on access; bound the total number of
+    sessions with Redis' own `maxmemory` policy. Requires the `redis` package.
+    Appends and clears made through this worker update `search_index`; other
+    workers' changes reach it when it next syncs.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        prefix: str = "llmchat:session",
+        max_history_bytes: int = 0,
+        idle_ttl: float = 0,
+        provider_cache_size: int = 0,
+        provider_factory: Callable[[Dict], object] = provider_from_config,
+        client: Any = None,
+        search_index: Optional[SearchIndex] = None,
+    ) -> None:
+        if client is None:
+            import redis.asyncio as redis
+
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self._redis = client
+        self.prefix = prefix
+        self.max_history_bytes = max_history_bytes
+        self.idle_ttl = int(idle_ttl)
+        self.provider_cache_size = provider_cache_size
+        self.provider_factory = provider_factory
+        self.search_index = search_index
+        self._providers: "OrderedDict[str, tuple]" = OrderedDict()
+        self._append = client.register_script(_APPEND_SCRIPT)
+        self._clear = client.register_script(_CLEAR_SCRIPT)
+        self._update = client.register_script(_UPDATE_SCRIPT)
+        self.provider_builds = 0
+        self.trimmed_messages = 0
+
+    def _session_key(self, user_id: str, session_id: str) -> str:
+        return f"{self.prefix}:s:{user_id}:{session_id}"
+
+    def _history_key(self, user_id: str, session_id: str) -> str:
+        return f"{self.prefix}:h:{user_id}:{session_id}"
+
+    def _user_key(self, user_id: str) -> str:
+        return f"{self.prefix}:u:{user_id}"
+
+    async def create_or_update(
+        self, user_id: str, session_id: str, provider: object, config: Dict, **state: Any
+    ) -> None:
+        session_key = self._session_key(user_id, session_id)
+        history_key = self._history_key(user_id, session_id)
+        user_key = self._user_key(user_id)
+        version = uuid.uuid4().hex
+        fields = {name: json.dumps(value) for name, value in state.items()}
+        fields.update(
+            config=json.dumps(config),
+            version=json.dumps(version),
+            provider_name=json.dumps(provider.__class__.__name__),
+            history_bytes=0,
+            history_offset=0,
+        )
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(session_key, history_key)
+            pipe.hset(session_key, mapping=fields)
+            pipe.sadd(user_key, session_id)
+            if self.idle_ttl:
+                pipe.expire(session_key, self.idle_ttl)
+                pipe.expire(user_key, self.idle_ttl)
+            await pipe.execute()
+        self._cache_provider(session_key, version, provider)
+
+    async def get(self, user_id: str, session_id: str) -> Optional[Dict]:
+        session_key = self._session_key(user_id, session_id)
+        history_key = self._history_key(user_id, session_id)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(session_key)
+            pipe.lrange(history_key, 0, -1)
+            if self.idle_ttl:
+                pipe.expire(session_key, self.idle_ttl)
+                pipe.expire(history_key, self.idle_ttl)
+                pipe.expire(self._user_key(user_id), self.idle_ttl)
+            fields, entries, *_ = await pipe.execute()
+        if not fields:
+            await self._forget(user_id, session_id)
+            return None
+
+        session = {
+            name: int(value) if name in _COUNTERS else json.loads(value) for name, value in fields.items()
+        }
+        version = session.pop("version")
+        session.pop("provider_name", None)
+        session.update(
+            user_id=user_id,
+            session_id=session_id,
+            provider=self._provider(session_key, version, session["config"]),
+            chat_history=[_decode_message(entry) for entry in entries],
+        )
+        return session
+
+    async def update(self, user_id: str, session_id: str, **state: Any) -> None:
+        if not state:
+            return
+        args = []
+        for name, value in state.items():
+            args += [name, json.dumps(value)]
+        await self._update(keys=[self._session_key(user_id, session_id)], args=args)
+
+    async def append_messages(self, user_id: str, session_id: str, messages: Iterable[Dict]) -> None:
+        messages = list(messages)
+        entries = [_encode_message(message) for message in messages]
+        if not entries:
+            return
+        dropped, offset, length = await self._append(
+            keys=[self._session_key(user_id, session_id), self._history_key(user_id, session_id)],
+            args=[self.max_history_bytes, self.idle_ttl, *entries],
+        )
+        if dropped < 0:
+            return
+        if dropped > 0:
+            self.trimmed_messages += dropped
+        if self.search_index is not None:
+            # Skip messages this call already trimmed; earlier ones it trimmed are released below
+            start = offset + length - len(messages)
+            skip = max(offset - start, 0)
+            self.search_index.add_live(user_id, session_id, start + skip, messages[skip:])
+            if dropped > 0:
+                self.search_index.remove_live(user_id, session_id, below=offset)
+
+    async def clear_history(self, user_id: str, session_id: str) -> None:
+        await self._clear(keys=[self._session_key(user_id, session_id), self._history_key(user_id, session_id)])
+        if self.search_index is not None:
+            self.search_index.remove_live(user_id, session_id)
+
+    async def list_sessions(self, user_id: str) -> List[Dict]:
+        session_ids = sorted(await self._redis.smembers(self._user_key(user_id)))
+        if not session_ids:
+            return []
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for session_id in session_ids:
+                pipe.hget(self._session_key(user_id, session_id), "provider_name")
+                pipe.llen(self._history_key(user_id, session_id))
+            replies = await pipe.execute()
+
+        result: List[Dict] = []
+        stale = []
+        for index, session_id in enumerate(session_ids):
+            provider_name, message_count = replies[2 * index], replies[2 * index + 1]
+            if provider_name is None:
+                stale.append(session_id)
+                continue
+            result.append(
+                {"session_id": session_id, "provider": json.loads(provider_name), "message_count": message_count}
+            )
+        if stale:
+            await self._redis.srem(self._user_key(user_id), *stale)
+        return result
+
+    async def user_histories(self, user_id: str) -> List[Tuple[str, int, List[Dict]]]:
+        session_ids = sorted(await self._redis.smembers(self._user_key(user_id)))
+        if not session_ids:
+            return []
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for session_id in session_ids:
+                pipe.hget(self._session_key(user_id, session_id), "history_offset")
+                pipe.lrange(self._history_key(user_id, session_id), 0, -1)
+            replies = await pipe.execute()
+        return [
+            (session_id, int(replies[2 * index] or 0), [_decode_message(entry) for entry in replies[2 * index + 1]])
+            for index, session_id in enumerate(session_ids)
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "cached_providers": len(self._providers),
+            "provider_builds": self.provider_builds,
+            "trimmed_messages": self.trimmed_messages,
+        }
+
+    async def close(self) -> None:
+        for _, provider in self._providers.values():
+            provider.close()
+        self._providers.clear()
+        await self._redis.aclose()
+
+    async def _forget(self, user_id: str, session_id: str) -> None:
+        """Drop index and cache entries for a session whose hash expired"""
+        await self._redis.srem(self._user_key(user_id), session_id)
+        cached = self._providers.pop(self._session_key(user_id, session_id), None)
+        if cached is not None:
+            cached[1].close()
+
+    def _provider(self, session_key: str, version: str, config: Dict) -> object:
+        cached = self._providers.get(session_key)
+        if cached is not None and cached[0] == version:
+            self._providers.move_to_end(session_key)
+            return cached[1]
+        provider = self.provider_factory(config)
+        self.provider_builds += 1
+        self._cache_provider(session_key, version, provider)
+        return provider
+
+    def _cache_provider(self, session_key: str, version: str, provider: object) -> None:
+        previous = self._providers.pop(session_key, None)
+        if previous is not None and previous[1] is not provider:
+            previous[1].close()
+        self._providers[session_key] = (version, provider)
+        if self.provider_cache_size:
+            while len(self._providers) > self.provider_cache_size:
+                _, (_, evicted) = self._providers.popitem(last=False)
+                evicted.close()
@@ -0,0 +1,60 @@
+import hashlib
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.app.core import metrics
+from src.app.core.cache import TTLCache
+from src.app.core.config import settings
+
+
+def _chunks_size(chunks: Tuple[str, ...]) -> int:
+    return sum(len(chunk.encode("utf-8")) for chunk in chunks)
+
+
+class ResponseCache:
+    """Exact-match cache of completed replies for opt-in chat requests.
+
+    Entries are keyed by user, provider, model, sampling parameters and the
+    normalized conversation actually sent upstream, so one user's replies are
+    never served to another. Values are the reply's chunks so streaming
+    requests can replay them.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600.0, max_bytes: int = 32 * 1024 * 1024) -> None:
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, max_bytes=max_bytes, sizeof=_chunks_size)
+
+    @staticmethod
+    def key(user_id: str, provider, message: str, history: Sequence[Dict]) -> str:
+        payload = [
+            user_id,
+            provider.__class__.__name__,
+            provider.model,
+            provider.sampling_params(),
+            [[msg.get("role"), str(msg.get("content", "")).strip()] for msg in history],
+            message.strip(),
+        ]
+        encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, ...]]:
+        return self._cache.get(key)
+
+    def set(self, key: str, chunks: List[str]) -> None:
+        self._cache.set(key, tuple(chunks))
+
+    def stats(self) -> Dict:
+        return self._cache.stats()
+
+
+response_cache = ResponseCache(
+    maxsize=settings.response_cache_max_entries,
+    ttl=settings.response_cache_ttl,
+    max_bytes=settings.response_cache_max_bytes,
+)
+
+metrics.counter(
+    "response_cache_lookups_total",
+    "Response cache lookups by result",
+    ("result",),
+    callback=lambda: [({"result": "hit"}, response_cache.stats()["hits"]), ({"result": "miss"}, response_cache.stats()["misses"])],
+)
@@ -0,0 +1,211 @@
+"""
+Retrieval memory for long chat histories
+Sends a recent window plus the older turns most similar to the new message, instead of the whole history
+"""
+
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from .search_index import tokenize
+
+# Batches larger than this are embedded in a worker thread to keep the event loop free
+_THREAD_BATCH = 64
+
+
+class Embedder(ABC):
+    """Turns texts into vectors for retrieval; register implementations with register_embedder()"""
+
+    dimensions: int
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Return a (len(texts), dimensions) float32 array of L2-normalized rows"""
+
+
+class HashingEmbedder(Embedder):
+    """Signed feature hashing of words and word pairs.
+
+    Needs no model or network and is deterministic across processes, so it
+    suits offline tests and deployments without an embeddings API. It matches
+    shared vocabulary rather than meaning.
+    """
+
+    def __init__(self, dimensions: int = 256) -> None:
+        self.dimensions = dimensions
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        if len(texts) > _THREAD_BATCH:
+            return await asyncio.to_thread(self.embed_sync, texts)
+        return self.embed_sync(texts)
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = tokenize(text)
+            for feature in words + [f"{first} {second}" for first, second in zip(words, words[1:])]:
+                slot, sign = _feature_hash(feature, self.dimensions)
+                matrix[row, slot] += sign
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+@lru_cache(maxsize=65536)
+def _feature_hash(feature: str, dimensions: int) -> Tuple[int, float]:
+    # blake2b rather than hash(), which is salted per process
+    value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return value % dimensions, (1.0 if value >> 63 else -1.0)
+
+
+_EMBEDDERS: Dict[str, Callable[[int], Embedder]] = {"hashing": HashingEmbedder}
+
+
+def register_embedder(name: str, factory: Callable[[int], Embedder]) -> None:
+    """Make an embedder available to RETRIEVAL_EMBEDDER; `factory` receives the configured dimensions"""
+    _EMBEDDERS[name.lower()] = factory
+
+
+def create_embedder(name: str, dimensions: int) -> Embedder:
+    factory = _EMBEDDERS.get(name.lower())
+    if factory is None:
+        raise ValueError(f"Unknown retrieval embedder: {name}. Registered: {', '.join(sorted(_EMBEDDERS))}")
+    return factory(dimensions)
+
+
+class SessionVectors:
+    """Embeddings of one session's history, row i holding message position `start + i`"""
+
+    def __init__(self, dimensions: int) -> None:
+        self.start = 0
+        self.count = 0
+        self.vectors = np.empty((0, dimensions), dtype=np.float32)
+        # Content of the last embedded message, to notice a history replaced by a reconfigure
+        self.last: Optional[str] = None
+        self.lock = asyncio.Lock()
+
+    def align(self, history: List[Dict], offset: int) -> int:
+        """Drop rows trimmed from the history head, reset after a clear or reconfigure; return rows to embed"""
+        end = self.start + self.count
+        if (
+            offset < self.start
+            or offset > end
+            or end > offset + len(history)
+            or (self.count and history[end - 1 - offset].get("content") != self.last)
+        ):
+            self.start, self.count = offset, 0
+        elif offset > self.start:
+            dropped = offset - self.start
+            self.vectors[: self.count - dropped] = self.vectors[dropped:self.count]
+            self.start, self.count = offset, self.count - dropped
+        return offset + len(history) - (self.start + self.count)
+
+    def extend(self, rows: np.ndarray) -> None:
+        needed = self.count + len(rows)
+        if needed > len(self.vectors):
+            # Grow geometrically so appending a turn is amortized O(1)
+            grown = np.empty((max(needed, 2 * len(self.vectors), 16), self.vectors.shape[1]), dtype=np.float32)
+            grown[: self.count] = self.vectors[: self.count]
+            self.vectors = grown
+        self.vectors[self.count:needed] = rows
+        self.count = needed
+
+
+class RetrievalMemory:
+    """Choose the history to send for a turn: recent messages plus relevant older turns.
+
+    The last `recent_messages` messages (moved forward to start on a user
+    turn) are always sent. Older messages are grouped into turns, each
+    starting at a user message; the `top_k` turns whose best-matching message
+    is most similar to the new message are added in their original order.
+    Embeddings are kept per session and only new messages are embedded, in a
+    single batch together with the new message. At most `max_sessions`
+    sessions keep embeddings (LRU).
+    """
+
+    def __init__(
+        self, embedder: Embedder, recent_messages: int = 8, top_k: int = 4, max_sessions: int = 1000
+    ) -> None:
+        self.embedder = embedder
+        self.recent_messages = recent_messages
+        self.top_k = top_k
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[Tuple[str, str], SessionVectors]" = OrderedDict()
+        self.embedded_messages = 0
+        self.retrieved_turns = 0
+
+    async def select(self, user_id: str, session_id: str, history: List[Dict], offset: int, message: str) -> List[Dict]:
+        split = max(len(history) - self.recent_messages, 0)
+        while split < len(history) and history[split].get("role") != "user":
+            split += 1
+        if split == 0 or not self.top_k:
+            return history[split:]
+
+        vectors = self._vectors(user_id, session_id)
+        async with vectors.lock:
+            missing = vectors.align(history, offset)
+            texts = [str(msg.get("content", "")) for msg in history[len(history) - missing:]]
+            embedded = await self.embedder.embed(texts + [message])
+            vectors.extend(embedded[:-1])
+            vectors.last = history[-1].get("content")
+            self.embedded_messages += missing
+            query = embedded[-1]
+            similarities = vectors.vectors[:split] @ query
+
+        # One score per turn: the best of its messages. Messages before the
+        # first user message form a turn of their own.
+        starts = [index for index in range(split) if history[index].get("role") == "user"]
+        if not starts or starts[0] != 0:
+            starts.insert(0, 0)
+        turn_scores = np.maximum.reduceat(similarities, starts)
+        chosen = np.argsort(-turn_scores, kind="stable")[: self.top_k]
+        chosen = sorted(int(turn) for turn in chosen if turn_scores[turn] > 0)
+        self.retrieved_turns += len(chosen)
+
+        ends = starts[1:] + [split]
+        selected: List[Dict] = []
+        for turn in chosen:
+            selected.extend(history[starts[turn]:ends[turn]])
+        return selected + history[split:]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "retrieval_sessions": len(self._sessions),
+            "retrieval_vectors": sum(vectors.count for vectors in self._sessions.values()),
+            "retrieval_embedded_messages": self.embedded_messages,
+            "retrieval_turns": self.retrieved_turns,
+        }
+
+    def _vectors(self, user_id: str, session_id: str) -> SessionVectors:
+        key = (user_id, session_id)
+        vectors = self._sessions.get(key)
+        if vectors is None:
+            vectors = self._sessions[key] = SessionVectors(self.embedder.dimensions)
+            if self.max_sessions:
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(key)
+        return vectors
+
+
+_retrieval_memory: Optional[RetrievalMemory] = None
+
+
+def get_retrieval_memory() -> RetrievalMemory:
+    """Shared instance, built on first use so numpy and the embedder load only when retrieval is used"""
+    global _retrieval_memory
+    if _retrieval_memory is None:
+        _retrieval_memory = RetrievalMemory(
+            create_embedder(settings.retrieval_embedder, settings.retrieval_dimensions),
+            recent_messages=settings.retrieval_recent_messages,
+            top_k=settings.retrieval_top_k,
+            max_sessions=settings.retrieval_max_sessions,
+        )
+    return _retrieval_memory
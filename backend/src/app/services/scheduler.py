@@ -0,0 +1,241 @@
+"""
+Admission scheduler for upstream LLM calls
+Weighted-fair queueing per user in front of a concurrency cap per provider/API key,
+with backoff driven by provider rate-limit responses
+"""
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.app.core import metrics
+from src.app.core.config import settings
+from src.providers.llm_providers import RateLimitError
+
+
+class _Waiter:
+    __slots__ = ("user_id", "future", "start_tag", "enqueued_at")
+
+    def __init__(self, user_id: str, future: asyncio.Future, start_tag: float) -> None:
+        self.user_id = user_id
+        self.future = future
+        self.start_tag = start_tag
+        self.enqueued_at = time.monotonic()
+
+
+class _Backend:
+    """Queue and limits for one (provider, API key) pair"""
+
+    def __init__(self, key: Tuple[str, str], limit: int) -> None:
+        self.key = key
+        self.max_limit = limit
+        self.limit = float(limit)
+        self.active = 0
+        self.active_by_user: Dict[str, int] = {}
+        self.heap: List[Tuple[float, int, _Waiter]] = []
+        self.virtual_time = 0.0
+        self.user_finish: Dict[str, float] = {}
+        self.blocked_until = 0.0
+        self.backoff = 0.0
+        self.wakeup: Optional[asyncio.TimerHandle] = None
+
+
+class AdmissionScheduler:
+    """Admit upstream calls fairly across users and within each backend's capacity.
+
+    Each backend (provider + API key) runs at most `limit` calls at once and
+    no user holds more than `max_per_user` of them. Waiting calls are ordered
+    by start-time fair queueing: every call gets a virtual finish tag of
+    max(backend clock, user's last tag) + 1/weight, so a user flooding the
+    queue only delays their own later calls.
+
+    A RateLimitError pauses the backend for the provider's Retry-After (or an
+    exponential backoff when none is given), halves its concurrency limit and
+    retries the call; successes grow the limit back additively.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_per_user: int = 4,
+        max_retries: int = 3,
+        base_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._backends: Dict[Tuple[str, str], _Backend] = {}
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rate_limited = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    @staticmethod
+    def backend_key(provider) -> Tuple[str, str]:
+        name = getattr(provider, "pool_name", None) or provider.__class__.__name__
+        key_hash = hashlib.sha256(str(getattr(provider, "api_key", "")).encode("utf-8")).hexdigest()
+        return name, key_hash
+
+    def _backend(self, provider) -> _Backend:
+        key = self.backend_key(provider)
+        backend = self._backends.get(key)
+        if backend is None:
+            backend = self._backends[key] = _Backend(key, self.max_concurrency)
+        return backend
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, provider, weight: float = 1.0) -> AsyncIterator[None]:
+        """Hold one admission slot on the provider's backend for the duration of the block."""
+        backend = self._backend(provider)
+        await self._admit(backend, user_id, weight)
+        try:
+            yield
+        except RateLimitError as exc:
+            self._on_rate_limited(backend, exc)
+            raise
+        else:
+            self._on_success(backend)
+        finally:
+            self._release(backend, user_id)
+
+    async def submit(self, user_id: str, provider, call: Callable[[], Awaitable[Any]], weight: float = 1.0) -> Any:
+        """Run `call` once admitted, retrying provider rate limits up to max_retries times."""
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(user_id, provider, weight):
+                    return await call()
+            except RateLimitError:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+
+    async def _admit(self, backend: _Backend, user_id: str, weight: float) -> None:
+        loop = asyncio.get_running_loop()
+        start = max(backend.virtual_time, backend.user_finish.get(user_id, 0.0))
+        finish = start + 1.0 / max(weight, 1e-6)
+        waiter = _Waiter(user_id, loop.create_future(), start)
+        backend.user_finish[user_id] = finish
+        heapq.heappush(backend.heap, (finish, next(self._seq), waiter))
+        self._dispatch(backend)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as the caller went away: hand the slot back
+                self._release(backend, user_id)
+            raise
+        waited = time.monotonic() - waiter.enqueued_at
+        scheduler_wait.observe(waited, provider=backend.key[0])
+        self.admitted += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def _dispatch(self, backend: _Backend) -> None:
+        now = time.monotonic()
+        if backend.blocked_until > now:
+            if backend.wakeup is None:
+                loop = asyncio.get_running_loop()
+                backend.wakeup = loop.call_later(backend.blocked_until - now, self._wake, backend)
+            return
+
+        skipped: List[Tuple[float, int, _Waiter]] = []
+        while backend.heap and backend.active < int(backend.limit):
+            entry = heapq.heappop(backend.heap)
+            finish, _, waiter = entry
+            if waiter.future.done():
+                continue
+            if backend.active_by_user.get(waiter.user_id, 0) >= self.max_per_user:
+                skipped.append(entry)
+                continue
+            backend.active += 1
+            backend.active_by_user[waiter.user_id] = backend.active_by_user.get(waiter.user_id, 0) + 1
+            backend.virtual_time = max(backend.virtual_time, waiter.start_tag)
+            waiter.future.set_result(None)
+        for entry in skipped:
+            heapq.heappush(backend.heap, entry)
+        if (
+            not backend.heap
+            and not backend.active
+            and backend.limit >= backend.max_limit
+            and backend.blocked_until <= now
+            and backend.wakeup is None
+        ):
+            # Fully idle and recovered from any rate limiting: forget the backend
+            self._backends.pop(backend.key, None)
+
+    def _wake(self, backend: _Backend) -> None:
+        backend.wakeup = None
+        self._dispatch(backend)
+
+    def _release(self, backend: _Backend, user_id: str) -> None:
+        backend.active -= 1
+        remaining = backend.active_by_user.get(user_id, 1) - 1
+        if remaining:
+            backend.active_by_user[user_id] = remaining
+        else:
+            backend.active_by_user.pop(user_id, None)
+        self._dispatch(backend)
+
+    def _on_rate_limited(self, backend: _Backend, exc: RateLimitError) -> None:
+        self.rate_limited += 1
+        backend.backoff = min(max(backend.backoff * 2, self.base_backoff), self.max_backoff)
+        delay = exc.retry_after if exc.retry_after is not None else backend.backoff
+        backend.blocked_until = max(backend.blocked_until, time.monotonic() + min(delay, self.max_backoff))
+        backend.limit = max(1.0, backend.limit / 2)
+
+    def _on_success(self, backend: _Backend) -> None:
+        backend.backoff = 0.0
+        if backend.limit < backend.max_limit:
+            backend.limit = min(float(backend.max_limit), backend.limit + 1.0 / backend.limit)
+
+    def stats(self) -> Dict[str, Any]:
+        queued: Dict[str, int] = {}
+        for (name, _), backend in self._backends.items():
+            depth = sum(1 for _, _, waiter in backend.heap if not waiter.future.done())
+            queued[name] = queued.get(name, 0) + depth
+        return {
+            "backends": len(self._backends),
+            "queue_depth": sum(queued.values()),
+            "queue_depth_by_provider": queued,
+            "active": sum(backend.active for backend in self._backends.values()),
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+            "wait_seconds_avg": self.wait_seconds_total / self.admitted if self.admitted else 0.0,
+        }
+
+
+scheduler_wait = metrics.histogram(
+    "scheduler_wait_seconds",
+    "Time LLM calls waited for admission",
+    ("provider",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+scheduler = AdmissionScheduler(
+    max_concurrency=settings.scheduler_max_concurrency,
+    max_per_user=settings.scheduler_max_per_user,
+    max_retries=settings.scheduler_max_retries,
+)
+
+metrics.gauge(
+    "scheduler_queue_depth",
+    "LLM calls waiting for admission",
+    ("provider",),
+    callback=lambda: [({"provider": name}, depth) for name, depth in scheduler.stats()["queue_depth_by_provider"].items()],
+)
+metrics.counter(
+    "scheduler_rate_limited_total",
+    "Provider rate-limit responses seen by the scheduler",
+    callback=lambda: [({}, scheduler.rate_limited)],
+)
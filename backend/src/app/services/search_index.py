@@ -0,0 +1,367 @@
+"""
+Per-user full-text search over chat history
+BM25-ranked inverted indexes kept current by session store appends and saved-message syncs
+"""
+
+import asyncio
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from ..core import metrics
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+")
+
+# Standard BM25 parameters: term-frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+
+SNIPPET_CHARS = 200
+
+# Yields (session_id, role, content, created_at, cursor) for saved messages after a cursor
+SavedMessages = Callable[[str, Optional[str]], AsyncIterator[Tuple[str, str, str, Any, str]]]
+# Returns (session_id, history_offset, chat_history) for each of a user's resident sessions
+LiveHistories = Callable[[str], Awaitable[Iterable[Tuple[str, int, List[Dict]]]]]
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class _Doc:
+    __slots__ = ("doc_id", "session_id", "role", "content", "length", "live", "saved", "created_at")
+
+    def __init__(self, doc_id: int, session_id: str, role: str, content: str, length: int) -> None:
+        self.doc_id = doc_id
+        self.session_id = session_id
+        self.role = role
+        self.content = content
+        self.length = length
+        # Number of resident session store messages with this content
+        self.live = 0
+        self.saved = False
+        self.created_at = None
+
+
+class UserIndex:
+    """Inverted index over one user's messages.
+
+    Documents are keyed by session, role and content, so a turn held in the
+    session store and its saved chat_messages row are indexed once. Resident
+    messages are tracked by absolute position (history_offset + index) and
+    reference-count their document, so repeated identical messages keep it
+    until the last copy leaves the store. Documents are removed once they are
+    neither live nor saved.
+    """
+
+    def __init__(self) -> None:
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.docs: Dict[int, _Doc] = {}
+        self.keys: Dict[Tuple[str, str, str], int] = {}
+        self.sessions: Dict[str, set] = {}
+        # session_id -> {message position: doc_id} for resident messages
+        self.live: Dict[str, Dict[int, int]] = {}
+        self.total_length = 0
+        self.next_id = 0
+        self.saved_cursor: Optional[str] = None
+        self.synced_at = 0.0
+        # Loads saved messages past the first sync batch
+        self.backfill: Optional[asyncio.Task] = None
+
+    def add(self, session_id: str, role: str, content: str) -> _Doc:
+        key = (session_id, role, content)
+        doc_id = self.keys.get(key)
+        if doc_id is not None:
+            return self.docs[doc_id]
+        terms = tokenize(content)
+        doc_id = self.next_id
+        self.next_id += 1
+        doc = self.docs[doc_id] = _Doc(doc_id, session_id, role, content, len(terms))
+        self.keys[key] = doc_id
+        self.sessions.setdefault(session_id, set()).add(doc_id)
+        self.total_length += doc.length
+        for term in terms:
+            postings = self.postings.setdefault(term, {})
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+        return doc
+
+    def add_live(self, session_id: str, position: int, role: str, content: str) -> None:
+        positions = self.live.setdefault(session_id, {})
+        if position in positions:
+            return
+        doc = self.add(session_id, role, content)
+        doc.live += 1
+        positions[position] = doc.doc_id
+
+    def release_live(self, session_id: str, positions: Iterable[int]) -> None:
+        """Forget resident messages; their documents go once no copy is live and they are not saved"""
+        live = self.live.get(session_id)
+        if not live:
+            return
+        for position in list(positions):
+            doc_id = live.pop(position, None)
+            if doc_id is None:
+                continue
+            doc = self.docs[doc_id]
+            doc.live -= 1
+            if not doc.live and not doc.saved:
+                self._remove(doc)
+        if not live:
+            del self.live[session_id]
+
+    def _remove(self, doc: _Doc) -> None:
+        doc_id = doc.doc_id
+        del self.docs[doc_id]
+        del self.keys[(doc.session_id, doc.role, doc.content)]
+        session_docs = self.sessions[doc.session_id]
+        session_docs.discard(doc_id)
+        if not session_docs:
+            del self.sessions[doc.session_id]
+        self.total_length -= doc.length
+        for term in set(tokenize(doc.content)):
+            postings = self.postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+
+    def search(self, query: str, limit: int, cursor: int, session_id: Optional[str] = None) -> Tuple[int, List]:
+        """Total matches and the (score, doc) pairs ranked cursor..cursor+limit by BM25"""
+        count = len(self.docs)
+        if not count:
+            return 0, []
+        average_length = self.total_length / count or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                length = self.docs[doc_id].length
+                norm = K1 * (1 - B + B * length / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (K1 + 1) / (frequency + norm)
+        if session_id is not None:
+            in_session = self.sessions.get(session_id, ())
+            scores = {doc_id: score for doc_id, score in scores.items() if doc_id in in_session}
+        # Ties go to the newer message
+        ranked = heapq.nlargest(cursor + limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return len(scores), [(score, self.docs[doc_id]) for doc_id, score in ranked[cursor:]]
+
+
+class SearchIndex:
+    """Per-process BM25 search over each user's live and saved messages.
+
+    A user's index is built on their first search from the session store and
+    chat_messages, then kept current: session store appends, trims and clears
+    update it directly, and at most every `sync_interval` seconds a search
+    also syncs it, which picks up saved messages newer than the last one seen
+    (keyset cursor, no rescan) and drops live messages no longer resident in
+    the session store. At most `max_users` indexes are kept (LRU).
+
+    A sync reads at most `sync_batch` saved messages (0: no limit) on the
+    request path; a user with more is indexed by a background task that pages
+    through the rest, and searches report `indexing` until it finishes.
+    """
+
+    def __init__(self, max_users: int = 1000, sync_interval: float = 30.0, sync_batch: int = 5000) -> None:
+        self.max_users = max_users
+        self.sync_interval = sync_interval
+        self.sync_batch = sync_batch
+        self._users: "OrderedDict[str, UserIndex]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._syncs: Dict[str, asyncio.Future] = {}
+        self.searches = 0
+        self.syncs = 0
+        self.evictions = 0
+
+    # ==================== SESSION STORE HOOKS ====================
+    def add_live(self, user_id: str, session_id: str, start: int, messages: Iterable[Dict]) -> None:
+        """Index messages appended at positions start, start + 1, ...; a no-op until the user has searched"""
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None:
+                return
+            for position, message in enumerate(messages, start):
+                index.add_live(session_id, position, message["role"], str(message["content"]))
+
+    def remove_live(self, user_id: str, session_id: str, below: Optional[int] = None) -> None:
+        """Forget resident messages at positions before `below` (trimmed), or all of them (cleared)"""
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None or session_id not in index.live:
+                return
+            positions = index.live[session_id]
+            index.release_live(
+                session_id, positions if below is None else [position for position in positions if position < below]
+            )
+
+    # ==================== SEARCH ====================
+    async def sync(self, user_id: str, live_histories: LiveHistories, saved_messages: Optional[SavedMessages]) -> None:
+        """Build or refresh the user's index when it is missing or older than `sync_interval`"""
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None and time.monotonic() - index.synced_at < self.sync_interval:
+                return
+        # Concurrent searches by the same user share one sync
+        pending = self._syncs.get(user_id)
+        if pending is not None:
+            await asyncio.shield(pending)
+            return
+        pending = self._syncs[user_id] = asyncio.get_running_loop().create_future()
+        try:
+            await self._sync(user_id, live_histories, saved_messages)
+            pending.set_result(None)
+        except BaseException as exc:
+            pending.set_exception(exc)
+            # Retrieved here so a sync nobody else awaited does not log a warning
+            pending.exception()
+            raise
+        finally:
+            self._syncs.pop(user_id, None)
+
+    async def _sync(self, user_id: str, live_histories: LiveHistories, saved_messages: Optional[SavedMessages]) -> None:
+        histories = {
+            session_id: (offset, list(history)) for session_id, offset, history in await live_histories(user_id)
+        }
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None:
+                index = self._users[user_id] = UserIndex()
+                self._evict()
+            cursor = index.saved_cursor
+            # Drop positions that left the store or now hold another message
+            # (e.g. the session was reconfigured), then add the missing ones
+            for session_id, positions in list(index.live.items()):
+                offset, history = histories.get(session_id, (0, []))
+                stale = []
+                for position, doc_id in positions.items():
+                    doc = index.docs[doc_id]
+                    at = position - offset
+                    if not 0 <= at < len(history) or (
+                        history[at]["role"] != doc.role or str(history[at]["content"]) != doc.content
+                    ):
+                        stale.append(position)
+                index.release_live(session_id, stale)
+            for session_id, (offset, history) in histories.items():
+                for position, message in enumerate(history, offset):
+                    index.add_live(session_id, position, message["role"], str(message["content"]))
+
+        if saved_messages is not None and index.backfill is None:
+            rows = saved_messages(user_id, cursor)
+            loaded = await self._load_saved(user_id, index, rows, self.sync_batch)
+            if self.sync_batch and loaded == self.sync_batch:
+                index.backfill = asyncio.create_task(self._backfill(user_id, index, rows))
+            else:
+                await rows.aclose()
+        index.synced_at = time.monotonic()
+        self.syncs += 1
+
+    async def _load_saved(self, user_id: str, index: UserIndex, rows: AsyncIterator, limit: int = 0) -> int:
+        """Index saved messages from `rows`, stopping after `limit` (0: all) or once the index is evicted"""
+        loaded = 0
+        async for session_id, role, content, created_at, cursor in rows:
+            with self._lock:
+                if self._users.get(user_id) is not index:
+                    break
+                doc = index.add(session_id, role, content)
+                doc.saved = True
+                doc.created_at = created_at
+                index.saved_cursor = cursor
+            loaded += 1
+            if loaded == limit:
+                break
+        return loaded
+
+    async def _backfill(self, user_id: str, index: UserIndex, rows: AsyncIterator) -> None:
+        try:
+            await self._load_saved(user_id, index, rows)
+        except Exception:
+            # The next sync resumes from the last indexed row
+            logger.exception("Search index backfill failed")
+        finally:
+            index.backfill = None
+            await rows.aclose()
+
+    async def close(self) -> None:
+        """Cancel background backfills; called on application shutdown"""
+        with self._lock:
+            tasks = [index.backfill for index in self._users.values() if index.backfill is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def search(
+        self, user_id: str, query: str, limit: int = 20, cursor: int = 0, session_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """One page of BM25-ranked matches; call sync() first"""
+        with self._lock:
+            index = self._users.get(user_id)
+            self.searches += 1
+            if index is None:
+                return {"results": [], "total": 0, "next_cursor": None, "indexing": False}
+            self._users.move_to_end(user_id)
+            total, ranked = index.search(query, limit, cursor, session_id)
+            terms = tokenize(query)
+            results = [
+                {
+                    "session_id": doc.session_id,
+                    "role": doc.role,
+                    "snippet": _snippet(doc.content, terms),
+                    "score": round(score, 4),
+                    "live": doc.live > 0,
+                    "saved": doc.saved,
+                    "created_at": doc.created_at,
+                }
+                for score, doc in ranked
+            ]
+            indexing = index.backfill is not None
+        next_cursor = cursor + limit if cursor + limit < total else None
+        return {"results": results, "total": total, "next_cursor": next_cursor, "indexing": indexing}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "indexed_users": len(self._users),
+                "indexed_messages": sum(len(index.docs) for index in self._users.values()),
+                "searches": self.searches,
+                "syncs": self.syncs,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self) -> None:
+        if self.max_users:
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self.evictions += 1
+
+
+def _snippet(content: str, terms: List[str]) -> str:
+    """Up to SNIPPET_CHARS of `content` around the first query term it contains"""
+    if len(content) <= SNIPPET_CHARS:
+        return content
+    lowered = content.lower()
+    positions = [position for position in (lowered.find(term) for term in terms) if position >= 0]
+    start = max(min(positions, default=0) - SNIPPET_CHARS // 4, 0)
+    snippet = content[start:start + SNIPPET_CHARS]
+    return ("..." if start else "") + snippet + ("..." if start + SNIPPET_CHARS < len(content) else "")
+
+
+search_index = SearchIndex(
+    max_users=settings.search_index_max_users,
+    sync_interval=settings.search_sync_interval,
+    sync_batch=settings.search_sync_batch,
+)
+
+metrics.gauge(
+    "search_index_messages",
+    "Messages held in this process's search indexes",
+    callback=lambda: [({}, search_index.stats()["indexed_messages"])],
+)
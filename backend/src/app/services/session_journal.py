@@ -0,0 +1,280 @@
+"""
+Append-only journal for the in-memory session store
+Group-commits session changes to disk and replays them on startup
+"""
+
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from ..core.fast_json import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+_FILE_NAME = re.compile(r"^(snapshot|journal)-(\d{8})\.jsonl$")
+
+KeyLookup = Callable[[str, str], Awaitable[Optional[str]]]
+
+
+def key_fingerprint(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class SessionJournal:
+    """Durable log of session changes for InMemorySessionStore.
+
+    Records are JSON lines buffered in memory by record() and written by a
+    background task every `flush_interval` seconds with one write (and fsync)
+    per batch, so requests never wait on the disk. Files are numbered by
+    generation: snapshot-N holds every live session as of the start of
+    journal-N. A new snapshot is written after `snapshot_records` records or
+    `snapshot_interval` seconds, and on shutdown; older files are then
+    deleted. Replay reads the newest snapshot and every later journal
+    through mmap.
+
+    API keys are never written: configs carry a reference (provider and key
+    fingerprint) that resolve() turns back into a key, either from keys seen
+    by this process or through `key_lookup(user_id, provider)`, e.g. the
+    user's saved key.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        flush_interval: float = 0.05,
+        fsync: bool = True,
+        snapshot_records: int = 100000,
+        snapshot_interval: float = 600,
+        key_lookup: Optional[KeyLookup] = None,
+    ) -> None:
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.snapshot_records = snapshot_records
+        self.snapshot_interval = snapshot_interval
+        self.key_lookup = key_lookup
+        self._known_keys: Dict[str, str] = {}
+        self._buffer: List[bytes] = []
+        self._generation = 0
+        self._file = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._io_lock: Optional[asyncio.Lock] = None
+        self._snapshot_source: Optional[Callable[[], List[Dict[str, Any]]]] = None
+        self._last_snapshot = time.monotonic()
+        self.records_since_snapshot = 0
+        self.flushes = 0
+        self.snapshots = 0
+        self.replayed = 0
+        self.skipped = 0
+
+    # ==================== API KEY REFERENCES ====================
+    def redact(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of a provider config with API keys replaced by references"""
+
+        def strip(entry: Dict[str, Any]) -> Dict[str, Any]:
+            entry = dict(entry)
+            api_key = entry.pop("api_key", None)
+            if api_key:
+                fingerprint = key_fingerprint(api_key)
+                self._known_keys[fingerprint] = api_key
+                entry["api_key_ref"] = {"provider": entry["provider"], "sha256": fingerprint}
+            return entry
+
+        redacted = strip(config)
+        if config.get("fallbacks"):
+            redacted["fallbacks"] = [strip(fallback) for fallback in config["fallbacks"]]
+        return redacted
+
+    async def resolve(self, user_id: str, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Config with referenced API keys filled in, or None when one cannot be found"""
+
+        async def fill(entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            ref = entry.get("api_key_ref")
+            if ref is None:
+                return entry
+            api_key = self._known_keys.get(ref["sha256"])
+            if api_key is None and self.key_lookup is not None:
+                try:
+                    candidate = await self.key_lookup(user_id, ref["provider"])
+                except Exception:
+                    logger.exception("API key lookup failed for a journaled session")
+                    candidate = None
+                if candidate and key_fingerprint(candidate) == ref["sha256"]:
+                    api_key = candidate
+                    self._known_keys[ref["sha256"]] = api_key
+            if api_key is None:
+                return None
+            entry = {name: value for name, value in entry.items() if name != "api_key_ref"}
+            entry["api_key"] = api_key
+            return entry
+
+        resolved = await fill(config)
+        if resolved is None:
+            return None
+        if config.get("fallbacks"):
+            fallbacks = [await fill(fallback) for fallback in config["fallbacks"]]
+            if any(fallback is None for fallback in fallbacks):
+                return None
+            resolved["fallbacks"] = fallbacks
+        return resolved
+
+    # ==================== WRITING ====================
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def record(self, op: str, user_id: str, session_id: str, **fields: Any) -> None:
+        """Buffer one change; written by the next group commit"""
+        fields.update(op=op, u=user_id, s=session_id, t=time.time())
+        self._buffer.append(dumps(fields) + b"\n")
+        self.records_since_snapshot += 1
+
+    def start(self, snapshot_source: Callable[[], List[Dict[str, Any]]]) -> None:
+        """Open a new journal segment and start group commits; call after replay()"""
+        if self.running:
+            return
+        self._snapshot_source = snapshot_source
+        self._io_lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+        self._generation += 1
+        self._file = open(self._path("journal", self._generation), "ab")
+        self._last_snapshot = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush, write a compacted snapshot so the next start replays quickly, and close"""
+        if not self.running:
+            return
+        # Not cancelled: a cancelled write would release the I/O lock while
+        # its worker thread still writes the segment the snapshot then closes
+        self._stopping.set()
+        await self._task
+        self._task = None
+        await self.snapshot()
+        self._file.close()
+        self._file = None
+
+    async def flush(self) -> None:
+        async with self._io_lock:
+            await self._flush()
+
+    async def snapshot(self) -> None:
+        async with self._io_lock:
+            # No await between taking the buffer, switching segments and
+            # capturing the state: every record already applied goes to the old
+            # segment, so the snapshot is exactly the state the new segment's
+            # records apply to and replay never applies a record twice
+            pending = b"".join(self._buffer)
+            self._buffer = []
+            previous = self._file
+            self._generation += 1
+            self._file = open(self._path("journal", self._generation), "ab")
+            records = self._snapshot_source()
+            self.records_since_snapshot = 0
+            self._last_snapshot = time.monotonic()
+            await asyncio.to_thread(self._write_snapshot, self._generation, records, previous, pending)
+            self.snapshots += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "journal_pending_records": len(self._buffer),
+            "journal_flushes": self.flushes,
+            "journal_snapshots": self.snapshots,
+            "journal_replayed_records": self.replayed,
+            "journal_skipped_records": self.skipped,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+                due = time.monotonic() - self._last_snapshot >= self.snapshot_interval
+                if self.records_since_snapshot >= self.snapshot_records or (due and self.records_since_snapshot):
+                    await self.snapshot()
+            except Exception:
+                logger.exception("Session journal write failed")
+
+    async def _flush(self) -> None:
+        if not self._buffer:
+            return
+        data = b"".join(self._buffer)
+        self._buffer = []
+        await asyncio.to_thread(self._write, self._file, data)
+        self.flushes += 1
+
+    def _write(self, file, data: bytes) -> None:
+        file.write(data)
+        file.flush()
+        if self.fsync:
+            os.fsync(file.fileno())
+
+    def _write_snapshot(self, generation: int, records: List[Dict[str, Any]], previous, pending: bytes) -> None:
+        # Completes the old segment first, so a crash before the snapshot is in
+        # place still replays the older snapshot plus both segments
+        if pending:
+            self._write(previous, pending)
+        previous.close()
+        path = self._path("snapshot", generation)
+        temporary = path.with_suffix(".tmp")
+        with open(temporary, "wb") as file:
+            for start in range(0, len(records), 1000):
+                file.write(b"".join(dumps(record) + b"\n" for record in records[start:start + 1000]))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+        for kind, older in self._generations():
+            if older < generation:
+                self._path(kind, older).unlink(missing_ok=True)
+
+    # ==================== REPLAY ====================
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """Yield the newest snapshot's records, then every later journal's, in order"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        generations = self._generations()
+        snapshots = [generation for kind, generation in generations if kind == "snapshot"]
+        journals = sorted(generation for kind, generation in generations if kind == "journal")
+        base = max(snapshots, default=0)
+        self._generation = max([base, *journals])
+        if base:
+            yield from self._read(self._path("snapshot", base))
+        for generation in journals:
+            if generation >= base:
+                yield from self._read(self._path("journal", generation))
+
+    def _read(self, path: Path) -> Iterator[Dict[str, Any]]:
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for line in iter(data.readline, b""):
+                    try:
+                        record = loads(line)
+                    except ValueError:
+                        # A torn final write after a crash; everything before it is intact
+                        self.skipped += 1
+                        continue
+                    self.replayed += 1
+                    yield record
+
+    def _generations(self) -> List[tuple]:
+        found = []
+        for path in self.directory.iterdir():
+            match = _FILE_NAME.match(path.name)
+            if match:
+                found.append((match.group(1), int(match.group(2))))
+        return found
+
+    def _path(self, kind: str, generation: int) -> Path:
+        return self.directory / f"{kind}-{generation:08d}.jsonl"
@@ -1,43 +1,508 @@
-from typing import Dict, List, Optional
+import asyncio
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
+from src.app.core import metrics
+from src.app.core.config import settings
+from src.app.services.search_index import SearchIndex, search_index
+from src.app.services.session_journal import SessionJournal
+from src.providers.factory import provider_from_config
+from src.providers.messages import compact_message
 
-class SessionStore:
-    """In-memory session storage. Replace with database in production."""
+logger = logging.getLogger(__name__)
 
-    def __init__(self) -> None:
-        self.sessions: Dict[str, Dict] = {}
+# Session fields managed by the store; everything else is per-session state
+_STRUCTURAL_FIELDS = frozenset(
+    (
+        "user_id", "session_id", "provider", "provider_name", "config", "chat_history",
+        "history_bytes", "history_offset", "last_access",
+    )
+)
+
+
+def _message_bytes(message: Dict) -> int:
+    return len(str(message.get("content", "")).encode("utf-8"))
+
+
+class SessionStore(ABC):
+    """Interface for session storage.
+
+    A session holds the user's configured provider, its serializable `config`
+    (see providers.factory.provider_from_config), the chat history (compact
+    providers.messages.ChatMessage records) with its `history_offset`, and per-session state such as `persist` and
+    `context_summary`. Sessions returned by get() may be snapshots, so state
+    changes go through update() rather than mutating the returned dict.
+    """
+
+    @abstractmethod
+    async def create_or_update(
+        self, user_id: str, session_id: str, provider: object, config: Dict, **state: Any
+    ) -> None:
+        """Store a freshly configured session, replacing any existing one and its history"""
+
+    @abstractmethod
+    async def get(self, user_id: str, session_id: str) -> Optional[Dict]:
+        """Return the session (refreshing its idle timer), or None"""
+
+    @abstractmethod
+    async def update(self, user_id: str, session_id: str, **state: Any) -> None:
+        """Set per-session state fields"""
+
+    @abstractmethod
+    async def append_messages(self, user_id: str, session_id: str, messages: Iterable[Dict]) -> None:
+        """Append messages to a session's history, trimming the oldest turns past the byte limit"""
+
+    @abstractmethod
+    async def clear_history(self, user_id: str, session_id: str) -> None:
+        """Drop the session's history, context summary and prompt prefix; message positions keep counting up"""
+
+    @abstractmethod
+    async def list_sessions(self, user_id: str) -> List[Dict]:
+        """Return session_id, provider and message_count for each of the user's sessions"""
+
+    @abstractmethod
+    async def user_histories(self, user_id: str) -> List[Tuple[str, int, List[Dict]]]:
+        """Return (session_id, history_offset, chat_history) for each of the user's sessions, without refreshing idle timers"""
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+    async def start(self) -> None:
+        """Restore persisted state; called on application startup"""
+
+    async def close(self) -> None:
+        """Release connections; called on application shutdown"""
+
+
+class InMemorySessionStore(SessionStore):
+    """Session storage in this process's memory; use RedisSessionStore when running several workers.
+
+    Sessions are kept in least-recently-used order and indexed per user. The
+    store is bounded by `max_sessions` (LRU eviction), `idle_ttl` seconds since
+    last access, and `max_history_bytes` of message content per session (oldest
+    turns are trimmed first). A limit of 0 disables it.
+
+    With a `journal`, every change is also recorded so start() can restore
+    the sessions after a restart. Restored sessions hold an API-key reference
+    instead of a provider; the provider is rebuilt with `provider_factory` on
+    first access, and the session is dropped if its key cannot be resolved.
+    History changes are mirrored into `search_index` when one is given.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 0,
+        max_history_bytes: int = 0,
+        idle_ttl: float = 0,
+        journal: Optional[SessionJournal] = None,
+        provider_factory: Callable[[Dict], object] = provider_from_config,
+        search_index: Optional[SearchIndex] = None,
+    ) -> None:
+        self.sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self.max_sessions = max_sessions
+        self.max_history_bytes = max_history_bytes
+        self.idle_ttl = idle_ttl
+        self.journal = journal
+        self.provider_factory = provider_factory
+        self.search_index = search_index
+        self._user_index: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.RLock()
+        self.history_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.trimmed_messages = 0
+        self.restored_sessions = 0
+        self.unrestorable_sessions = 0
 
     def _key(self, user_id: str, session_id: str) -> str:
         return f"{user_id}:{session_id}"
 
-    def create_or_update(self, user_id: str, session_id: str, provider: object) -> None:
-        self.sessions[self._key(user_id, session_id)] = {
+    async def create_or_update(
+        self, user_id: str, session_id: str, provider: object, config: Dict, **state: Any
+    ) -> None:
+        provider_name = provider.__class__.__name__
+        with self._lock:
+            self._configure(user_id, session_id, provider, provider_name, config, state, time.monotonic())
+            self._enforce_limits()
+        if self.journal is not None:
+            self.journal.record(
+                "configure", user_id, session_id,
+                config=self.journal.redact(config), provider_name=provider_name, state=state,
+            )
+
+    def _configure(
+        self, user_id: str, session_id: str, provider: Optional[object], provider_name: str, config: Dict,
+        state: Dict, last_access: float, history_offset: int = 0,
+    ) -> Dict:
+        key = self._key(user_id, session_id)
+        if key in self.sessions:
+            self._drop(key)
+        session = self.sessions[key] = {
+            **state,
+            "user_id": user_id,
+            "session_id": session_id,
+            # None for restored sessions until their provider is rebuilt
             "provider": provider,
+            "provider_name": provider_name,
+            "config": config,
             "chat_history": [],
+            "history_bytes": 0,
+            # Messages dropped from the head so far; offset + index is a stable message position
+            "history_offset": history_offset,
+            "last_access": last_access,
         }
+        self._user_index.setdefault(user_id, {})[session_id] = key
+        return session
 
-    def get(self, user_id: str, session_id: str) -> Optional[Dict]:
-        return self.sessions.get(self._key(user_id, session_id))
+    async def get(self, user_id: str, session_id: str) -> Optional[Dict]:
+        key = self._key(user_id, session_id)
+        with self._lock:
+            session = self.sessions.get(key)
+            if session is None:
+                return None
+            now = time.monotonic()
+            if self.idle_ttl and now - session["last_access"] > self.idle_ttl:
+                self._drop(key)
+                self._record_drop(user_id, session_id)
+                self.expirations += 1
+                return None
+            session["last_access"] = now
+            self.sessions.move_to_end(key)
+        if session["provider"] is None:
+            return await self._restore_provider(user_id, session_id, session)
+        return session
 
-    def clear_history(self, user_id: str, session_id: str) -> None:
+    async def _restore_provider(self, user_id: str, session_id: str, session: Dict) -> Optional[Dict]:
+        config = await self.journal.resolve(user_id, session["config"])
+        provider = None
+        if config is not None:
+            try:
+                provider = self.provider_factory(config)
+            except Exception:
+                logger.exception("Could not rebuild the provider of a restored session")
         key = self._key(user_id, session_id)
-        if key in self.sessions:
-            self.sessions[key]["chat_history"] = []
+        with self._lock:
+            if self.sessions.get(key) is not session:
+                # Reconfigured or removed while the key was being looked up
+                if provider is not None:
+                    provider.close()
+                current = self.sessions.get(key)
+            elif provider is None:
+                self._drop(key)
+                self._record_drop(user_id, session_id)
+                self.unrestorable_sessions += 1
+                return None
+            elif session["provider"] is None:
+                session["provider"] = provider
+                session["config"] = config
+                return session
+            else:
+                # Another request rebuilt it first
+                provider.close()
+                return session
+        return None if current is None else await self.get(user_id, session_id)
+
+    async def update(self, user_id: str, session_id: str, **state: Any) -> None:
+        with self._lock:
+            session = self.sessions.get(self._key(user_id, session_id))
+            if session is None:
+                return
+            session.update(state)
+        if self.journal is not None:
+            self.journal.record("update", user_id, session_id, state=state)
+
+    async def append_messages(self, user_id: str, session_id: str, messages: Iterable[Dict]) -> None:
+        messages = list(messages)
+        with self._lock:
+            session = self.sessions.get(self._key(user_id, session_id))
+            if session is None:
+                return
+            self._append(session, messages)
+        if self.journal is not None:
+            self.journal.record("append", user_id, session_id, messages=messages)
 
-    def list_sessions(self, user_id: str) -> List[Dict]:
-        prefix = f"{user_id}:"
+    def _append(self, session: Dict, messages: List[Dict]) -> None:
+        history = session["chat_history"]
+        start = len(history)
+        position = session["history_offset"] + start
+        for message in messages:
+            message = compact_message(message)
+            history.append(message)
+            size = _message_bytes(message)
+            session["history_bytes"] += size
+            self.history_bytes += size
+        if self.search_index is not None:
+            self.search_index.add_live(session["user_id"], session["session_id"], position, history[start:])
+        if self.max_history_bytes and session["history_bytes"] > self.max_history_bytes:
+            self._trim_history(session)
+
+    def _trim_history(self, session: Dict) -> None:
+        history = session["chat_history"]
+        excess = session["history_bytes"] - self.max_history_bytes
+        drop = 0
+        freed = 0
+        while drop < len(history) and freed < excess:
+            freed += _message_bytes(history[drop])
+            drop += 1
+        # Keep the window starting on a user turn so providers see a valid exchange
+        while drop < len(history) and history[drop].get("role") != "user":
+            freed += _message_bytes(history[drop])
+            drop += 1
+        del history[:drop]
+        session["history_offset"] += drop
+        if self.search_index is not None:
+            self.search_index.remove_live(session["user_id"], session["session_id"], below=session["history_offset"])
+        session["history_bytes"] -= freed
+        self.history_bytes -= freed
+        self.trimmed_messages += drop
+
+    async def clear_history(self, user_id: str, session_id: str) -> None:
+        with self._lock:
+            session = self.sessions.get(self._key(user_id, session_id))
+            if session is None:
+                return
+            self._clear(session)
+        if self.journal is not None:
+            self.journal.record("clear", user_id, session_id)
+
+    def _clear(self, session: Dict) -> None:
+        if self.search_index is not None:
+            self.search_index.remove_live(session["user_id"], session["session_id"])
+        self.history_bytes -= session["history_bytes"]
+        session["history_offset"] += len(session["chat_history"])
+        session["chat_history"] = []
+        session["history_bytes"] = 0
+        session.pop("context_summary", None)
+        session.pop("prompt_prefix", None)
+
+    async def list_sessions(self, user_id: str) -> List[Dict]:
         result: List[Dict] = []
-        for key, value in self.sessions.items():
-            if key.startswith(prefix):
-                session_id = key.split(":", 1)[1]
+        with self._lock:
+            for session_id, key in self._user_index.get(user_id, {}).items():
+                value = self.sessions[key]
                 result.append(
                     {
                         "session_id": session_id,
-                        "provider": value["provider"].__class__.__name__,
+                        "provider": value["provider_name"],
                         "message_count": len(value.get("chat_history", [])),
                     }
                 )
         return result
 
+    async def user_histories(self, user_id: str) -> List[Tuple[str, int, List[Dict]]]:
+        with self._lock:
+            return [
+                (session_id, self.sessions[key]["history_offset"], list(self.sessions[key]["chat_history"]))
+                for session_id, key in self._user_index.get(user_id, {}).items()
+            ]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "resident_sessions": len(self.sessions),
+                "resident_users": len(self._user_index),
+                "resident_history_bytes": self.history_bytes,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "trimmed_messages": self.trimmed_messages,
+                "restored_sessions": self.restored_sessions,
+                "unrestorable_sessions": self.unrestorable_sessions,
+                **(self.journal.stats() if self.journal is not None else {}),
+            }
+
+    # ==================== JOURNAL ====================
+    async def start(self) -> None:
+        if self.journal is None or self.journal.running:
+            return
+        started = time.monotonic()
+        await asyncio.to_thread(self._replay)
+        self.journal.start(self._snapshot_records)
+        if self.journal.replayed:
+            # Compact what was replayed so the next restart reads one snapshot
+            await self.journal.snapshot()
+        logger.info(
+            "Restored %d sessions from %d journal records in %.2fs",
+            self.restored_sessions, self.journal.replayed, time.monotonic() - started,
+        )
+
+    async def close(self) -> None:
+        if self.journal is not None:
+            await self.journal.stop()
+
+    def _replay(self) -> None:
+        wall_offset = time.time() - time.monotonic()
+        with self._lock:
+            for record in self.journal.replay():
+                self._apply(record, record["t"] - wall_offset)
+            self._enforce_limits()
+            self.restored_sessions = len(self.sessions)
+
+    def _apply(self, record: Dict, last_access: float) -> None:
+        op, user_id, session_id = record["op"], record["u"], record["s"]
+        if op in ("session", "configure"):
+            session = self._configure(
+                user_id, session_id, None, record["provider_name"], record["config"], record["state"],
+                last_access, record.get("history_offset", 0),
+            )
+            if record.get("history"):
+                self._append(session, record["history"])
+            return
+        key = self._key(user_id, session_id)
+        session = self.sessions.get(key)
+        if session is None:
+            return
+        if op == "drop":
+            self._drop(key)
+            return
+        if op == "update":
+            session.update(record["state"])
+        elif op == "append":
+            self._append(session, record["messages"])
+        elif op == "clear":
+            self._clear(session)
+        session["last_access"] = last_access
+        self.sessions.move_to_end(key)
+
+    def _snapshot_records(self) -> List[Dict[str, Any]]:
+        """One record per live session, in LRU order, for a compacted snapshot"""
+        wall_offset = time.time() - time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "op": "session",
+                    "u": session["user_id"],
+                    "s": session["session_id"],
+                    "t": session["last_access"] + wall_offset,
+                    "config": self.journal.redact(session["config"]),
+                    "provider_name": session["provider_name"],
+                    "state": {name: value for name, value in session.items() if name not in _STRUCTURAL_FIELDS},
+                    # Copied because the snapshot is written from another thread
+                    "history": list(session["chat_history"]),
+                    "history_offset": session["history_offset"],
+                }
+                for session in self.sessions.values()
+            ]
+
+    def _record_drop(self, user_id: str, session_id: str) -> None:
+        if self.journal is not None:
+            self.journal.record("drop", user_id, session_id)
+
+    def _enforce_limits(self) -> None:
+        if self.idle_ttl:
+            cutoff = time.monotonic() - self.idle_ttl
+            # Sessions are in LRU order, so expired ones sit at the front
+            while self.sessions:
+                key, session = next(iter(self.sessions.items()))
+                if session["last_access"] > cutoff:
+                    break
+                self._drop(key)
+                self._record_drop(session["user_id"], session["session_id"])
+                self.expirations += 1
+        if self.max_sessions:
+            while len(self.sessions) > self.max_sessions:
+                session = self._drop(next(iter(self.sessions)))
+                self._record_drop(session["user_id"], session["session_id"])
+                self.evictions += 1
+
+    def _drop(self, key: str) -> Dict:
+        session = self.sessions.pop(key)
+        close = getattr(session["provider"], "close", None)
+        if close is not None:
+            close()
+        self.history_bytes -= session["history_bytes"]
+        if self.search_index is not None:
+            self.search_index.remove_live(session["user_id"], session["session_id"])
+        user_sessions = self._user_index.get(session["user_id"])
+        if user_sessions is not None:
+            user_sessions.pop(session["session_id"], None)
+            if not user_sessions:
+                del self._user_index[session["user_id"]]
+        return session
+
+
+def _create_session_store() -> SessionStore:
+    if settings.session_backend == "redis":
+        from src.app.services.redis_session_store import RedisSessionStore
+
+        return RedisSessionStore(
+            settings.session_redis_url,
+            prefix=settings.session_redis_prefix,
+            max_history_bytes=settings.session_max_history_bytes,
+            idle_ttl=settings.session_idle_ttl,
+            provider_cache_size=settings.session_max_sessions,
+            search_index=search_index,
+        )
+    if settings.session_backend != "memory":
+        raise RuntimeError(f"Unknown SESSION_BACKEND: {settings.session_backend}")
+    journal = None
+    if settings.session_journal_dir:
+        journal = SessionJournal(
+            settings.session_journal_dir,
+            flush_interval=settings.session_journal_flush_interval,
+            fsync=settings.session_journal_fsync,
+            snapshot_records=settings.session_journal_snapshot_records,
+            snapshot_interval=settings.session_journal_snapshot_interval,
+            key_lookup=_saved_api_key,
+        )
+    return InMemorySessionStore(
+        max_sessions=settings.session_max_sessions,
+        max_history_bytes=settings.session_max_history_bytes,
+        idle_ttl=settings.session_idle_ttl,
+        journal=journal,
+        search_index=search_index,
+    )
+
+
+async def _saved_api_key(user_id: str, provider: str) -> Optional[str]:
+    """The user's saved key for a provider, used to restore journaled sessions"""
+    from src.app.services.async_database import get_async_db_service
+
+    row = await (await get_async_db_service()).get_api_key_by_provider(user_id, provider)
+    return row.get("api_key") if row else None
+
+
+session_store = _create_session_store()
+
+
+def _stat_samples(name: str):
+    # Stores report different stats; absent ones produce no samples
+    stats = session_store.stats()
+    return [({}, stats[name])] if name in stats else []
+
+
+def _removal_samples():
+    stats = session_store.stats()
+    reasons = (("evicted", "evictions"), ("expired", "expirations"))
+    return [({"reason": reason}, stats[name]) for reason, name in reasons if name in stats]
+
 
-session_store = SessionStore()
+metrics.gauge(
+    "session_store_sessions",
+    "Sessions resident in this process's store",
+    callback=lambda: _stat_samples("resident_sessions"),
+)
+metrics.gauge(
+    "session_store_history_bytes",
+    "Message content bytes held by resident sessions",
+    callback=lambda: _stat_samples("resident_history_bytes"),
+)
+metrics.counter(
+    "session_store_removals_total",
+    "Sessions removed from the store by reason",
+    ("reason",),
+    callback=_removal_samples,
+)
+metrics.gauge(
+    "session_store_cached_providers",
+    "Provider objects this worker has built for sessions held in a shared store",
+    callback=lambda: _stat_samples("cached_providers"),
+)
+metrics.counter(
+    "session_store_provider_builds_total",
+    "Providers rebuilt from stored session config",
+    callback=lambda: _stat_samples("provider_builds"),
+)
@@ -0,0 +1,44 @@
+"""
+Per-process read-through cache for rarely changing user rows
+(user_settings and user_api_keys), shared by the sync and async database services
+"""
+
+from typing import Any, Dict, Iterable
+
+from ..core.cache import TTLCache
+from ..core.config import settings
+
+
+class UserDataCache:
+    """TTL/LRU caches for user settings and API keys.
+
+    The database services read through these caches and invalidate the
+    affected entries on every write, so a stale row can only be observed from
+    another process, and then for at most `ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0) -> None:
+        self.settings = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.api_keys = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.api_key_by_provider = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def invalidate_settings(self, user_id: str) -> None:
+        self.settings.pop(user_id)
+
+    def invalidate_api_keys(self, user_id: str, providers: Iterable[str] = ()) -> None:
+        self.api_keys.pop(user_id)
+        for provider in providers:
+            self.api_key_by_provider.pop((user_id, provider))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "settings": self.settings.stats(),
+            "api_keys": self.api_keys.stats(),
+            "api_key_by_provider": self.api_key_by_provider.stats(),
+        }
+
+
+user_data_cache = UserDataCache(
+    maxsize=settings.user_data_cache_max_entries,
+    ttl=settings.user_data_cache_ttl,
+)
@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from src.app.core.config import settings
+
+PoolKey = Tuple[str, str, str]
+
+
+class _PooledClient:
+    __slots__ = ("client", "refs", "idle_since")
+
+    def __init__(self, client: Any) -> None:
+        self.client = client
+        self.refs = 0
+        self.idle_since: Optional[float] = None
+
+
+def _close_client(client: Any) -> None:
+    close = getattr(client, "close", None)
+    if close is None:
+        return
+    try:
+        result = close()
+        if asyncio.iscoroutine(result):
+            try:
+                asyncio.get_running_loop().create_task(result)
+            except RuntimeError:
+                # No loop to run the async close on; let the client be collected
+                result.close()
+    except Exception:
+        pass
+
+
+class ClientPool:
+    """Share one SDK client (and its HTTP connection pool) per provider and API key.
+
+    Clients are reference counted by the providers that hold them. Once a client
+    has had no holders for `idle_ttl` seconds it is closed and dropped.
+    """
+
+    def __init__(self, idle_ttl: float = 300.0) -> None:
+        self.idle_ttl = idle_ttl
+        self._entries: Dict[PoolKey, _PooledClient] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.closed = 0
+
+    @staticmethod
+    def key(provider: str, api_key: str, kind: str = "sync") -> PoolKey:
+        return (provider, hashlib.sha256(api_key.encode("utf-8")).hexdigest(), kind)
+
+    def acquire(self, key: PoolKey, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            self._evict_idle()
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _PooledClient(factory())
+                self.created += 1
+            else:
+                self.reused += 1
+            entry.refs += 1
+            entry.idle_since = None
+            return entry.client
+
+    def release(self, key: PoolKey) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.refs == 0:
+                return
+            entry.refs -= 1
+            if entry.refs == 0:
+                entry.idle_since = time.monotonic()
+            self._evict_idle()
+
+    def _evict_idle(self) -> None:
+        cutoff = time.monotonic() - self.idle_ttl
+        for key, entry in list(self._entries.items()):
+            if entry.refs == 0 and entry.idle_since is not None and entry.idle_since <= cutoff:
+                del self._entries[key]
+                _close_client(entry.client)
+                self.closed += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "clients": len(self._entries),
+                "in_use": sum(1 for entry in self._entries.values() if entry.refs),
+                "created": self.created,
+                "reused": self.reused,
+                "closed": self.closed,
+            }
+
+
+client_pool = ClientPool(idle_ttl=settings.provider_client_idle_ttl_seconds)
@@ -0,0 +1,29 @@
+from typing import Dict
+
+from .hedged_provider import HedgedProvider
+from .llm_providers import create_provider
+
+
+def provider_from_config(config: Dict):
+    """Build a session's provider from its serializable config.
+
+    `config` holds provider, api_key and model, plus optional `fallbacks`
+    (provider/model/api_key entries) and `hedge_delay`. Configs with fallbacks
+    build a HedgedProvider. Session stores keep only the config, so any worker
+    can rebuild the provider.
+    """
+    primary = create_provider(config["provider"], config["api_key"], config["model"])
+    fallbacks = config.get("fallbacks") or []
+    if not fallbacks:
+        return primary
+
+    backends = [primary]
+    try:
+        for fallback in fallbacks:
+            api_key = fallback.get("api_key") or config["api_key"]
+            backends.append(create_provider(fallback["provider"], api_key, fallback["model"]))
+    except Exception:
+        for backend in backends:
+            backend.close()
+        raise
+    return HedgedProvider(backends, hedge_delay=config.get("hedge_delay"))
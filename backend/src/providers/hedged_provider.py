@@ -0,0 +1,175 @@
+import asyncio
+from typing import Dict, List
+
+from .llm_providers import LLMProvider
+
+
+class HedgedProvider(LLMProvider):
+    """Ordered list of backends with hedging and fallback.
+
+    The first backend is tried first. If it has not produced a first token
+    within `hedge_delay` seconds, the next backend is started in parallel
+    (a hedge). For plain replies the first attempt to finish wins; for
+    streams the first attempt to produce a token wins. The loser is
+    cancelled. When an attempt fails and nothing else is running, the next
+    backend in order is tried (fallback).
+    """
+
+    def __init__(self, backends: List[LLMProvider], hedge_delay=None):
+        if not backends:
+            raise ValueError("HedgedProvider needs at least one backend")
+        super().__init__(backends[0].api_key, backends[0].model)
+        self.backends = backends
+        self.hedge_delay = hedge_delay
+        self.hedges = 0
+        self.fallbacks = 0
+        self.wins: Dict[str, int] = {}
+
+    @property
+    def label(self):
+        return "+".join(backend.label for backend in self.backends)
+
+    def sampling_params(self):
+        return {"backends": [[backend.label, backend.sampling_params()] for backend in self.backends]}
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+    async def awarmup(self):
+        await asyncio.gather(*(backend.awarmup() for backend in self.backends))
+
+    def chat(self, message, history):
+        return self._chat_with_fallback(message, history)
+
+    def stream(self, message, history):
+        # Blocking callers get fallback without hedging
+        yield self._chat_with_fallback(message, history)
+
+    def _chat_with_fallback(self, message, history):
+        error = None
+        for index, backend in enumerate(self.backends):
+            if index:
+                self.fallbacks += 1
+            try:
+                reply = backend.chat(message, history)
+                self._record_win(backend)
+                return reply
+            except Exception as e:
+                error = e
+        raise error
+
+    async def achat(self, message, history):
+        reply, _ = await self.achat_routed(message, history)
+        return reply
+
+    async def astream(self, message, history):
+        async for _, delta in self.astream_routed(message, history):
+            yield delta
+
+    def _record_win(self, backend):
+        self.wins[backend.label] = self.wins.get(backend.label, 0) + 1
+
+    def _hedge_timeout(self, started_at, live, buffers, next_index):
+        """Seconds until a hedge should launch, or None when no hedge applies"""
+        if self.hedge_delay is None or len(live) != 1 or next_index >= len(self.backends):
+            return None
+        (index,) = live
+        if buffers[index]:
+            # The running attempt already produced its first token
+            return None
+        return max(started_at + self.hedge_delay - asyncio.get_running_loop().time(), 0.0)
+
+    async def _pump(self, index, backend, message, history, queue):
+        try:
+            async for delta in backend.astream(message, history):
+                await queue.put(("delta", index, delta))
+            await queue.put(("end", index, None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(("error", index, e))
+
+    async def _run(self, message, history, stop_on_first_token):
+        """Drive attempts until one wins; yields (label, kind, payload) from the winner only"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks: Dict[int, asyncio.Task] = {}
+        buffers: Dict[int, List[str]] = {}
+        live = set()
+        errors = []
+        next_index = 0
+        started_at = loop.time()
+
+        def launch():
+            nonlocal next_index, started_at
+            index = next_index
+            next_index += 1
+            started_at = loop.time()
+            buffers[index] = []
+            live.add(index)
+            tasks[index] = asyncio.create_task(self._pump(index, self.backends[index], message, history, queue))
+
+        launch()
+        try:
+            winner = None
+            while winner is None:
+                timeout = self._hedge_timeout(started_at, live, buffers, next_index)
+                try:
+                    kind, index, payload = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    self.hedges += 1
+                    launch()
+                    continue
+                if index not in live:
+                    continue
+                if kind == "delta":
+                    buffers[index].append(payload)
+                    if stop_on_first_token:
+                        winner = index
+                elif kind == "end":
+                    winner = index
+                else:
+                    live.discard(index)
+                    errors.append(payload)
+                    if not live:
+                        if next_index >= len(self.backends):
+                            raise errors[-1]
+                        self.fallbacks += 1
+                        launch()
+
+            for index in live - {winner}:
+                tasks[index].cancel()
+            live = {winner}
+            backend = self.backends[winner]
+            self._record_win(backend)
+            for delta in buffers[winner]:
+                yield backend.label, "delta", delta
+            while kind != "end":
+                kind, index, payload = await queue.get()
+                if index != winner:
+                    continue
+                if kind == "error":
+                    raise payload
+                if kind == "delta":
+                    yield backend.label, "delta", payload
+            yield backend.label, "end", None
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def achat_routed(self, message, history):
+        parts = []
+        label = None
+        async for label, kind, delta in self._run(message, history, stop_on_first_token=False):
+            if kind == "delta":
+                parts.append(delta)
+        return "".join(parts), label
+
+    async def astream_routed(self, message, history):
+        async for label, kind, delta in self._run(message, history, stop_on_first_token=True):
+            if kind == "delta":
+                yield label, delta
+
+    def stats(self):
+        return {"hedges": self.hedges, "fallbacks": self.fallbacks, "wins": dict(self.wins)}
@@ -1,29 +1,219 @@
+import asyncio
+import hashlib
+import re
+import time
 from abc import ABC, abstractmethod
-from openai import OpenAI
-import google.generativeai as genai
-from anthropic import Anthropic
-from groq import Groq
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+
+# Provider SDKs are imported in each provider's constructor: importing them
+# all up front costs seconds of worker boot time for SDKs a worker may never use.
+
+from .client_pool import client_pool
+from .messages import anthropic_message, gemini_content, openai_message
+
+
+class ProviderError(Exception):
+    """An upstream LLM API call failed"""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RateLimitError(ProviderError):
+    """The provider rejected the call with HTTP 429; retry_after is in seconds when known"""
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_duration(value):
+    """Parse Retry-After style values: seconds, HTTP dates or Go durations like '6m0s'"""
+    value = str(value).strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after(exc):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        delay = _parse_duration(headers["retry-after-ms"])
+        return delay / 1000.0 if delay is not None else None
+    for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens",
+                 "anthropic-ratelimit-requests-reset"):
+        if headers.get(name):
+            delay = _parse_duration(headers[name])
+            if delay is not None:
+                return delay
+    return None
+
+
+def provider_error(provider_name, exc):
+    """Wrap an SDK exception, keeping its HTTP status and any rate-limit hint"""
+    status_code = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    if not isinstance(status_code, int):
+        status_code = None
+    message = f"{provider_name} API error: {str(exc)}"
+    if status_code == 429:
+        return RateLimitError(message, status_code=status_code, retry_after=_retry_after(exc))
+    return ProviderError(message, status_code=status_code)
+
+
+def history_digest(history, digest=""):
+    """Chained digest of messages, so history_digest(more, history_digest(prefix)) == history_digest(prefix + more)"""
+    for msg in history:
+        raw = f"{digest}\x00{msg.get('role')}\x00{msg.get('content')}"
+        digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    return digest
+
+
+# Token usage of the current turn; a mutable dict so hedged attempts running in
+# child tasks (which copy the context) add to the same totals
+_turn_usage = ContextVar("turn_usage", default=None)
+
+
+@contextmanager
+def track_usage():
+    """Collect input/output token counts reported by provider calls made inside the block"""
+    usage = {"input_tokens": 0, "cached_input_tokens": 0, "cache_write_tokens": 0, "output_tokens": 0}
+    token = _turn_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _turn_usage.reset(token)
+
+
+def _record_usage(input_tokens=0, cached_input_tokens=0, cache_write_tokens=0, output_tokens=0):
+    """input_tokens counts the whole prompt, including cache reads and writes"""
+    usage = _turn_usage.get()
+    if usage is None:
+        return
+    usage["input_tokens"] += input_tokens or 0
+    usage["cached_input_tokens"] += cached_input_tokens or 0
+    usage["cache_write_tokens"] += cache_write_tokens or 0
+    usage["output_tokens"] += output_tokens or 0
+
+
+def _record_openai_usage(usage):
+    """Usage from OpenAI-compatible APIs, which cache shared prompt prefixes automatically"""
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    _record_usage(
+        input_tokens=usage.prompt_tokens,
+        cached_input_tokens=getattr(details, "cached_tokens", 0),
+        output_tokens=usage.completion_tokens,
+    )
 
 
 class LLMProvider(ABC):
     """Abstract base class for LLM providers"""
 
+    # Name used to key pooled SDK clients; providers without pooled clients leave it unset
+    pool_name = None
+
     def __init__(self, api_key, model):
         self.api_key = api_key
         self.model = model
+        self._pool_keys = []
+
+    def _pooled_client(self, kind, factory):
+        """Borrow a shared SDK client for this provider's API key"""
+        key = client_pool.key(self.pool_name, self.api_key, kind)
+        self._pool_keys.append(key)
+        return client_pool.acquire(key, factory)
+
+    def close(self):
+        """Return pooled clients; called when the owning session is replaced or evicted"""
+        for key in self._pool_keys:
+            client_pool.release(key)
+        self._pool_keys = []
+
+    async def awarmup(self):
+        """Open a connection to the provider ahead of the first message (best effort)"""
+        return None
+
+    def sampling_params(self):
+        """Sampling parameters sent with every request, used to key cached replies"""
+        return {}
+
+    @property
+    def label(self):
+        """Short provider:model name used to report which backend served a reply"""
+        name = self.pool_name or self.__class__.__name__.replace("Provider", "").lower()
+        return f"{name}:{self.model}"
+
+    async def achat_routed(self, message, history):
+        """Like achat(), but return (reply, label of the backend that produced it)"""
+        return await self.achat(message, history), self.label
+
+    async def astream_routed(self, message, history):
+        """Like astream(), but yield (label, delta) pairs"""
+        async for delta in self.astream(message, history):
+            yield self.label, delta
 
     @abstractmethod
     def chat(self, message, history):
         """Send a chat message and get response"""
         raise NotImplementedError
 
+    def stream(self, message, history):
+        """
+        Send a chat message and yield the response as text deltas
+
+        Providers without native streaming fall back to yielding the full
+        completion as a single delta.
+        """
+        yield self.chat(message, history)
+
+    async def achat(self, message, history):
+        """
+        Async variant of chat()
+
+        Providers without an async client run the blocking call in a worker
+        thread so the event loop is never blocked.
+        """
+        return await asyncio.to_thread(self.chat, message, history)
+
+    async def astream(self, message, history):
+        """Async variant of stream(), yielding text deltas"""
+        yield await self.achat(message, history)
+
 
 class OpenAIProvider(LLMProvider):
     """OpenAI API provider (GPT models)"""
 
+    pool_name = "openai"
+
     def __init__(self, api_key, model):
         super().__init__(api_key, model)
-        self.client = OpenAI(api_key=api_key)
+        from openai import AsyncOpenAI, OpenAI
+
+        self.client = self._pooled_client("sync", lambda: OpenAI(api_key=api_key))
+        self.async_client = self._pooled_client("async", lambda: AsyncOpenAI(api_key=api_key))
+
+    async def awarmup(self):
+        try:
+            await self.async_client.models.list()
+        except Exception:
+            pass
 
     def chat(self, message, history):
         """
@@ -37,38 +227,89 @@ class OpenAIProvider(LLMProvider):
             Assistant's response as string
         """
         try:
-            messages = []
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=self._build_messages(message, history)
+            )
+            _record_openai_usage(response.usage)
 
-            for msg in history:
-                messages.append({
-                    'role': msg['role'],
-                    'content': msg['content']
-                })
+            return response.choices[0].message.content
 
-            messages.append({
-                'role': 'user',
-                'content': message
-            })
+        except Exception as e:
+            raise provider_error("OpenAI", e) from e
 
+    def stream(self, message, history):
+        """Stream a chat completion from OpenAI, yielding content deltas"""
+        try:
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=messages
+                messages=self._build_messages(message, history),
+                stream=True,
+                stream_options={"include_usage": True},
             )
 
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                # The final chunk carries usage and no choices
+                _record_openai_usage(chunk.usage)
+
+        except Exception as e:
+            raise provider_error("OpenAI", e) from e
+
+    async def achat(self, message, history):
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=self._build_messages(message, history)
+            )
+            _record_openai_usage(response.usage)
+
             return response.choices[0].message.content
 
         except Exception as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
+            raise provider_error("OpenAI", e) from e
+
+    async def astream(self, message, history):
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=self._build_messages(message, history),
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                _record_openai_usage(chunk.usage)
+
+        except Exception as e:
+            raise provider_error("OpenAI", e) from e
+
+    def _build_messages(self, message, history):
+        messages = [openai_message(msg) for msg in history]
+        messages.append({
+            'role': 'user',
+            'content': message
+        })
+        return messages
 
 
 class GeminiProvider(LLMProvider):
     """Google Gemini API provider"""
 
+    # Live chat sessions kept per provider (i.e. per conversation), keyed by the
+    # digest of the history they hold
+    max_chat_sessions = 4
+
     def __init__(self, api_key, model):
         super().__init__(api_key, model)
+        import google.generativeai as genai
+
         genai.configure(api_key=api_key)
         self.model_instance = genai.GenerativeModel(model)
-        self.chat_session = None
+        self._chat_sessions = OrderedDict()
 
     def chat(self, message, history):
         """
@@ -82,84 +323,318 @@ class GeminiProvider(LLMProvider):
             Assistant's response as string
         """
         try:
-            if self.chat_session is None or len(history) == 0:
-                gemini_history = []
-                for msg in history:
-                    role = 'user' if msg['role'] == 'user' else 'model'
-                    gemini_history.append({
-                        'role': role,
-                        'parts': [msg['content']]
-                    })
+            chat_session, digest = self._checkout_chat_session(history)
+            response = chat_session.send_message(message)
+            self._record_usage(response)
+            self._checkin_chat_session(chat_session, digest, message, response.text)
+
+            return response.text
+
+        except Exception as e:
+            raise provider_error("Gemini", e) from e
+
+    def stream(self, message, history):
+        """Stream a chat response from Gemini, yielding text deltas"""
+        try:
+            chat_session, digest = self._checkout_chat_session(history)
+            response = chat_session.send_message(message, stream=True)
 
-                self.chat_session = self.model_instance.start_chat(history=gemini_history)
+            parts = []
+            for chunk in response:
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield chunk.text
+            self._record_usage(response)
+            self._checkin_chat_session(chat_session, digest, message, "".join(parts))
 
-            response = self.chat_session.send_message(message)
+        except Exception as e:
+            raise provider_error("Gemini", e) from e
+
+    async def achat(self, message, history):
+        try:
+            chat_session, digest = self._checkout_chat_session(history)
+            response = await chat_session.send_message_async(message)
+            self._record_usage(response)
+            self._checkin_chat_session(chat_session, digest, message, response.text)
 
             return response.text
 
         except Exception as e:
-            raise Exception(f"Gemini API error: {str(e)}")
+            raise provider_error("Gemini", e) from e
+
+    async def astream(self, message, history):
+        try:
+            chat_session, digest = self._checkout_chat_session(history)
+            response = await chat_session.send_message_async(message, stream=True)
+
+            parts = []
+            async for chunk in response:
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield chunk.text
+            self._record_usage(response)
+            self._checkin_chat_session(chat_session, digest, message, "".join(parts))
+
+        except Exception as e:
+            raise provider_error("Gemini", e) from e
+
+    def _checkout_chat_session(self, history):
+        """Take the live chat session holding exactly this history, or start one.
+
+        Sessions are removed while in use, so concurrent calls never share one.
+        """
+        digest = history_digest(history)
+        chat_session = self._chat_sessions.pop(digest, None)
+        if chat_session is None:
+            gemini_history = [gemini_content(msg) for msg in history]
+            chat_session = self.model_instance.start_chat(history=gemini_history)
+        return chat_session, digest
+
+    def _checkin_chat_session(self, chat_session, digest, message, reply):
+        turn = [{"role": "user", "content": message}, {"role": "assistant", "content": reply}]
+        self._chat_sessions[history_digest(turn, digest)] = chat_session
+        while len(self._chat_sessions) > self.max_chat_sessions:
+            self._chat_sessions.popitem(last=False)
+
+    @staticmethod
+    def _record_usage(response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            _record_usage(
+                input_tokens=getattr(usage, "prompt_token_count", 0),
+                cached_input_tokens=getattr(usage, "cached_content_token_count", 0),
+                output_tokens=getattr(usage, "candidates_token_count", 0),
+            )
 
 
 class AnthropicProvider(LLMProvider):
     """Anthropic Claude API provider"""
 
+    pool_name = "anthropic"
+
     def __init__(self, api_key, model):
         super().__init__(api_key, model)
-        self.client = Anthropic(api_key=api_key)
+        from anthropic import Anthropic, AsyncAnthropic
 
-    def chat(self, message, history):
-        try:
-            # Build Anthropic-style history
-            messages = []
-            for msg in history:
-                role = "user" if msg["role"] == "user" else "assistant"
-                messages.append({"role": role, "content": msg["content"]})
+        self.client = self._pooled_client("sync", lambda: Anthropic(api_key=api_key))
+        self.async_client = self._pooled_client("async", lambda: AsyncAnthropic(api_key=api_key))
 
-            messages.append({"role": "user", "content": message})
+    def sampling_params(self):
+        return {"max_tokens": 512}
 
+    async def awarmup(self):
+        try:
+            await self.async_client.models.list(limit=1)
+        except Exception:
+            pass
+
+    def chat(self, message, history):
+        try:
             resp = self.client.messages.create(
                 model=self.model,
                 max_tokens=512,
-                messages=messages,
+                messages=self._build_messages(message, history),
             )
+            self._record_usage(resp.usage)
 
             # Anthropic SDK returns content as a list of blocks
             return resp.content[0].text
 
         except Exception as e:
-            raise Exception(f"Anthropic API error: {str(e)}")
+            raise provider_error("Anthropic", e) from e
+
+    def stream(self, message, history):
+        try:
+            with self.client.messages.stream(
+                model=self.model,
+                max_tokens=512,
+                messages=self._build_messages(message, history),
+            ) as stream:
+                for text in stream.text_stream:
+                    yield text
+                self._record_usage(stream.get_final_message().usage)
+
+        except Exception as e:
+            raise provider_error("Anthropic", e) from e
+
+    async def achat(self, message, history):
+        try:
+            resp = await self.async_client.messages.create(
+                model=self.model,
+                max_tokens=512,
+                messages=self._build_messages(message, history),
+            )
+            self._record_usage(resp.usage)
+
+            return resp.content[0].text
+
+        except Exception as e:
+            raise provider_error("Anthropic", e) from e
+
+    async def astream(self, message, history):
+        try:
+            async with self.async_client.messages.stream(
+                model=self.model,
+                max_tokens=512,
+                messages=self._build_messages(message, history),
+            ) as stream:
+                async for text in stream.text_stream:
+                    yield text
+                self._record_usage((await stream.get_final_message()).usage)
+
+        except Exception as e:
+            raise provider_error("Anthropic", e) from e
+
+    def _build_messages(self, message, history):
+        # Build Anthropic-style history
+        messages = [anthropic_message(msg) for msg in history]
+        messages.append({"role": "user", "content": message})
+
+        # Prompt caching: the breakpoint on the new turn writes the whole prompt
+        # to the cache, and the one on the previous user turn reads the prefix
+        # the last request wrote. Prompts under the model's minimum are not cached.
+        user_turns = [index for index, msg in enumerate(messages) if msg["role"] == "user"]
+        for index in user_turns[-2:]:
+            messages[index]["content"] = [
+                {"type": "text", "text": messages[index]["content"], "cache_control": {"type": "ephemeral"}}
+            ]
+        return messages
+
+    @staticmethod
+    def _record_usage(usage):
+        # input_tokens excludes the cached and cache-written parts of the prompt
+        cached = getattr(usage, "cache_read_input_tokens", 0) or 0
+        written = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        _record_usage(
+            input_tokens=usage.input_tokens + cached + written,
+            cached_input_tokens=cached,
+            cache_write_tokens=written,
+            output_tokens=usage.output_tokens,
+        )
 
 
 class GroqProvider(LLMProvider):
     """Groq API provider (Llama/Mixtral)"""
 
+    pool_name = "groq"
+
     def __init__(self, api_key, model):
         super().__init__(api_key, model)
-        self.client = Groq(api_key=api_key)
+        from groq import AsyncGroq, Groq
+
+        self.client = self._pooled_client("sync", lambda: Groq(api_key=api_key))
+        self.async_client = self._pooled_client("async", lambda: AsyncGroq(api_key=api_key))
+
+    def sampling_params(self):
+        return {"temperature": 0.7, "max_tokens": 512}
+
+    async def awarmup(self):
+        try:
+            await self.async_client.models.list()
+        except Exception:
+            pass
 
     def chat(self, message, history):
         try:
-            messages = []
-            for msg in history:
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
+            resp = self.client.chat.completions.create(
+                model=self._model_name(),
+                messages=self._build_messages(message, history),
+                temperature=0.7,
+                max_tokens=512,
+            )
+            _record_openai_usage(resp.usage)
 
-            messages.append({"role": "user", "content": message})
+            return resp.choices[0].message.content
 
-            # Remove 'groq/' prefix from model name if present
-            model_name = self.model.replace("groq/", "")
+        except Exception as e:
+            raise provider_error("Groq", e) from e
 
+    def stream(self, message, history):
+        try:
             resp = self.client.chat.completions.create(
-                model=model_name,
-                messages=messages,
+                model=self._model_name(),
+                messages=self._build_messages(message, history),
                 temperature=0.7,
                 max_tokens=512,
+                stream=True,
             )
 
+            for chunk in resp:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                # Groq reports usage on the final chunk under x_groq
+                _record_openai_usage(getattr(getattr(chunk, "x_groq", None), "usage", None))
+
+        except Exception as e:
+            raise provider_error("Groq", e) from e
+
+    async def achat(self, message, history):
+        try:
+            resp = await self.async_client.chat.completions.create(
+                model=self._model_name(),
+                messages=self._build_messages(message, history),
+                temperature=0.7,
+                max_tokens=512,
+            )
+            _record_openai_usage(resp.usage)
+
             return resp.choices[0].message.content
 
         except Exception as e:
-            raise Exception(f"Groq API error: {str(e)}")
+            raise provider_error("Groq", e) from e
+
+    async def astream(self, message, history):
+        try:
+            resp = await self.async_client.chat.completions.create(
+                model=self._model_name(),
+                messages=self._build_messages(message, history),
+                temperature=0.7,
+                max_tokens=512,
+                stream=True,
+            )
+
+            async for chunk in resp:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                _record_openai_usage(getattr(getattr(chunk, "x_groq", None), "usage", None))
+
+        except Exception as e:
+            raise provider_error("Groq", e) from e
+
+    def _model_name(self):
+        # Remove 'groq/' prefix from model name if present
+        return self.model.replace("groq/", "")
+
+    def _build_messages(self, message, history):
+        messages = [openai_message(msg) for msg in history]
+        messages.append({"role": "user", "content": message})
+        return messages
+
+
+class UnsupportedProviderError(ValueError):
+    """No provider is registered under the requested name"""
+
+
+_PROVIDER_REGISTRY = {
+    "openai": OpenAIProvider,
+    "gemini": GeminiProvider,
+    "anthropic": AnthropicProvider,
+    "groq": GroqProvider,
+}
+
+
+def register_provider(name, factory):
+    """Register a provider class (or any factory taking api_key, model) under name"""
+    _PROVIDER_REGISTRY[name.lower()] = factory
+
+
+def registered_providers():
+    return sorted(_PROVIDER_REGISTRY)
+
+
+def create_provider(name, api_key, model):
+    """Build the provider registered under name; its SDK is imported on first use"""
+    factory = _PROVIDER_REGISTRY.get(name.lower())
+    if factory is None:
+        raise UnsupportedProviderError(f"Unsupported provider: {name}")
+    return factory(api_key, model)
@@ -0,0 +1,106 @@
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+# Role codes stored per message; the names are shared, so a record holds one small int
+ROLES = ("user", "assistant", "system")
+_ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+_FIELDS = frozenset(("role", "content", "token_count"))
+
+
+class ChatMessage:
+    """Compact chat history message: a role code, the content and its cached token count.
+
+    A dict with "role"/"content" keys costs several times more memory than
+    this record, which matters with tens of thousands of resident sessions.
+    It keeps the dict-style reads (`msg["role"]`, `msg.get("content")`) that
+    providers and the context window use, and `token_count` may be set
+    through `msg["token_count"] = n`.
+    """
+
+    __slots__ = ("_role", "content", "token_count")
+
+    def __init__(self, role: str, content: str, token_count: Optional[int] = None) -> None:
+        self._role = _ROLE_CODES[role]
+        self.content = content
+        self.token_count = token_count
+
+    @property
+    def role(self) -> str:
+        return ROLES[self._role]
+
+    def __getitem__(self, name: str) -> Any:
+        if name == "role":
+            return ROLES[self._role]
+        if name == "content":
+            return self.content
+        if name == "token_count" and self.token_count is not None:
+            return self.token_count
+        raise KeyError(name)
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        if name != "token_count":
+            raise KeyError(name)
+        self.token_count = value
+
+    def __contains__(self, name: str) -> bool:
+        return name in ("role", "content") or (name == "token_count" and self.token_count is not None)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, ChatMessage):
+            return self._role == other._role and self.content == other.content
+        if isinstance(other, dict):
+            return other.get("role") == self.role and other.get("content") == self.content
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ChatMessage(role={self.role!r}, content={self.content!r})"
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"role": ROLES[self._role], "content": self.content}
+
+
+Message = Union[ChatMessage, Dict[str, Any]]
+
+
+def compact_message(message: Message) -> Message:
+    """ChatMessage for a history message; dicts with other roles or extra keys are kept as they are"""
+    if isinstance(message, ChatMessage):
+        return message
+    if message.get("role") not in _ROLE_CODES or not isinstance(message.get("content"), str) or message.keys() - _FIELDS:
+        return message
+    return ChatMessage(message["role"], message["content"], message.get("token_count"))
+
+
+def compact_messages(messages: Iterable[Message]) -> List[Message]:
+    return [compact_message(message) for message in messages]
+
+
+def message_dict(message: Message) -> Dict[str, Any]:
+    """Plain role/content dict of a message, e.g. for JSON encoding"""
+    if isinstance(message, ChatMessage):
+        return message.to_dict()
+    return {"role": message["role"], "content": message["content"]}
+
+
+# ==================== PROVIDER SHAPES ====================
+# Each builds the small per-request wrapper the SDK expects around the stored
+# content string; the content itself is never copied.
+
+def openai_message(message: Message) -> Dict[str, Any]:
+    """OpenAI/Groq chat message"""
+    return {"role": message["role"], "content": message["content"]}
+
+
+def anthropic_message(message: Message) -> Dict[str, Any]:
+    """Anthropic message; any non-user role is sent as the assistant"""
+    return {"role": "user" if message["role"] == "user" else "assistant", "content": message["content"]}
+
+
+def gemini_content(message: Message) -> Dict[str, Any]:
+    """Gemini chat history entry"""
+    return {"role": "user" if message["role"] == "user" else "model", "parts": [message["content"]]}
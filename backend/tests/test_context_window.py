@@ -0,0 +1,43 @@
+import asyncio
+
+from src.app.services import context_window as context_window_module
+from src.app.services.context_window import ContextWindow, count_tokens
+from src.providers.messages import ChatMessage
+
+
+class _Provider:
+    model = "gpt-4"
+    api_key = "sk-test"
+
+    async def achat(self, message, history):
+        return "summary"
+
+
+def test_token_counts_are_cached_on_records_but_not_on_request_dicts():
+    request_message = {"role": "user", "content": "hello there"}
+    count_tokens(request_message)
+    assert request_message == {"role": "user", "content": "hello there"}
+
+    record = ChatMessage("user", "hello there")
+    assert count_tokens(record) == count_tokens(request_message)
+    assert record.token_count is not None
+
+
+def test_summary_call_is_admitted_through_the_scheduler(monkeypatch):
+    submitted = []
+
+    async def submit(user_id, provider, call, weight=1.0):
+        submitted.append(user_id)
+        return await call()
+
+    monkeypatch.setattr(context_window_module.scheduler, "submit", submit)
+    window = ContextWindow(max_tokens=200, reserve_tokens=0, summarize=True)
+    history = []
+    for index in range(20):
+        history += [ChatMessage("user", f"question {index} " * 5), ChatMessage("assistant", f"answer {index} " * 5)]
+    state = {}
+
+    built = asyncio.run(window.build(_Provider(), "next", history, state, user_id="user"))
+    assert submitted == ["user"]
+    assert state["context_summary"]["text"] == "summary"
+    assert built[0]["content"].endswith("summary")
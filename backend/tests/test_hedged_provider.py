@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from src.providers.hedged_provider import HedgedProvider
+from src.providers.llm_providers import LLMProvider, ProviderError
+
+
+class _Backend(LLMProvider):
+    """Streams `deltas` after `delay` seconds, or raises `error`"""
+
+    def __init__(self, model, deltas=("reply",), delay=0.0, error=None):
+        super().__init__("sk-test", model)
+        self.deltas = deltas
+        self.delay = delay
+        self.error = error
+        self.started = False
+        self.cancelled = False
+
+    def chat(self, message, history):
+        if self.error is not None:
+            raise self.error
+        return "".join(self.deltas)
+
+    async def astream(self, message, history):
+        self.started = True
+        try:
+            await asyncio.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            for delta in self.deltas:
+                yield delta
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+def test_hedge_fires_when_the_first_backend_is_slow_and_the_loser_is_cancelled():
+    async def scenario():
+        slow = _Backend("slow", deltas=("slow",), delay=1.0)
+        fast = _Backend("fast", deltas=("fa", "st"))
+        provider = HedgedProvider([slow, fast], hedge_delay=0.05)
+        routed = [pair async for pair in provider.astream_routed("hi", [])]
+        await asyncio.sleep(0)
+        return provider, slow, routed
+
+    provider, slow, routed = asyncio.run(scenario())
+    assert routed == [("_backend:fast", "fa"), ("_backend:fast", "st")]
+    assert provider.hedges == 1
+    assert slow.cancelled
+
+
+def test_no_hedge_once_the_first_token_arrives_in_time():
+    async def scenario():
+        first = _Backend("first", deltas=("a", "b"), delay=0.01)
+        second = _Backend("second")
+        provider = HedgedProvider([first, second], hedge_delay=0.2)
+        reply, label = await provider.achat_routed("hi", [])
+        return provider, second, reply, label
+
+    provider, second, reply, label = asyncio.run(scenario())
+    assert (reply, label) == ("ab", "_backend:first")
+    assert provider.hedges == 0
+    assert not second.started
+
+
+def test_fallback_is_used_when_the_first_backend_fails():
+    async def scenario():
+        provider = HedgedProvider(
+            [_Backend("broken", error=ProviderError("boom", status_code=500)), _Backend("spare", deltas=("ok",))]
+        )
+        return provider, await provider.achat_routed("hi", [])
+
+    provider, (reply, label) = asyncio.run(scenario())
+    assert (reply, label) == ("ok", "_backend:spare")
+    assert provider.fallbacks == 1
+    assert provider.wins == {"_backend:spare": 1}
+
+
+def test_last_error_is_raised_when_every_backend_fails():
+    async def scenario():
+        provider = HedgedProvider(
+            [_Backend("a", error=ProviderError("first")), _Backend("b", error=ProviderError("second"))]
+        )
+        await provider.achat("hi", [])
+
+    with pytest.raises(ProviderError, match="second"):
+        asyncio.run(scenario())
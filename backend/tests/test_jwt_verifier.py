@@ -0,0 +1,62 @@
+import time
+
+import jwt
+import pytest
+
+from src.app.core.jwt_verifier import JWTVerifier, LocalVerificationUnavailable
+
+SECRET = "test-secret-with-enough-length-for-hs256"
+
+
+def _token(secret=SECRET, audience="authenticated", expires_in=3600.0, **claims):
+    payload = {"sub": "user-1", "aud": audience, "exp": time.time() + expires_in, "email": "a@example.com", **claims}
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+def test_hs256_token_is_verified_and_cached():
+    verifier = JWTVerifier(secret=SECRET)
+    token = _token()
+    user = verifier.verify(token)
+    assert user["id"] == "user-1"
+    assert user["email"] == "a@example.com"
+    assert verifier.cached_user(token) == user
+
+
+def test_wrong_secret_is_rejected():
+    with pytest.raises(jwt.InvalidSignatureError):
+        JWTVerifier(secret=SECRET).verify(_token(secret="another-secret-with-enough-length"))
+
+
+def test_expired_token_is_rejected():
+    verifier = JWTVerifier(secret=SECRET)
+    token = _token(expires_in=-10)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        verifier.verify(token)
+    assert verifier.cached_user(token) is None
+
+
+def test_audience_is_checked():
+    with pytest.raises(jwt.InvalidAudienceError):
+        JWTVerifier(secret=SECRET).verify(_token(audience="anon"))
+
+
+def test_without_a_secret_the_remote_check_decides():
+    with pytest.raises(LocalVerificationUnavailable):
+        JWTVerifier().verify(_token())
+
+
+def test_cached_user_expires_with_the_token():
+    verifier = JWTVerifier(secret=SECRET, cache_ttl=300)
+    token = _token()
+    # verify() caches until the token's exp; a near exp shows the TTL is capped by it
+    verifier.remember(token, {"id": "user-1"}, expires_at=time.time() + 0.2)
+    assert verifier.cached_user(token) == {"id": "user-1"}
+    time.sleep(0.3)
+    assert verifier.cached_user(token) is None
+
+
+def test_exp_is_read_from_the_token_when_not_given():
+    verifier = JWTVerifier(secret=SECRET, cache_ttl=300)
+    token = _token(expires_in=-1)
+    verifier.remember(token, {"id": "user-1"})
+    assert verifier.cached_user(token) is None
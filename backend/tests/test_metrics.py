@@ -0,0 +1,43 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.app.core import metrics
+from src.app.core.config import settings
+from src.app.routes import health
+
+
+def _client():
+    app = FastAPI()
+    app.include_router(health.router)
+    return TestClient(app)
+
+
+def test_model_labels_are_bounded(monkeypatch):
+    monkeypatch.setattr(metrics, "_model_labels", set())
+    monkeypatch.setattr(settings, "metrics_max_model_labels", 2)
+    labels = [metrics._split_label(f"openai:model-{index}") for index in range(4)]
+    assert labels == [("openai", "model-0"), ("openai", "model-1"), ("openai", "other"), ("openai", "other")]
+    # Models seen before the cap filled keep their label
+    assert metrics._split_label("openai:model-1") == ("openai", "model-1")
+
+
+def test_metrics_requires_the_configured_token(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "scrape-secret")
+    client = _client()
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert "http_requests_total" in response.text
+
+
+def test_metrics_without_a_token_refuses_remote_clients(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "")
+    assert _client().get("/metrics").status_code == 403
+
+
+def test_usage_report_and_metric_agree_on_uncached_tokens():
+    from src.app.services.prompt_prefix import usage_report
+
+    usage = {"input_tokens": 1000, "cached_input_tokens": 600, "cache_write_tokens": 300, "output_tokens": 50}
+    assert usage_report(usage, 2)["uncached_input_tokens"] == metrics.uncached_input_tokens(usage) == 100
@@ -0,0 +1,27 @@
+from src.app.services.pagination import encode_cursor, keyset_filter, page_result
+
+
+def test_keyset_filter_quotes_timestamps():
+    cursor = encode_cursor("2024-01-02T03:04:05+00:00", "b")
+    assert keyset_filter("created_at", cursor, desc=False) == (
+        'created_at.gt."2024-01-02T03:04:05+00:00",'
+        'and(created_at.eq."2024-01-02T03:04:05+00:00",id.gt."b"),'
+        "created_at.is.null"
+    )
+
+
+def test_null_sort_value_pages_the_null_block_by_id():
+    cursor = encode_cursor(None, "b")
+    # Descending puts NULLs first, so every non-NULL row still follows
+    assert keyset_filter("last_message_at", cursor, desc=True) == (
+        'and(last_message_at.is.null,id.lt."b"),last_message_at.not.is.null'
+    )
+    # Ascending puts NULLs last
+    assert keyset_filter("created_at", cursor, desc=False) == 'and(created_at.is.null,id.gt."b")'
+
+
+def test_page_result_cursor_round_trips_a_null_sort_value():
+    rows = [{"id": "c", "last_message_at": None}, {"id": "b", "last_message_at": None}]
+    page = page_result(rows, 1, "last_message_at", "sessions")
+    assert page["sessions"] == rows[:1]
+    assert keyset_filter("last_message_at", page["next_cursor"], desc=True).startswith("and(last_message_at.is.null")
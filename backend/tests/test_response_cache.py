@@ -0,0 +1,38 @@
+from src.app.services.response_cache import ResponseCache
+
+
+class _Provider:
+    model = "test-model"
+
+    def __init__(self, temperature=0.7):
+        self.temperature = temperature
+
+    def sampling_params(self):
+        return {"temperature": self.temperature}
+
+
+HISTORY = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+
+
+def test_identical_conversations_of_different_users_get_different_keys():
+    provider = _Provider()
+    assert ResponseCache.key("alice", provider, "what next?", HISTORY) != ResponseCache.key(
+        "bob", provider, "what next?", HISTORY
+    )
+
+
+def test_key_ignores_surrounding_whitespace_but_not_sampling_parameters():
+    assert ResponseCache.key("alice", _Provider(), " what next? ", HISTORY) == ResponseCache.key(
+        "alice", _Provider(), "what next?", HISTORY
+    )
+    assert ResponseCache.key("alice", _Provider(0.7), "what next?", HISTORY) != ResponseCache.key(
+        "alice", _Provider(0.2), "what next?", HISTORY
+    )
+
+
+def test_streamed_entry_replays_its_chunks_in_order():
+    cache = ResponseCache()
+    key = ResponseCache.key("alice", _Provider(), "what next?", HISTORY)
+    cache.set(key, ["first ", "second ", "third"])
+    assert cache.get(key) == ("first ", "second ", "third")
+    assert cache.get(ResponseCache.key("bob", _Provider(), "what next?", HISTORY)) is None
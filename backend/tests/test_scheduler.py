@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import pytest
+
+from src.app.services.scheduler import AdmissionScheduler
+from src.providers.llm_providers import RateLimitError
+
+
+class _Provider:
+    api_key = "sk-test"
+
+
+def _rate_limited(retry_after):
+    async def call():
+        raise RateLimitError("slow down", status_code=429, retry_after=retry_after)
+
+    return call
+
+
+def test_retry_after_survives_an_idle_backend_at_full_limit():
+    async def scenario():
+        scheduler = AdmissionScheduler(max_concurrency=1, max_retries=0)
+        provider = _Provider()
+        with pytest.raises(RateLimitError):
+            await scheduler.submit("user", provider, _rate_limited(0.2))
+
+        started = time.monotonic()
+
+        async def call():
+            return time.monotonic() - started
+
+        return await scheduler.submit("user", provider, call)
+
+    assert asyncio.run(scenario()) >= 0.15
+
+
+def test_heavy_user_does_not_starve_a_light_user():
+    async def scenario():
+        scheduler = AdmissionScheduler(max_concurrency=1, max_per_user=1)
+        provider = _Provider()
+        order = []
+
+        async def call(user_id):
+            async def run():
+                order.append(user_id)
+                await asyncio.sleep(0)
+
+            await scheduler.submit(user_id, provider, run)
+
+        heavy = [asyncio.create_task(call("heavy")) for _ in range(10)]
+        await asyncio.sleep(0)
+        light = asyncio.create_task(call("light"))
+        await asyncio.gather(*heavy, light)
+        return order
+
+    order = asyncio.run(scenario())
+    # Queued behind ten heavy calls, the light call is admitted after one of them
+    assert order.index("light") <= 2
+
+
+def test_per_user_cap_leaves_slots_for_other_users():
+    async def scenario():
+        scheduler = AdmissionScheduler(max_concurrency=4, max_per_user=2)
+        provider = _Provider()
+        release = asyncio.Event()
+        running = {"a": 0, "b": 0}
+        peak = {"a": 0, "b": 0}
+
+        async def call(user_id):
+            async def run():
+                running[user_id] += 1
+                peak[user_id] = max(peak[user_id], running[user_id])
+                await release.wait()
+                running[user_id] -= 1
+
+            await scheduler.submit(user_id, provider, run)
+
+        tasks = [asyncio.create_task(call("a")) for _ in range(5)]
+        tasks.append(asyncio.create_task(call("b")))
+        await asyncio.sleep(0.01)
+        admitted = dict(running)
+        release.set()
+        await asyncio.gather(*tasks)
+        return admitted, peak
+
+    admitted, peak = asyncio.run(scenario())
+    assert admitted == {"a": 2, "b": 1}
+    assert peak["a"] == 2
+
+
+def test_rate_limit_halves_the_limit_and_successes_restore_it():
+    async def scenario():
+        scheduler = AdmissionScheduler(max_concurrency=4, max_retries=0)
+        provider = _Provider()
+        backend = scheduler._backend(provider)
+        with pytest.raises(RateLimitError):
+            await scheduler.submit("user", provider, _rate_limited(0))
+        halved = backend.limit
+
+        async def call():
+            return None
+
+        limits = []
+        while backend.limit < backend.max_limit:
+            await scheduler.submit("user", provider, call)
+            limits.append(backend.limit)
+        return halved, limits
+
+    halved, limits = asyncio.run(scenario())
+    assert halved == 2.0
+    assert limits == sorted(limits)
+    assert limits[-1] == 4.0
+    assert len(limits) < 10
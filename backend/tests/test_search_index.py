@@ -0,0 +1,77 @@
+import asyncio
+
+from src.app.services.search_index import SearchIndex
+from src.app.services.session_store import InMemorySessionStore
+
+
+class _Provider:
+    def close(self):
+        pass
+
+
+CONFIG = {"provider": "stub", "api_key": "sk-test", "model": "test-model"}
+
+
+def _turn(question):
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": "ok"}]
+
+
+def _sessions(result):
+    return [hit["session_id"] for hit in result["results"]]
+
+
+def test_trimming_one_copy_keeps_a_repeated_message_searchable():
+    async def scenario():
+        index = SearchIndex()
+        # Room for about two turns, so the third append trims the first
+        store = InMemorySessionStore(
+            max_history_bytes=80, provider_factory=lambda config: _Provider(), search_index=index
+        )
+        await store.create_or_update("user", "session", _Provider(), CONFIG)
+        await index.sync("user", store.user_histories, None)
+
+        question = "how do I restart a kubernetes deployment"
+        await store.append_messages("user", "session", _turn(question))
+        await store.append_messages("user", "session", _turn(question))
+        await store.append_messages("user", "session", _turn("and roll it back"))
+
+        session = await store.get("user", "session")
+        assert session["history_offset"] == 2
+        assert [message["content"] for message in session["chat_history"]].count(question) == 1
+        assert _sessions(index.search("user", "kubernetes")) == ["session"]
+
+        # A sync reconciles against the store without changing the result
+        index._users["user"].synced_at = 0.0
+        await index.sync("user", store.user_histories, None)
+        assert _sessions(index.search("user", "kubernetes")) == ["session"]
+
+        await store.clear_history("user", "session")
+        assert index.search("user", "kubernetes")["total"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_saved_messages_past_the_sync_batch_are_indexed_in_the_background():
+    async def scenario():
+        index = SearchIndex(sync_batch=2)
+        release = asyncio.Event()
+
+        async def no_live(user_id):
+            return []
+
+        async def saved(user_id, cursor):
+            for number in range(5):
+                if number == 2:
+                    # Rows past the first batch arrive only after the search returned
+                    await release.wait()
+                yield f"session-{number}", "user", "kubernetes question", None, str(number)
+
+        await index.sync("user", no_live, saved)
+        first = index.search("user", "kubernetes")
+        release.set()
+        await index._users["user"].backfill
+        return first, index.search("user", "kubernetes")
+
+    first, done = asyncio.run(scenario())
+    assert (first["total"], first["indexing"]) == (2, True)
+    assert (done["total"], done["indexing"]) == (5, False)
@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+from src.app.services.session_journal import SessionJournal
+from src.app.services.session_store import InMemorySessionStore
+
+
+class _Provider:
+    def close(self):
+        pass
+
+
+CONFIG = {"provider": "stub", "api_key": "sk-test", "model": "test-model"}
+
+
+def _store(directory):
+    # Long flush interval: the test drives every write itself
+    journal = SessionJournal(str(directory), flush_interval=3600, fsync=False)
+    return InMemorySessionStore(journal=journal, provider_factory=lambda config: _Provider())
+
+
+def _contents(session):
+    return [message["content"] for message in session["chat_history"]]
+
+
+def test_append_during_snapshot_is_replayed_once(tmp_path):
+    async def scenario():
+        store = _store(tmp_path)
+        await store.start()
+        await store.create_or_update("user", "session", _Provider(), CONFIG)
+        await store.append_messages("user", "session", [{"role": "user", "content": "m1"}])
+
+        # A slow disk keeps the snapshot inside its write while another request appends
+        journal = store.journal
+        write = journal._write
+
+        def slow_write(file, data):
+            time.sleep(0.2)
+            write(file, data)
+
+        journal._write = slow_write
+        snapshot = asyncio.create_task(journal.snapshot())
+        await asyncio.sleep(0.05)
+        await store.append_messages("user", "session", [{"role": "assistant", "content": "m2"}])
+        await snapshot
+        await journal.flush()
+        live = _contents(await store.get("user", "session"))
+
+        # Restart without a clean shutdown, so replay reads the snapshot plus the journal
+        restored = _store(tmp_path)
+        await restored.start()
+        replayed = _contents(restored.sessions["user:session"])
+        await restored.close()
+        journal._task.cancel()
+        return live, replayed
+
+    live, replayed = asyncio.run(scenario())
+    assert live == ["m1", "m2"]
+    assert replayed == live
+
+
+def test_restart_restores_history_without_plaintext_keys(tmp_path):
+    async def scenario():
+        store = _store(tmp_path)
+        await store.start()
+        await store.create_or_update("user", "session", _Provider(), CONFIG, persist=False)
+        await store.append_messages(
+            "user", "session", [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+        )
+        await store.clear_history("user", "session")
+        await store.append_messages("user", "session", [{"role": "user", "content": "again"}])
+        await store.close()
+
+        restored = _store(tmp_path)
+        await restored.start()
+        session = restored.sessions["user:session"]
+        await restored.close()
+        return session
+
+    session = asyncio.run(scenario())
+    assert _contents(session) == ["again"]
+    assert session["history_offset"] == 2
+    assert "api_key" not in session["config"]
+    for path in tmp_path.iterdir():
+        assert b"sk-test" not in path.read_bytes()
+
+
+def test_stop_waits_for_an_in_flight_flush(tmp_path):
+    async def scenario():
+        journal = SessionJournal(str(tmp_path), flush_interval=0.01, fsync=False)
+        store = InMemorySessionStore(journal=journal, provider_factory=lambda config: _Provider())
+        await store.start()
+        await store.create_or_update("user", "session", _Provider(), CONFIG)
+
+        write = journal._write
+        writing = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        errors = []
+
+        def slow_write(file, data):
+            loop.call_soon_threadsafe(writing.set)
+            time.sleep(0.2)
+            try:
+                write(file, data)
+            except ValueError as exc:
+                errors.append(exc)
+
+        journal._write = slow_write
+        await store.append_messages("user", "session", [{"role": "user", "content": "m1"}])
+        await writing.wait()
+        await store.close()
+
+        restored = _store(tmp_path)
+        await restored.start()
+        replayed = _contents(restored.sessions["user:session"])
+        await restored.close()
+        return errors, replayed
+
+    errors, replayed = asyncio.run(scenario())
+    # The flush finished before shutdown closed its segment
+    assert errors == []
+    assert replayed == ["m1"]
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+from src.app.core.streaming import coalesce_deltas
+
+
+def test_first_delta_is_sent_immediately_and_later_deltas_are_merged():
+    async def scenario():
+        async def upstream():
+            yield {"chunk": "a"}
+            await asyncio.sleep(0.3)
+            for delta in ("b", "c", "d"):
+                yield {"chunk": delta}
+            yield {"done": True}
+
+        stream = coalesce_deltas(upstream(), max_bytes=1024, flush_interval=10.0, max_buffer=1 << 20)
+        started = time.monotonic()
+        first = await stream.__anext__()
+        first_after = time.monotonic() - started
+        rest = [event async for event in stream]
+        return first, first_after, rest
+
+    first, first_after, rest = asyncio.run(scenario())
+    assert first == {"chunk": "a"}
+    assert first_after < 0.2
+    # The done event releases the open chunk without waiting for flush_interval
+    assert rest == [{"chunk": "bcd"}, {"done": True}]
+
+
+def test_reading_pauses_once_max_buffer_bytes_are_waiting():
+    async def scenario():
+        produced = 0
+
+        async def upstream():
+            nonlocal produced
+            while True:
+                produced += 1
+                yield {"chunk": "x" * 5}
+                await asyncio.sleep(0)
+
+        stream = coalesce_deltas(upstream(), max_bytes=1024, flush_interval=10.0, max_buffer=10)
+        await stream.__anext__()
+        # A slow client: nothing is read while upstream keeps producing
+        await asyncio.sleep(0.05)
+        held = produced
+        await stream.aclose()
+        return held
+
+    assert asyncio.run(scenario()) <= 5
+
+
+def test_upstream_reader_is_cancelled_when_the_client_disconnects():
+    async def scenario():
+        cancelled = asyncio.Event()
+
+        async def upstream():
+            try:
+                while True:
+                    yield {"chunk": "x"}
+                    await asyncio.sleep(0.01)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        stream = coalesce_deltas(upstream(), max_bytes=1024, flush_interval=0.01, max_buffer=1 << 20)
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.wait_for(cancelled.wait(), 1.0)
+        return cancelled.is_set()
+
+    assert asyncio.run(scenario())